@@ -17,17 +17,21 @@ import sys
 sys.path.append(os.path.join(os.path.dirname(__file__), 'src'))
 from html_loader import obtener_lista_html, cargar_html, obtener_nombres_amigables
 # Importar funciones de la carpeta src
-from data_loader_cambios import (cargar_cambios,cargar_significancia,obtener_vmin_vmax)
-from graficos_cambios import generar_mapa_multimodelo
-from data_loader_series import cargar_series_modelos, obtener_serie_departamento
+from data_loader_series import cargar_serie_departamento
 from graficos_series import crear_grafico_series
 from estadisticas_series import calcular_estadisticas_periodos
 from mapa_interactivo import crear_mapa_departamentos
+from aux_geometria import obtener_departamentos
 
 # Importar funciones para el botón PROMEDIO
-from graficos_promedio import generar_mapa_promedio
 from data_loader_promedio import cargar_cambios_ensemble
 
+# Caché de figuras renderizadas (CAMBIOS y PROMEDIO)
+import plotly.io as pio
+from aux_cache_figuras import figura_cambios_png, figura_promedio_json
+from aux_significancia import UMBRALES
+from aux_cache_datos import estadisticas_cache
+
 # Importar funciones auxiliares del dashboard
 from dashboard_utils import (
     obtener_lista_modelos,
@@ -168,8 +172,13 @@ def main():
         
         sel_year_ssp = valores_reales[indice_seleccionado]
         #####################################################
-        # 5. Checkbox de significancia
-        activar_sig = st.checkbox("Significancia: [ p < 0.05 ]")
+        # 5. Umbral de significancia (listas de puntos precalculadas: cambiarlo no recalcula nada)
+        umbral_sig = st.selectbox(
+            "Significancia",
+            [None] + list(UMBRALES),
+            format_func=lambda u: "Sin significancia" if u is None else f"Significancia: [ p < {u:g} ]",
+            label_visibility="collapsed"
+        )
 
         # BOTÓN CAMBIOS
         ejecutar_cambios = st.button("CAMBIOS", type="primary")
@@ -194,9 +203,7 @@ def main():
         # Si se activa series temporales, mostrar lista de departamentos
         if st.session_state.get('mostrar_series', False):
             try:
-                import geopandas as gpd
-                gdf = gpd.read_file(geo_file)
-                departamentos = sorted(gdf['DEPARTAMEN'].tolist())
+                departamentos = obtener_departamentos(geo_file)
                 
                 depto_seleccionado = st.selectbox(
                     "Seleccione departamento:",
@@ -239,6 +246,8 @@ def main():
             # EXTRAER EL AÑO CENTRO DEL SELECTOR EXISTENTE
             if '_' in sel_year_ssp: centro_year = sel_year_ssp.split('_')[0]
             else: centro_year = "2050"
+            # PROMEDIO siempre muestra puntos: p < 0.05 si no se eligió umbral
+            umbral_promedio = umbral_sig or 0.05
                 
         except ValueError as e:
             st.error(f"Error en formato: {e}")
@@ -246,12 +255,14 @@ def main():
         
         with st.spinner("Generando gráfico de promedio..."):
             try:
-                fig = generar_mapa_promedio(
+                # Figura desde la caché de figuras (se genera solo si cambió algo)
+                fig = pio.from_json(figura_promedio_json(
                     variable=var,
                     agregacion=agregacion,
                     periodo_base=sel_base,
-                    centro_year=centro_year
-                )
+                    centro_year=centro_year,
+                    umbral=umbral_promedio
+                ))
                 
                 st.plotly_chart(fig, use_container_width=True)                
                 col1, col2, col3, col4 = st.columns(4)
@@ -268,7 +279,7 @@ def main():
                     *Nota:*
                     - Los cambios se calculan como promedio de todos los modelos disponibles.
                     - Modelos: {modelos}
-                    - Los puntos negros indican significancia estadística (p < 0.05)
+                    - Los puntos negros indican significancia estadística (p < {umbral_promedio:g})
                     - La barra de color es compartida para SSP245 y SSP585
                     """)
                     
@@ -294,27 +305,18 @@ def main():
         
         with st.spinner("Generando mapa de cambios..."):
             try:
-                dict_cambios = cargar_cambios(sel_mod, var, agregacion, ssp, sel_base, centro)
-                dict_pvals = None
-
-                if activar_sig:
-                    dict_pvals = cargar_significancia(sel_mod, var, agregacion, ssp, sel_base, centro)
-
-                vmin_global, vmax_global = obtener_vmin_vmax(var)
-
-                fig = generar_mapa_multimodelo(
-                    dict_cambios,
-                    dict_pvals,
-                    vmin_global,
-                    vmax_global,
+                # PNG desde la caché de figuras (se renderiza solo si cambió algo)
+                png = figura_cambios_png(
+                    sel_mod,
                     var,
-                    agregacion=agregacion,
-                    sel_base=sel_base,
-                    ssp=ssp,
-                    centro=centro
+                    agregacion,
+                    ssp,
+                    sel_base,
+                    centro,
+                    significancia=umbral_sig
                 )
 
-                st.pyplot(fig)
+                st.image(png, use_column_width=True)
                 
                 #col1, col2, col3, col4 = st.columns(4)
                 col1, col2, col3, col4, col5 = st.columns([2, 3, 3, 3, 3])
@@ -342,24 +344,15 @@ def main():
                 return
             
             # Cargar series usando el escenario extraído de sel_year_ssp
-            cache_key = f"{sel_mod}_{var}_{agregacion}_{ssp}"
-            
-            if ('series_dict' not in st.session_state or 
-                st.session_state.get('cache_key', '') != cache_key):
-                
-                with st.spinner("Cargando datos de series..."):
-                    series_dict = cargar_series_modelos(sel_mod, var, agregacion, ssp)
-                    st.session_state.series_dict = series_dict
-                    st.session_state.cache_key = cache_key
-                    st.session_state.ultima_var = var
-                    st.session_state.ultima_agregacion = agregacion
+            # (caché compartida del proceso, ver aux_cache_datos.py)
+            # (solo se lee el departamento seleccionado del almacén Parquet)
+            with st.spinner("Cargando datos de series..."):
+                df_series = cargar_serie_departamento(
+                    sel_mod, var, agregacion, ssp, depto_seleccionado)
             
             # Generar gráfico de series
             with st.spinner("Generando series temporales..."):
                 try:
-                    df_series = obtener_serie_departamento(
-                        st.session_state.series_dict, 
-                        depto_seleccionado)
                     
                     if df_series is not None:
                         fig_series = crear_grafico_series(
@@ -581,21 +574,29 @@ def main():
             4. Los archivos HTML son no-oficiales
             """)
 
+def mostrar_estadisticas_cache():
+    """
+    Contadores de la caché de datos del proceso (aux_cache_datos): una línea
+    en el log del servidor por cada ejecución y un desplegable en la barra
+    lateral.
+    """
+    e = estadisticas_cache()
+    resumen = (f"{e['aciertos']} aciertos, {e['fallos']} fallos "
+               f"({e['tasa_aciertos']:.0%}), {e['expulsiones']} expulsiones, "
+               f"{e['entradas']} entradas, {e['memoria_mb']:.0f}/{e['memoria_max_mb']:.0f} MB")
+    print(f"  -> Caché de datos: {resumen}")
+    with st.sidebar:
+        with st.expander("Caché de datos"):
+            st.caption(resumen)
+
 if __name__ == "__main__":
     # Inicializar estados de sesión
     if 'mostrar_series' not in st.session_state:
         st.session_state.mostrar_series = False
-    if 'series_dict' not in st.session_state:
-        st.session_state.series_dict = None
-    if 'cache_key' not in st.session_state:
-        st.session_state.cache_key = ""
-    if 'ultima_var' not in st.session_state:
-        st.session_state.ultima_var = ""
-    if 'ultima_agregacion' not in st.session_state:
-        st.session_state.ultima_agregacion = ""
 
     if 'vista' not in st.session_state:
         st.session_state.vista = "inicio"
     
     # Ejecutar dashboard
-    main()
\ No newline at end of file
+    main()
+    mostrar_estadisticas_cache()
\ No newline at end of file
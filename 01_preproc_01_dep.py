@@ -1,18 +1,35 @@
 import os
+import sys
 import geopandas as gpd
-import xarray as xr
-import pandas as pd
 import numpy as np
 import rioxarray
-from shapely.geometry import mapping
+
+# Añadir carpeta src al path
+sys.path.append(os.path.join(os.path.dirname(__file__), "src"))
+from aux_mascaras_depa import construir_indice_departamentos, promedios_departamentos
+from aux_paralelo import crear_parser, ejecutar_combinaciones
+from aux_perfilado import configurar_perfilado, medir_etapa
+from aux_perezoso import abrir_dataset, configurar_perezoso
+from aux_cache_entradas import configurar_cache_entradas, purgar_cache_entradas
+from aux_manifiesto import (agregar_argumento_forzar, cargar_manifiesto, guardar_manifiesto,
+                            dependencia, version_codigo, planificar, registrar)
+from aux_regrid import regrid
+from aux_catalogo import actualizar_catalogo
+from aux_almacen_series import SERIES_DIR, guardar_serie, ruta_serie
 
 # --- CONFIGURACIÓN ACTUALIZADA ---
 BASE_DIR = "data"
 MOD_DIR = os.path.join(BASE_DIR, "modelos_agre")  # Nueva ruta
-OUT_DIR = os.path.join(BASE_DIR, "procesados")
+OUT_DIR = SERIES_DIR                               # Almacén Parquet de series
 GEO_FILE = os.path.join(BASE_DIR, "geo", "peru32.geojson") # GEOJSON FILE
 os.makedirs(OUT_DIR, exist_ok=True)
 resolucion = 0.5
+# Ponderación de las máscaras departamentales
+MASCARA_FRACCIONAL = False  # fracción de área de cada celda dentro del polígono
+MASCARA_COSLAT = False      # peso cos(lat) por celda
+# Regrillado a la grilla de `resolucion`: 'bilineal' (= ds.interp) o 'conservativo'.
+# Los pesos se calculan una vez por par de grillas (caché en data/cache/regrid/)
+METODO_REGRID = "bilineal"
 
 # Cargar y asegurar CRS
 gdf = gpd.read_file(GEO_FILE)
@@ -49,6 +66,7 @@ def extraer_dimensiones_archivo(nombre_archivo):
         }
     return None
 
+@medir_etapa()
 def procesar_archivo_nc(nc_path, mod_name, var_name, reso=0.1):
     """
     Procesa un archivo netCDF individual.
@@ -60,8 +78,8 @@ def procesar_archivo_nc(nc_path, mod_name, var_name, reso=0.1):
     print(f"  -> Modelo: {mod_name} | Variable: {var_name}")
     
     try:
-        # Cargar netcdf
-        ds = xr.open_dataset(nc_path)
+        # Cargar netcdf (con --lazy: bloques de tiempo con la grilla completa)
+        ds = abrir_dataset(nc_path, enteras=('lat', 'lon'))
         
         # Comprobar si la variable existe (ahora coincide con nombre del archivo)
         if var_name not in ds.data_vars:
@@ -78,12 +96,11 @@ def procesar_archivo_nc(nc_path, mod_name, var_name, reso=0.1):
                 return None
             var_name = var_encontrada
         
-        # Interpolar
-        ds_interp = ds.interp(lon=np.arange(-82, 1+reso, reso), 
-                             lat=np.arange(-19, 1+reso, reso))
-        
-        # Seleccionar la DataArray
-        da = ds_interp[var_name]
+        # Regrillar con pesos precalculados (un producto disperso para todos los pasos)
+        da = regrid(ds[var_name],
+                    lat=np.arange(-19, 1+reso, reso),
+                    lon=np.arange(-82, 1+reso, reso),
+                    metodo=METODO_REGRID)
         
         # Configurar CRS para rioxarray
         da = da.rio.write_crs("EPSG:4326", inplace=False)
@@ -94,66 +111,49 @@ def procesar_archivo_nc(nc_path, mod_name, var_name, reso=0.1):
         print(f"  -> Error al procesar {nc_path}: {e}")
         return None
 
+@medir_etapa()
 def iter_depa(gdf, da):
     """
-    Itera por departamentos y calcula media espacial.
+    Calcula la media espacial de todos los departamentos.
+    Las máscaras se rasterizan una sola vez por grilla (índice en caché) y
+    los promedios salen de un único producto matricial por archivo.
     """
-    df_list = []
-    
-    for _, row in gdf.iterrows():
-        geom = mapping(row.geometry)
-        recorte = da.rio.clip([geom])
-        
-        if recorte.size > 0:
-            serie = recorte.mean(dim=["lat", "lon"]).to_series()
-            serie.name = row["DEPARTAMEN"]
-            df_list.append(serie)
-        else:
-            print(f"  -> Advertencia: Sin datos para {row['DEPARTAMEN']}")
+    indice = construir_indice_departamentos(
+        GEO_FILE, da.lat.values, da.lon.values,
+        fraccional=MASCARA_FRACCIONAL,
+        pesos_coslat=MASCARA_COSLAT,
+        gdf=gdf)
     
-    if not df_list:
+    if not indice['departamentos']:
         return None
     
-    return pd.concat(df_list, axis=1)
+    return promedios_departamentos(da, indice)
 
-# --- BUCLE PRINCIPAL ACTUALIZADO ---
-
-print(f"Buscando archivos en: {MOD_DIR}")
-
-# Obtener todos los archivos netCDF
-archivos_nc = [f for f in os.listdir(MOD_DIR) if f.endswith('.nc')]
-
-if not archivos_nc:
-    print("No se encontraron archivos .nc en la ruta especificada")
-    exit()
+def ruta_salida(dims):
+    """
+    Ruta del Parquet de salida dentro del almacén de series.
+    """
+    return ruta_serie(dims['modelo'], dims['variable'], dims['agregacion'],
+                      dims['ssp'], OUT_DIR)
 
-print(f"Se encontraron {len(archivos_nc)} archivos para procesar")
 
-for archivo_nc in sorted(archivos_nc):
-    # Extraer dimensiones del nombre del archivo
+def procesar_archivo(archivo_nc):
+    """
+    Procesa un archivo de modelo completo: interpolación, promedios
+    departamentales y guardado en el almacén Parquet. Devuelve True si se guardó.
+    """
     dims = extraer_dimensiones_archivo(archivo_nc)
     
-    if dims is None:
-        print(f"  -> Saltando archivo con formato no válido: {archivo_nc}")
-        continue
-    
     # Desempaquetar dimensiones
     var = dims['variable']          # tasmin, tasmax, pr
     agregacion = dims['agregacion']  # ANUAL, DEF, MAM, etc.
     modelo = dims['modelo']         # ecmwf-51, ncep-2, etc.
     ssp = dims['ssp']               # ssp245, ssp585
     
-    # Definir ruta de entrada
+    # Definir rutas de entrada y salida
     nc_path = os.path.join(MOD_DIR, archivo_nc)
-    
-    # Definir nombre de salida (incluye todas las dimensiones)
-    out_name = f"{modelo}_{var}_{agregacion}_{ssp}.csv"
-    out_path = os.path.join(OUT_DIR, out_name)
-    
-    # Verificar si ya existe
-    if os.path.exists(out_path):
-        #print(f"  -> Saltando: {out_name} ya existe")
-        continue
+    out_path = ruta_salida(dims)
+    out_name = os.path.relpath(out_path, OUT_DIR)
     
     print(f"\nProcesando: {modelo} | {var} | {agregacion} | {ssp}")
     
@@ -163,18 +163,99 @@ for archivo_nc in sorted(archivos_nc):
         
         if d1 is None:
             print(f"  -> Saltando {archivo_nc} debido a error en procesamiento")
-            continue
+            return False
         
         # Iterar por departamentos
         df_final = iter_depa(gdf1, d1)
         
         if df_final is not None:
-            df_final.to_csv(out_path)
+            guardar_serie(df_final, modelo, var, agregacion, ssp, OUT_DIR)
             print(f"  -> Guardado: {out_name}")
+            return True
         else:
             print(f"  -> Advertencia: No se generaron datos para {out_name}")
+            return False
             
     except Exception as e:
         print(f"  -> Error procesando {archivo_nc}: {e}")
+        return False
+
+
+# --- BUCLE PRINCIPAL ACTUALIZADO ---
+
+def planificar_series(manifiesto, archivos_nc, forzar=False):
+    """
+    Series faltantes o desactualizadas según el manifiesto.
+    
+    Returns:
+        (plan para registrar(), lista de argumentos de procesar_archivo)
+    """
+    # Cada serie depende de su archivo de modelo, del geojson, de la
+    # configuración de grilla/máscaras y del código que la calcula
+    codigo = version_codigo('aux_regrid', 'aux_mascaras_depa', 'aux_almacen_series')
+    parametros = {
+        'resolucion': resolucion,
+        'metodo_regrid': METODO_REGRID,
+        'mascara_fraccional': MASCARA_FRACCIONAL,
+        'mascara_coslat': MASCARA_COSLAT,
+    }
+    salidas = {}
+    archivo_de = {}
+    for archivo_nc in sorted(archivos_nc):
+        # Extraer dimensiones del nombre del archivo
+        dims = extraer_dimensiones_archivo(archivo_nc)
+        
+        if dims is None:
+            print(f"  -> Saltando archivo con formato no válido: {archivo_nc}")
+            continue
+        
+        out_path = ruta_salida(dims)
+        salidas[out_path] = dependencia([os.path.join(MOD_DIR, archivo_nc), GEO_FILE],
+                                        parametros, codigo)
+        archivo_de[out_path] = archivo_nc
+    
+    # Solo las series faltantes o con dependencias cambiadas
+    plan = planificar(manifiesto, salidas, forzar)
+    return plan, [(archivo_de[out_path],) for out_path in plan]
+
+
+def main():
+    parser = crear_parser("Series por departamento para cada archivo de modelo", perezoso=True,
+                          cache_entradas=True)
+    agregar_argumento_forzar(parser)
+    args = parser.parse_args()
+    configurar_perfilado(args)
+    configurar_perezoso(args)
+    configurar_cache_entradas(args)
+    
+    print(f"Buscando archivos en: {MOD_DIR}")
+    
+    # Obtener todos los archivos netCDF
+    archivos_nc = [f for f in os.listdir(MOD_DIR) if f.endswith('.nc')]
+    
+    if not archivos_nc:
+        print("No se encontraron archivos .nc en la ruta especificada")
+        return
+    
+    print(f"Se encontraron {len(archivos_nc)} archivos para procesar")
+    
+    manifiesto = cargar_manifiesto()
+    plan, pendientes = planificar_series(manifiesto, archivos_nc, args.forzar)
+    
+    ejecutar_combinaciones(procesar_archivo, pendientes, args.workers,
+                           titulo="Series por departamento")
+    
+    registrar(manifiesto, plan)
+    guardar_manifiesto(manifiesto)
+    
+    # Copias decodificadas de archivos de modelo que ya no existen o cambiaron
+    purgar_cache_entradas([os.path.join(MOD_DIR, a) for a in archivos_nc])
+    
+    # Registrar las salidas en el catálogo del dashboard
+    actualizar_catalogo(BASE_DIR)
+    
+    print("\n¡Procesamiento completado!")
+
 
-print("\n¡Procesamiento completado!")
+if __name__ == "__main__":
+    main()
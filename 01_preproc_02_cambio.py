@@ -5,13 +5,12 @@
 Nueva estructura:
 - Detecta automáticamente modelos, variables, agregaciones y escenarios
 - Procesa cada combinación: (modelo, variable, agregación, escenario)
-- Calcula cambios futuros vs. periodo de referencia
+- Calcula cambios futuros vs. cada periodo de referencia (una lectura por archivo)
 - Calcula significancia estadística
 - Guarda salidas por cada combinación y año centro
 """
 import os
 import sys
-import numpy as np
 import xarray as xr
 
 # Añadir carpeta src al path
@@ -19,10 +18,19 @@ sys.path.append(os.path.join(os.path.dirname(__file__), "src"))
 
 # Años centro para ventanas futuras
 CENTER_YEARS = [2030, 2035, 2040, 2045, 2050]
-REF_LABEL   = "1981-2010" #"1991-2020"  # "1981-2010"
 
 # Importamos las funciones necesarias del módulo actualizado
-from aux_cambios_significancia import (seleccionar_periodo,calcular_delta,calcular_pvals)
+from aux_cambios_significancia import (calcular_momentos_acumulados, estadisticas_ventana,
+                                       calcular_cambio_ventanas)
+from aux_paralelo import crear_parser, ejecutar_combinaciones, guardar_atomico
+from aux_almacen import consolidar_almacen
+from aux_significancia import EXTENSION as EXT_SIGNIF, guardar_significancia
+from aux_perfilado import configurar_perfilado, medir_etapa
+from aux_perezoso import abrir_dataset, configurar_perezoso, materializar
+from aux_cache_entradas import configurar_cache_entradas
+from aux_manifiesto import (agregar_argumento_forzar, cargar_manifiesto, guardar_manifiesto,
+                            dependencia, version_codigo, planificar, registrar)
+from aux_catalogo import actualizar_catalogo
 # ============================================================
 # CONFIGURACIÓN (ahora dinámica)
 # ============================================================
@@ -30,12 +38,13 @@ BASE_DIR      = "data"
 MOD_DIR       = os.path.join(BASE_DIR, "modelos_agre")  # Nueva ruta
 OUT_CAMBIOS   = os.path.join(BASE_DIR, "mod_cambios")
 OUT_SIGNIF    = os.path.join(BASE_DIR, "mod_significancia")
+OUT_ALMACEN   = os.path.join(BASE_DIR, "mod_almacen")  # almacén consolidado por variable
 os.makedirs(OUT_CAMBIOS, exist_ok=True)
 os.makedirs(OUT_SIGNIF, exist_ok=True)
-# Periodos base fijos
+# Periodos base fijos (los que ofrece el dashboard)
 REF_PERIODS = {"1981-2010": (1981, 2010),"1991-2020": (1991, 2020)}
-# Selección actual de referencia
-REF_START, REF_END = REF_PERIODS[REF_LABEL]
+# Periodos base a calcular: todos, en la misma pasada por archivo
+REF_LABELS = list(REF_PERIODS)
 # Longitud de ventana futura: 30 años
 FUT_WINDOW = 30  # años
 
@@ -61,6 +70,7 @@ def extraer_dimensiones_archivo(nombre_archivo):
     return None
 
 
+@medir_etapa()
 def cargar_combinacion(ruta_base, modelo, variable, agregacion, ssp):
     """
     Carga un archivo específico según la combinación de dimensiones.
@@ -92,8 +102,8 @@ def cargar_combinacion(ruta_base, modelo, variable, agregacion, ssp):
     
     try:
         
-        # Cargar dataset
-        ds = xr.open_dataset(ruta_encontrada)
+        # Cargar dataset (con --lazy: bloques espaciales con la serie completa)
+        ds = abrir_dataset(ruta_encontrada, enteras=('time',))
         #ds = ds0.interp(lon=np.arange(-82, 1+reso, reso), 
         #                lat=np.arange(-19, 1+reso, reso))
         # Buscar la variable (puede tener diferentes nombres)
@@ -128,110 +138,180 @@ def cargar_combinacion(ruta_base, modelo, variable, agregacion, ssp):
 # FUNCIÓN PRINCIPAL ACTUALIZADA
 # ============================================================
 
-def procesar_combinacion(modelo, variable, agregacion, ssp):
+def rutas_salida(modelo, variable, agregacion, ssp, referencia, cy):
     """
-    Procesa una combinación específica de dimensiones.
+    Rutas del NetCDF de cambios y del de significancia de un periodo base y
+    año centro.
     """
+    nombre = f"{modelo}_{variable}_{agregacion}_{ssp}_{referencia}_centro-{cy}"
+    return (os.path.join(OUT_CAMBIOS, f"{nombre}.nc"),
+            os.path.join(OUT_SIGNIF, f"{nombre}{EXT_SIGNIF}"))
 
-    # VERIFICAR SI TODOS LOS ARCHIVOS PARA ESTA COMBINACIÓN YA EXISTEN
-    archivos_existen = True
-    for cy in CENTER_YEARS:
-        out_nc = os.path.join(
-            OUT_CAMBIOS,
-            f"{modelo}_{variable}_{agregacion}_{ssp}_{REF_LABEL}_centro-{cy}.nc")
-        out_npy = os.path.join(
-            OUT_SIGNIF,
-            f"{modelo}_{variable}_{agregacion}_{ssp}_{REF_LABEL}_centro-{cy}.npy")
-        if not (os.path.exists(out_nc) and os.path.exists(out_npy)):
-            archivos_existen = False
-            break
 
-    if archivos_existen:
-        print(f"  -> Saltando: Todos los archivos para esta combinación ya existen")
-        return
+def procesar_combinacion(modelo, variable, agregacion, ssp, ventanas=None):
+    """
+    Procesa una combinación específica de dimensiones y guarda los pares
+    (periodo base, año centro) indicados (por defecto, REF_LABELS × CENTER_YEARS).
+    Todos salen de una sola lectura del archivo: los momentos acumulados y
+    las estadísticas de cada ventana futura se comparten entre periodos base.
+    """
+    if ventanas is None:
+        ventanas = [(ref, cy) for ref in REF_LABELS for cy in CENTER_YEARS]
+
     print(f"\n=== Procesando: {modelo} | {variable} | {agregacion} | {ssp} ===")
     # Cargar datos
     da = cargar_combinacion(MOD_DIR, modelo, variable, agregacion, ssp)
     if da is None:
-        return
+        return False
     #
     # DIAGNÓSTICO: Imprimir información del dataset
     #print(f"  -> Dimensiones: {da.dims}")
     #print(f"  -> Forma: {da.shape}")
     #print(f"  -> Coordenadas: {list(da.coords)}")
     
-    # Periodo histórico fijo
-    da_hist = seleccionar_periodo(da, REF_START, REF_END)
+    # Sumas acumuladas a lo largo del tiempo (una sola pasada por archivo).
+    # Todas las ventanas (base y futuras) se resuelven luego en O(grilla).
+    momentos = calcular_momentos_acumulados(da)
     
-    # Verificar que tenemos datos históricos
-    if da_hist.time.size == 0:
-        print(f"  -> Error: No hay datos históricos para el periodo {REF_START}-{REF_END}")
-        return
+    # Estadísticas de cada periodo base y de cada ventana futura, una vez cada una
+    stats_hist = {}
+    for ref in sorted({ref for ref, _ in ventanas}):
+        ref_start, ref_end = REF_PERIODS[ref]
+        stats = estadisticas_ventana(momentos, ref_start, ref_end)
+        
+        # Verificar que tenemos datos históricos
+        if stats['pasos'] == 0:
+            print(f"  -> Error: No hay datos históricos para el periodo {ref_start}-{ref_end}")
+            continue
+        stats_hist[ref] = stats
+    
+    if not stats_hist:
+        return False
     
-    # Procesar cada año centro
-    for cy in CENTER_YEARS:
+    stats_fut = {}
+    for cy in sorted({cy for _, cy in ventanas}):
         fut_start = cy - (FUT_WINDOW // 2) + 1
         fut_end   = fut_start + FUT_WINDOW - 1
         
-        da_fut = seleccionar_periodo(da, fut_start, fut_end)
+        stats = estadisticas_ventana(momentos, fut_start, fut_end)
         
         # Verificar que tenemos datos futuros
-        if da_fut.time.size == 0:
+        if stats['pasos'] == 0:
             print(f"  -> Advertencia: No hay datos futuros para {fut_start}-{fut_end}")
             continue
-        
-        # Delta (campo espacial)
-        delta = calcular_delta(da_hist, da_fut, variable)
-        
-        # p-values (campo 2D)
-        pvals = calcular_pvals(da_hist, da_fut)
-        pvals = np.asarray(pvals)
-        
+        stats_fut[cy] = stats
+    
+    # Delta (campo espacial) y p-values (campo 2D) de cada periodo base y año centro
+    resultados = {}
+    for ref, cy in ventanas:
+        if ref in stats_hist and cy in stats_fut:
+            resultados[(ref, cy)] = calcular_cambio_ventanas(
+                momentos, stats_hist[ref], stats_fut[cy], variable)
+    
+    # Con --lazy todas las ventanas se calculan en una sola pasada por bloques
+    resultados, = materializar(resultados)
+    
+    # Guardar cada periodo base y año centro
+    for (ref, cy), (delta, pvals) in resultados.items():
         # ----------------------------------------------
         # Guardado del NetCDF
         # ----------------------------------------------
         delta_ds = xr.Dataset({
             f"delta_{variable}": delta.assign_coords(
                 center_year = cy,
-                reference   = REF_LABEL,
+                reference   = ref,
                 agregacion  = agregacion,
                 ssp         = ssp
             )
         })
         
         # Nombre incluye todas las dimensiones
-        out_nc = os.path.join(
-            OUT_CAMBIOS,
-            f"{modelo}_{variable}_{agregacion}_{ssp}_{REF_LABEL}_centro-{cy}.nc"
-        )
+        out_nc, out_signif = rutas_salida(modelo, variable, agregacion, ssp, ref, cy)
         
-        if not os.path.exists(out_nc):
-            print(f"  -> Guardando cambios: {os.path.basename(out_nc)}")
-            try:
-                delta_ds.to_netcdf(out_nc)
-            except Exception as e:
-                print(f"  -> Error guardando NetCDF: {e}")
+        print(f"  -> Guardando cambios: {os.path.basename(out_nc)}")
+        try:
+            guardar_atomico(out_nc, delta_ds.to_netcdf)
+        except Exception as e:
+            print(f"  -> Error guardando NetCDF: {e}")
         
         # ----------------------------------------------
         # Guardado de significancia
         # ----------------------------------------------
-        out_npy = os.path.join(
-            OUT_SIGNIF,
-            f"{modelo}_{variable}_{agregacion}_{ssp}_{REF_LABEL}_centro-{cy}.npy"
-        )
+        print(f"  -> Guardando significancia: {os.path.basename(out_signif)}")
+        try:
+            guardar_significancia(out_signif, pvals, delta)
+        except Exception as e:
+            print(f"  -> Error guardando significancia: {e}")
+
+
+def planificar_cambios(manifiesto, archivos_nc, forzar=False):
+    """
+    Pares (periodo base, año centro) faltantes o desactualizados de cada
+    combinación según el manifiesto.
+    
+    Returns:
+        (plan para registrar(), lista de argumentos de procesar_combinacion)
+    """
+    # Reunir combinaciones únicas y las salidas de cada periodo base y año
+    # centro, que dependen del archivo del modelo, del periodo base, de la
+    # ventana y del código
+    codigo = version_codigo('aux_cambios_significancia')
+    procesadas = set()  # Evitar duplicados
+    salidas = {}
+    salida_de = {}  # ruta -> (combinación, (periodo base, año centro))
+    
+    for archivo in sorted(archivos_nc):
+        dims = extraer_dimensiones_archivo(archivo)
+        
+        if dims is None:
+            print(f"  -> Saltando archivo con formato no válido: {archivo}")
+            continue
         
-        if not os.path.exists(out_npy):
-            print(f"  -> Guardando significancia: {os.path.basename(out_npy)}")
-            try:
-                np.save(out_npy, pvals, allow_pickle=True)
-            except Exception as e:
-                print(f"  -> Error guardando NPY: {e}")
+        # Crear clave única para evitar duplicados
+        clave = (dims['modelo'], dims['variable'], dims['agregacion'], dims['ssp'])
+        
+        if clave not in procesadas:
+            procesadas.add(clave)
+        else:
+            print(f"  -> Combinación ya procesada: {clave}")
+            continue
+        
+        for ref in REF_LABELS:
+            for cy in CENTER_YEARS:
+                parametros = {
+                    'referencia': ref,
+                    'periodo_referencia': list(REF_PERIODS[ref]),
+                    'centro': cy,
+                    'ventana_futura': FUT_WINDOW,
+                }
+                dep = dependencia([os.path.join(MOD_DIR, archivo)], parametros, codigo)
+                for ruta in rutas_salida(*clave, ref, cy):
+                    salidas[ruta] = dep
+                    salida_de[ruta] = (clave, (ref, cy))
+    
+    # Solo las ventanas con alguna salida faltante o desactualizada
+    plan = planificar(manifiesto, salidas, forzar)
+    ventanas = {}
+    for ruta in plan:
+        clave, ventana = salida_de[ruta]
+        ventanas.setdefault(clave, set()).add(ventana)
+    combinaciones = [clave + (tuple(sorted(v)),) for clave, v in sorted(ventanas.items())]
+    print(f"Combinaciones: {len(procesadas)} (pendientes: {len(combinaciones)})")
+    return plan, combinaciones
 
 
 def main():
     """
-    Función principal que detecta y procesa todas las combinaciones.
+    Función principal que detecta y procesa todas las combinaciones en paralelo.
     """
+    parser = crear_parser("Cambios y significancia por modelo", perezoso=True,
+                          cache_entradas=True)
+    agregar_argumento_forzar(parser)
+    args = parser.parse_args()
+    configurar_perfilado(args)
+    configurar_perezoso(args)
+    configurar_cache_entradas(args)
+    
     # Verificar que existe la ruta de modelos
     if not os.path.exists(MOD_DIR):
         print(f"Error: No se encuentra la ruta {MOD_DIR}")
@@ -247,26 +327,23 @@ def main():
     
     #print(f"Se encontraron {len(archivos_nc)} archivos en {MOD_DIR}")
     
-    # Procesar cada archivo
-    procesadas = set()  # Evitar duplicados
+    manifiesto = cargar_manifiesto()
+    plan, combinaciones = planificar_cambios(manifiesto, archivos_nc, args.forzar)
     
-    for archivo in sorted(archivos_nc):
-        dims = extraer_dimensiones_archivo(archivo)
-        
-        if dims is None:
-            print(f"  -> Saltando archivo con formato no válido: {archivo}")
-            continue
-        
-        # Crear clave única para evitar duplicados
-        clave = (dims['modelo'], dims['variable'], dims['agregacion'], dims['ssp'])
-        
-        if clave not in procesadas:
-            procesar_combinacion(*clave)
-            procesadas.add(clave)
-        else:
-            print(f"  -> Combinación ya procesada: {clave}")
+    # Procesar combinaciones (independientes entre sí) en paralelo
+    ejecutar_combinaciones(procesar_combinacion, combinaciones, args.workers,
+                           titulo="Cambios y significancia")
+    
+    registrar(manifiesto, plan)
+    guardar_manifiesto(manifiesto)
+    
+    # Consolidar deltas y p-values en un almacén por variable_agregación
+    consolidar_almacen(OUT_CAMBIOS, OUT_SIGNIF, OUT_ALMACEN)
+    
+    # Registrar las salidas en el catálogo del dashboard
+    actualizar_catalogo(BASE_DIR)
     
-    print(f"\n¡Procesamiento completado! Total de combinaciones: {len(procesadas)}")
+    print(f"\n¡Procesamiento completado! Combinaciones procesadas: {len(combinaciones)}")
 
 
 if __name__ == "__main__":
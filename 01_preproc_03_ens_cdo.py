@@ -1,23 +1,34 @@
 #!/usr/bin/env python
 # coding: utf-8
 """
-01_preproc_03_ens_cdo.py - Cálculo de ensambles usando CDO (versión simplificada)
+01_preproc_03_ens_cdo.py - Cálculo de ensambles (versión simplificada)
+El ensemble se calcula en proceso con NumPy (media + dispersión entre modelos);
+con --cdo se usa `cdo ensmean` como antes y con --lazy se calcula por bloques
+con dask.
 Modificado para saltar archivos existentes
 """
 import os
 import sys
-import numpy as np
 import xarray as xr
 
 # Añadir src al path
 sys.path.append(os.path.join(os.path.dirname(__file__), "src"))
 CENTER_YEARS = [2030, 2035, 2040, 2045, 2050]
-REF_LABEL = "1991-2020" #"1981-2010"
 
 # Importar funciones de CDO
-from aux_ens_cdo import calcular_ensemble_cdo, verificar_ensemble_existente
+from aux_ens_cdo import (calcular_ensemble_cdo, calcular_ensemble_numpy, calcular_ensemble_dask,
+                         verificar_ensemble_existente, buscar_archivos_miembros)
+from aux_paralelo import crear_parser, ejecutar_combinaciones, guardar_atomico
+from aux_perfilado import configurar_perfilado
+from aux_perezoso import abrir_dataset, configurar_perezoso, materializar, modo_perezoso
+from aux_cache_entradas import configurar_cache_entradas
+from aux_manifiesto import (agregar_argumento_forzar, cargar_manifiesto, guardar_manifiesto,
+                            dependencia, version_codigo, planificar, registrar)
+from aux_catalogo import actualizar_catalogo
+from aux_significancia import EXTENSION as EXT_SIGNIF, guardar_significancia
 # Importar funciones de cálculos (las mismas que para modelos individuales)
-from aux_cambios_significancia import (seleccionar_periodo, calcular_delta, calcular_pvals)
+from aux_cambios_significancia import (calcular_momentos_acumulados, estadisticas_ventana,
+                                       calcular_cambio_ventanas)
 
 # ============================================================
 # CONFIGURACIÓN
@@ -31,9 +42,9 @@ OUT_ENS_SIGNIF = os.path.join(BASE_DIR, "ensamble", "significancia")
 os.makedirs(OUT_ENS_BRUTO, exist_ok=True)
 os.makedirs(OUT_ENS_CAMBIOS, exist_ok=True)
 os.makedirs(OUT_ENS_SIGNIF, exist_ok=True)
-# Periodos base
+# Periodos base (se calculan todos en la misma pasada por el ensemble)
 REF_PERIODS = {"1981-2010": (1981, 2010), "1991-2020": (1991, 2020)}
-REF_START, REF_END = REF_PERIODS[REF_LABEL]
+REF_LABELS = list(REF_PERIODS)
 # Años centro
 FUT_WINDOW = 30
 
@@ -41,11 +52,11 @@ FUT_WINDOW = 30
 # FUNCIONES PRINCIPALES
 # ============================================================
 
-def obtener_combinaciones_unicas():
-    """Obtiene combinaciones únicas de archivos."""
+def obtener_combinaciones_unicas(archivos_nc=None):
+    """Obtiene combinaciones únicas de archivos (por defecto, los de MOD_DIR)."""
     combinaciones = set()
     
-    for archivo in os.listdir(MOD_DIR):
+    for archivo in (os.listdir(MOD_DIR) if archivos_nc is None else archivos_nc):
         if archivo.endswith('.nc'):
             partes = archivo.replace('.nc', '').split('_')
             if len(partes) >= 4:
@@ -54,79 +65,87 @@ def obtener_combinaciones_unicas():
     return sorted(combinaciones)
 
 
-def verificar_cambios_existentes(variable, agregacion, ssp, cy):
-    """Verifica si ya existen archivos de cambios y significancia."""
-    out_nc = os.path.join(
-        OUT_ENS_CAMBIOS,
-        f"ensemble_{variable}_{agregacion}_{ssp}_{REF_LABEL}_centro-{cy}.nc"
-    )    
-    out_npy = os.path.join(
-        OUT_ENS_SIGNIF,
-        f"ensemble_{variable}_{agregacion}_{ssp}_{REF_LABEL}_centro-{cy}.npy"
-    )    
-    return os.path.exists(out_nc) and os.path.exists(out_npy)
+def ruta_ensemble_bruto(variable, agregacion, ssp):
+    """Ruta del ensemble bruto de una combinación."""
+    return os.path.join(OUT_ENS_BRUTO, f"ensemble_{variable}_{agregacion}_{ssp}.nc")
 
-def procesar_cambios_ensemble(ruta_ensemble, variable, agregacion, ssp):
-    """Calcula cambios y significancia para el ensemble."""
-    
-    # Cargar ensemble
-    ds = xr.open_dataset(ruta_ensemble)
-    da = ds[variable]
-    
-    # Periodo histórico
-    da_hist = seleccionar_periodo(da, REF_START, REF_END)
-    
-    if da_hist.time.size == 0:
-        print(f"  -> Error: No hay datos históricos")
-        return
+
+def rutas_cambios(variable, agregacion, ssp, referencia, cy):
+    """Rutas de los archivos de cambios y significancia de un periodo base y año centro."""
+    nombre = f"ensemble_{variable}_{agregacion}_{ssp}_{referencia}_centro-{cy}"
+    return (os.path.join(OUT_ENS_CAMBIOS, f"{nombre}.nc"),
+            os.path.join(OUT_ENS_SIGNIF, f"{nombre}{EXT_SIGNIF}"))
+
+def procesar_cambios_ensemble(ruta_ensemble, variable, agregacion, ssp, ventanas=None):
+    """
+    Calcula cambios y significancia para el ensemble en los pares (periodo
+    base, año centro) indicados (por defecto, todos), con una sola lectura.
+    """
+    if ventanas is None:
+        ventanas = [(ref, cy) for ref in REF_LABELS for cy in CENTER_YEARS]
     
-    archivos_procesados = 0
-    archivos_saltados = 0
-    
-    # Procesar cada año centro
-    for cy in CENTER_YEARS:
-        # Verificar si ya existen los archivos
-        if verificar_cambios_existentes(variable, agregacion, ssp, cy):
-            print(f"  -> Saltando centro-{cy} (archivos ya existen)")
-            archivos_saltados += 1
-            continue
+    # Cargar ensemble (con --lazy: bloques espaciales con la serie completa;
+    # es una salida intermedia, no pasa por la caché de entradas)
+    with abrir_dataset(ruta_ensemble, enteras=('time',), cache=False) as ds:
+        da = ds[variable]
+        
+        # Sumas acumuladas (una pasada); cada ventana se resuelve en O(grilla)
+        momentos = calcular_momentos_acumulados(da)
         
-        fut_start = cy - (FUT_WINDOW // 2) + 1
-        fut_end = fut_start + FUT_WINDOW - 1
+        # Periodos históricos (cada uno una vez)
+        stats_hist = {}
+        for ref in sorted({ref for ref, _ in ventanas}):
+            stats = estadisticas_ventana(momentos, *REF_PERIODS[ref])
+            if stats['pasos'] == 0:
+                print(f"  -> Error: No hay datos históricos para {ref}")
+                continue
+            stats_hist[ref] = stats
         
-        da_fut = seleccionar_periodo(da, fut_start, fut_end)
+        if not stats_hist:
+            return False
         
-        if da_fut.time.size == 0:
-            print(f"  -> Advertencia: No hay datos para centro-{cy}")
-            continue
+        archivos_saltados = len(REF_LABELS) * len(CENTER_YEARS) - len(set(ventanas))
         
-        # Calcular cambios
-        delta = calcular_delta(da_hist, da_fut, variable)
-        pvals = np.asarray(calcular_pvals(da_hist, da_fut))
+        # Ventanas futuras (compartidas entre periodos base)
+        stats_fut = {}
+        for cy in sorted({cy for _, cy in ventanas}):
+            fut_start = cy - (FUT_WINDOW // 2) + 1
+            fut_end = fut_start + FUT_WINDOW - 1
+            
+            stats = estadisticas_ventana(momentos, fut_start, fut_end)
+            
+            if stats['pasos'] == 0:
+                print(f"  -> Advertencia: No hay datos para centro-{cy}")
+                continue
+            stats_fut[cy] = stats
         
+        # Calcular cambios de cada periodo base y año centro pendiente
+        resultados = {}
+        for ref, cy in ventanas:
+            if ref in stats_hist and cy in stats_fut:
+                resultados[(ref, cy)] = calcular_cambio_ventanas(
+                    momentos, stats_hist[ref], stats_fut[cy], variable)
+        
+        # Con --lazy todas las ventanas se calculan en una sola pasada por bloques
+        resultados, = materializar(resultados)
+    
+    archivos_procesados = 0
+    for (ref, cy), (delta, pvals) in resultados.items():
         # Guardar cambios
         delta_ds = xr.Dataset({
             f"delta_{variable}": delta.assign_coords(
-                center_year=cy, reference=REF_LABEL,
+                center_year=cy, reference=ref,
                 agregacion=agregacion, ssp=ssp
             )
         })
         
-        out_nc = os.path.join(
-            OUT_ENS_CAMBIOS,
-            f"ensemble_{variable}_{agregacion}_{ssp}_{REF_LABEL}_centro-{cy}.nc"
-        )
+        out_nc, out_signif = rutas_cambios(variable, agregacion, ssp, ref, cy)
         
-        print(f"  -> Guardando cambios: centro-{cy}")
-        delta_ds.to_netcdf(out_nc)
+        print(f"  -> Guardando cambios: {ref} centro-{cy}")
+        guardar_atomico(out_nc, delta_ds.to_netcdf)
         
         # Guardar significancia
-        out_npy = os.path.join(
-            OUT_ENS_SIGNIF,
-            f"ensemble_{variable}_{agregacion}_{ssp}_{REF_LABEL}_centro-{cy}.npy"
-        )
-        
-        np.save(out_npy, pvals, allow_pickle=True)
+        guardar_significancia(out_signif, pvals, delta)
         archivos_procesados += 1
     
     # Resumen
@@ -134,30 +153,112 @@ def procesar_cambios_ensemble(ruta_ensemble, variable, agregacion, ssp):
         print(f"  -> Resumen: {archivos_procesados} procesados, {archivos_saltados} saltados")
 
 
-def procesar_combinacion(variable, agregacion, ssp):
-    """Procesa una combinación completa."""
-    print(f"\n=== ENSEMBLE: {variable} | {agregacion} | {ssp} ===")
-    
-    # 1. Verificar si ensemble ya existe
-    if verificar_ensemble_existente(OUT_ENS_BRUTO, variable, agregacion, ssp):
-        print(f"  -> Ensemble bruto ya existe, usando existente...")
-        ruta_ensemble = os.path.join(
-            OUT_ENS_BRUTO, 
-            f"ensemble_{variable}_{agregacion}_{ssp}.nc"
+def calcular_ensemble(variable, agregacion, ssp, usar_cdo=False):
+    """
+    Calcula el ensemble bruto con el motor que corresponda (CDO, dask o NumPy).
+    Devuelve su ruta, o False si no se pudo crear.
+    """
+    if usar_cdo:
+        # Calcular ensemble con CDO
+        print("  -> Calculando ensemble con CDO...")
+        ruta_ensemble = calcular_ensemble_cdo(
+            MOD_DIR, variable, agregacion, ssp, OUT_ENS_BRUTO
+        )
+    elif modo_perezoso():
+        # Calcular ensemble como grafo de dask (por bloques, escritura incremental)
+        print("  -> Calculando ensemble (dask)...")
+        ruta_ensemble = calcular_ensemble_dask(
+            MOD_DIR, variable, agregacion, ssp, OUT_ENS_BRUTO
         )
     else:
-        # 2. Calcular ensemble con CDO
-        print(f"  -> Calculando ensemble con CDO...")
-        ruta_ensemble = calcular_ensemble_cdo(
+        # Calcular ensemble en proceso (NumPy, por bloques de tiempo)
+        print("  -> Calculando ensemble (NumPy)...")
+        ruta_ensemble = calcular_ensemble_numpy(
             MOD_DIR, variable, agregacion, ssp, OUT_ENS_BRUTO
         )
+    return ruta_ensemble or False
+
+
+def procesar_combinacion(variable, agregacion, ssp, usar_cdo=False, rehacer_ensemble=False,
+                         ventanas=None):
+    """
+    Procesa una combinación completa. El ensemble bruto se recalcula si no
+    existe o si rehacer_ensemble; los cambios, solo para los pares (periodo
+    base, año centro) indicados (por defecto, todos).
+    """
+    print(f"\n=== ENSEMBLE: {variable} | {agregacion} | {ssp} ===")
+    
+    # 1. Verificar si ensemble ya existe (y está al día)
+    if not rehacer_ensemble and verificar_ensemble_existente(OUT_ENS_BRUTO, variable,
+                                                             agregacion, ssp):
+        print("  -> Ensemble bruto ya existe, usando existente...")
+        ruta_ensemble = ruta_ensemble_bruto(variable, agregacion, ssp)
+    else:
+        # 2. Calcular ensemble
+        ruta_ensemble = calcular_ensemble(variable, agregacion, ssp, usar_cdo)
     
     if not ruta_ensemble:
-        print(f"  -> Error: No se pudo obtener/crear el ensemble")
-        return
+        print("  -> Error: No se pudo obtener/crear el ensemble")
+        return False
     
-    # 3. Calcular cambios y significancia (solo si no existen)
-    procesar_cambios_ensemble(ruta_ensemble, variable, agregacion, ssp)
+    # 3. Calcular cambios y significancia (ventanas pendientes)
+    return procesar_cambios_ensemble(ruta_ensemble, variable, agregacion, ssp, ventanas)
+
+
+def planificar_ensambles(manifiesto, combinaciones, forzar=False):
+    """
+    Ensambles brutos y ventanas (periodo base, año centro) de sus cambios
+    que faltan o están desactualizados según el manifiesto. Si un ensemble
+    se recalcula, sus cambios también.
+    
+    Returns:
+        (plan para registrar(), lista de (variable, agregacion, ssp,
+        rehacer_ensemble, ventanas))
+    """
+    # El ensemble bruto depende de los archivos miembro; los cambios de cada
+    # periodo base y año centro, del ensemble bruto y de las ventanas
+    codigo_ensemble = version_codigo('aux_ens_cdo')
+    codigo_cambios = version_codigo('aux_cambios_significancia')
+    
+    salidas_ensemble = {
+        ruta_ensemble_bruto(var, agg, ssp): dependencia(
+            buscar_archivos_miembros(MOD_DIR, var, agg, ssp), codigo=codigo_ensemble)
+        for var, agg, ssp in combinaciones
+    }
+    plan = planificar(manifiesto, salidas_ensemble, forzar)
+    
+    salidas_cambios = {}   # cambios de ensembles al día
+    salidas_forzadas = {}  # cambios de ensembles que se recalculan
+    salida_de = {}         # ruta -> (combinación, (periodo base, año centro))
+    for clave in combinaciones:
+        ruta_ensemble = ruta_ensemble_bruto(*clave)
+        destino = salidas_forzadas if ruta_ensemble in plan else salidas_cambios
+        for ref in REF_LABELS:
+            for cy in CENTER_YEARS:
+                parametros = {
+                    'referencia': ref,
+                    'periodo_referencia': list(REF_PERIODS[ref]),
+                    'centro': cy,
+                    'ventana_futura': FUT_WINDOW,
+                }
+                for ruta in rutas_cambios(*clave, ref, cy):
+                    destino[ruta] = dependencia([ruta_ensemble], parametros, codigo_cambios)
+                    salida_de[ruta] = (clave, (ref, cy))
+    plan.update(planificar(manifiesto, salidas_cambios, forzar))
+    plan.update(planificar(manifiesto, salidas_forzadas, forzar=True))
+    
+    ventanas = {}
+    for ruta in plan:
+        if ruta in salida_de:
+            clave, ventana = salida_de[ruta]
+            ventanas.setdefault(clave, set()).add(ventana)
+    pendientes = [
+        (var, agg, ssp, ruta_ensemble_bruto(var, agg, ssp) in plan,
+         tuple(sorted(ventanas.get((var, agg, ssp), ()))))
+        for var, agg, ssp in combinaciones
+        if ruta_ensemble_bruto(var, agg, ssp) in plan or (var, agg, ssp) in ventanas
+    ]
+    return plan, pendientes
 
 
 # ============================================================
@@ -165,24 +266,35 @@ def procesar_combinacion(variable, agregacion, ssp):
 # ============================================================
 
 def main():
+    parser = crear_parser("Ensambles multimodelo, cambios y significancia", perezoso=True,
+                          cache_entradas=True)
+    parser.add_argument("--cdo", action="store_true",
+                        help="Calcular el ensemble con `cdo ensmean` en lugar de NumPy")
+    agregar_argumento_forzar(parser)
+    args = parser.parse_args()
+    configurar_perfilado(args)
+    configurar_perezoso(args)
+    configurar_cache_entradas(args)
+    
     print("=" * 60)
-    print("ENSEMBLES CON CDO - VERSIÓN SIMPLIFICADA")
-    print("(Saltando archivos existentes)")
+    print("ENSEMBLES MULTIMODELO - VERSIÓN SIMPLIFICADA")
+    print("(Saltando salidas al día según el manifiesto)")
     print("=" * 60)
     
     if not os.path.exists(MOD_DIR):
         print(f"Error: No existe {MOD_DIR}")
         return
     
-    # Verificar que CDO está instalado
-    try:
-        import subprocess
-        subprocess.run(["cdo", "--version"], capture_output=True, check=True)
-        print("✓ CDO encontrado y funcionando")
-    except:
-        print("✗ ERROR: CDO no está instalado o no está en PATH")
-        print("  Instala con: conda install -c conda-forge cdo")
-        return
+    # Verificar que CDO está instalado (solo si se pidió usarlo)
+    if args.cdo:
+        try:
+            import subprocess
+            subprocess.run(["cdo", "--version"], capture_output=True, check=True)
+            print("✓ CDO encontrado y funcionando")
+        except:
+            print("✗ ERROR: CDO no está instalado o no está en PATH")
+            print("  Instala con: conda install -c conda-forge cdo")
+            return
     
     # Obtener combinaciones
     combinaciones = obtener_combinaciones_unicas()
@@ -193,13 +305,22 @@ def main():
     
     print(f"\nSe encontraron {len(combinaciones)} combinaciones")
     
-    # Procesar cada combinación
-    total_combinaciones = len(combinaciones)
-    for idx, (variable, agregacion, ssp) in enumerate(combinaciones, 1):
-        print(f"\n[{idx}/{total_combinaciones}]", end=" ")
-        procesar_combinacion(variable, agregacion, ssp)
+    manifiesto = cargar_manifiesto()
+    plan, pendientes = planificar_ensambles(manifiesto, combinaciones, args.forzar)
+    pendientes = [(var, agg, ssp, args.cdo, rehacer, ventanas)
+                  for var, agg, ssp, rehacer, ventanas in pendientes]
+    
+    # Procesar combinaciones (independientes entre sí) en paralelo
+    ejecutar_combinaciones(procesar_combinacion, pendientes, args.workers,
+                           titulo="Ensambles")
+    
+    registrar(manifiesto, plan)
+    guardar_manifiesto(manifiesto)
+    
+    # Registrar las salidas en el catálogo del dashboard
+    actualizar_catalogo(BASE_DIR)
     
-    print(f"\n" + "=" * 60)
+    print("\n" + "=" * 60)
     print("PROCESAMIENTO COMPLETADO")
     print("=" * 60)
 
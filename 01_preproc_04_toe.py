@@ -11,6 +11,12 @@ from glob import glob
 
 sys.path.append(os.path.join(os.path.dirname(__file__), "src"))
 from aux_calcular_toe import calcular_toe_completo, guardar_toe
+from aux_paralelo import crear_parser, ejecutar_combinaciones
+from aux_perfilado import configurar_perfilado
+from aux_cache_entradas import configurar_cache_entradas
+from aux_catalogo import actualizar_catalogo
+from aux_manifiesto import (agregar_argumento_forzar, cargar_manifiesto, guardar_manifiesto,
+                            dependencia, version_codigo, planificar, registrar)
 
 # ============================================================
 # CONFIGURACIÓN
@@ -19,12 +25,15 @@ BASE_DIR = "data"
 MOD_DIR = os.path.join(BASE_DIR, "modelos_agre")
 OUT_TOE = os.path.join(BASE_DIR, "mod_toe")
 os.makedirs(OUT_TOE, exist_ok=True)
+# Umbrales adicionales de TOE_umbrales (p. ej. [0.5, 1.5, 3]); los de TOE_1 y
+# TOE_2 se incluyen siempre. Se pueden cambiar con --umbrales
+UMBRALES_TOE = []
 # ============================================================
 # FUNCIONES PRINCIPALES
 # ============================================================
-def obtener_combinaciones():
-    """Obtiene combinaciones únicas de (variable, agregacion)."""
-    archivos = glob(os.path.join(MOD_DIR, "*.nc"))
+def obtener_combinaciones(archivos_nc=None):
+    """Obtiene combinaciones únicas de (variable, agregacion) (por defecto, de MOD_DIR)."""
+    archivos = glob(os.path.join(MOD_DIR, "*.nc")) if archivos_nc is None else archivos_nc
     combinaciones = set()    
     for archivo in archivos:
         nombre = os.path.basename(archivo).replace('.nc', '')
@@ -33,43 +42,83 @@ def obtener_combinaciones():
             combinaciones.add((partes[0], partes[1]))    
     return sorted(list(combinaciones))
 
-def procesar_variable(var, agg):
-    """Procesa una variable para calcular TOE."""
-    archivo_toe = os.path.join(OUT_TOE, f"ensemble_{var}_{agg}_toe.nc")
-    
-    if os.path.exists(archivo_toe):
-        print(f"  Ya existe, saltando...")
-        return True
-    
+def ruta_toe(var, agg):
+    """Ruta del archivo TOE de una variable y agregación."""
+    return os.path.join(OUT_TOE, f"ensemble_{var}_{agg}_toe.nc")
+
+def archivos_entrada(var, agg):
+    """Archivos de modelos (ambos escenarios) de los que depende el TOE."""
+    return sorted(glob(os.path.join(MOD_DIR, f"{var}_{agg}_*_ssp*.nc")))
+
+def procesar_variable(var, agg, umbrales=None):
+    """Procesa una variable para calcular TOE (umbrales adicionales opcionales)."""
     try:
-        resultados = calcular_toe_completo(var, agg, MOD_DIR)        
+        resultados = calcular_toe_completo(var, agg, MOD_DIR, umbrales)
         if resultados:
             ruta = guardar_toe(resultados, OUT_TOE, var, agg)
             print(f"  Guardado: {os.path.basename(ruta)}")
             return True
         else:
-            print(f"  Error en cálculo")
+            print("  Error en cálculo")
             return False
             
     except Exception as e:
         print(f"  Error: {e}")
         return False
 
+def planificar_toe(manifiesto, combinaciones, forzar=False, umbrales=None):
+    """
+    TOE faltantes o desactualizados según el manifiesto.
+    
+    Args:
+        umbrales: Umbrales adicionales (por defecto UMBRALES_TOE)
+    
+    Returns:
+        (plan para registrar(), lista de argumentos de procesar_variable)
+    """
+    umbrales = sorted(float(u) for u in (UMBRALES_TOE if umbrales is None else umbrales))
+    # Cada TOE depende de todos los modelos de su variable y agregación y de
+    # los umbrales pedidos
+    codigo = version_codigo('aux_calcular_toe')
+    salidas = {ruta_toe(var, agg): dependencia(archivos_entrada(var, agg),
+                                               {'umbrales': umbrales}, codigo)
+               for var, agg in combinaciones}
+    plan = planificar(manifiesto, salidas, forzar)
+    return plan, [(var, agg, tuple(umbrales)) for var, agg in combinaciones
+                  if ruta_toe(var, agg) in plan]
+
 # ============================================================
 # EJECUCIÓN
 # ============================================================
-if __name__ == "__main__":
+def main():
+    parser = crear_parser("Time of Emergence por variable y agregación", cache_entradas=True)
+    parser.add_argument("--umbrales", type=float, nargs="+", default=None,
+                        help="Umbrales adicionales de TOE_umbrales (por defecto UMBRALES_TOE)")
+    agregar_argumento_forzar(parser)
+    args = parser.parse_args()
+    configurar_perfilado(args)
+    configurar_cache_entradas(args)
+    
     print("Calculando TOE para todas las variables...")
     
     combinaciones = obtener_combinaciones()
     print(f"Encontradas {len(combinaciones)} combinaciones")
     
-    exitos = 0
-    for i, (var, agg) in enumerate(combinaciones, 1):
-        
-        #if i>1: continue
-        print(f"\n[{i}/{len(combinaciones)}] {var}_{agg}:")
-        if procesar_variable(var, agg):
-            exitos += 1
+    manifiesto = cargar_manifiesto()
+    plan, pendientes = planificar_toe(manifiesto, combinaciones, args.forzar, args.umbrales)
+    print(f"Pendientes (faltantes o desactualizadas): {len(pendientes)}")
+    
+    resumen = ejecutar_combinaciones(procesar_variable, pendientes, args.workers,
+                                     titulo="TOE")
+    
+    registrar(manifiesto, plan)
+    guardar_manifiesto(manifiesto)
+    
+    # Registrar las salidas en el catálogo del dashboard
+    actualizar_catalogo(BASE_DIR)
     
-    print(f"\n✓ Proceso completado. Éxitos: {exitos}/{len(combinaciones)}")
\ No newline at end of file
+    print(f"\n✓ Proceso completado. Éxitos: {resumen['exitos']}/{len(pendientes)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+"""
+01_preproc_05_figuras.py - Prerenderizado de figuras del dashboard
+Genera de antemano las figuras de las vistas CAMBIOS (PNG) y PROMEDIO (JSON
+Plotly) para toda la matriz de opciones, en data/cache/figuras/.
+Las figuras ya vigentes (mismos parámetros y mismos datos) se saltan y, al
+final, se borran las que ya no corresponden a la matriz (--limite-mb además
+acota el tamaño del directorio).
+"""
+import os
+import sys
+
+import matplotlib
+matplotlib.use("Agg")
+
+sys.path.append(os.path.join(os.path.dirname(__file__), "src"))
+from aux_paralelo import crear_parser, ejecutar_combinaciones
+from aux_perfilado import configurar_perfilado
+from aux_cache_figuras import (clave_cambios, clave_promedio, figura_cambios_png,
+                               figura_promedio_json, purgar_figuras, FIGURAS_DIR)
+from aux_significancia import UMBRALES
+from dashboard_utils import (obtener_lista_modelos, obtener_lista_var_agre,
+                             obtener_lista_year_ssp, separar_var_agre, separar_centro_ssp)
+
+# ============================================================
+# CONFIGURACIÓN
+# ============================================================
+BASES = ["1981-2010", "1991-2020"]   # mismas opciones que el sidebar
+N_MODELOS_DEFECTO = 3                # selección por defecto del dashboard
+# ============================================================
+# FUNCIONES PRINCIPALES
+# ============================================================
+def selecciones_modelos(modelos, extra=None):
+    """
+    Selecciones de modelos a prerenderizar: la del dashboard por defecto,
+    todos los modelos y, opcionalmente, una selección adicional.
+    """
+    selecciones = [tuple(modelos[:min(N_MODELOS_DEFECTO, len(modelos))]), tuple(modelos)]
+    if extra:
+        selecciones.append(tuple(extra))
+    return [s for i, s in enumerate(selecciones) if s and s not in selecciones[:i]]
+
+def combinaciones_cambios(selecciones):
+    """
+    (modelos, var, agregacion, ssp, base, centro, significancia) con datos;
+    significancia es None (sin puntos) o cada umbral que ofrece el dashboard.
+    """
+    combinaciones = []
+    for var_agre in obtener_lista_var_agre():
+        var, agregacion = separar_var_agre(var_agre)
+        for year_ssp in obtener_lista_year_ssp():
+            centro, ssp = separar_centro_ssp(year_ssp)
+            for base in BASES:
+                for modelos in selecciones:
+                    hay_datos = any(os.path.exists(os.path.join(
+                        "data", "mod_cambios",
+                        f"{mod}_{var}_{agregacion}_{ssp}_{base}_centro-{centro}.nc"))
+                        for mod in modelos)
+                    if not hay_datos:
+                        continue
+                    for significancia in (None,) + UMBRALES:
+                        combinaciones.append((modelos, var, agregacion, ssp, base,
+                                              centro, significancia))
+    return combinaciones
+
+def combinaciones_promedio():
+    """(variable, agregacion, base, centro, umbral) con datos de ensamble."""
+    centros = sorted({separar_centro_ssp(ys)[0] for ys in obtener_lista_year_ssp()})
+    combinaciones = []
+    for var_agre in obtener_lista_var_agre():
+        var, agregacion = separar_var_agre(var_agre)
+        for base in BASES:
+            for centro in centros:
+                hay_datos = any(os.path.exists(os.path.join(
+                    "data", "ensamble", "cambios",
+                    f"ensemble_{var}_{agregacion}_{ssp}_{base}_centro-{centro}.nc"))
+                    for ssp in ("ssp245", "ssp585"))
+                if hay_datos:
+                    combinaciones.extend((var, agregacion, base, centro, umbral)
+                                         for umbral in UMBRALES)
+    return combinaciones
+
+def renderizar_cambios(modelos, var, agregacion, ssp, base, centro, significancia):
+    """Renderiza (si hace falta) el PNG de un mapa de cambios."""
+    clave = clave_cambios(modelos, var, agregacion, ssp, base, centro, significancia)
+    if os.path.exists(os.path.join(FIGURAS_DIR, f"{clave}.png")):
+        print("  Ya existe, saltando...")
+        return True
+    try:
+        figura_cambios_png(modelos, var, agregacion, ssp, base, centro, significancia)
+        return True
+    except Exception as e:
+        print(f"  Error: {e}")
+        return False
+
+def renderizar_promedio(var, agregacion, base, centro, umbral):
+    """Genera (si hace falta) el JSON del gráfico de promedio."""
+    clave = clave_promedio(var, agregacion, base, centro, umbral)
+    if os.path.exists(os.path.join(FIGURAS_DIR, f"{clave}.json")):
+        print("  Ya existe, saltando...")
+        return True
+    try:
+        figura_promedio_json(var, agregacion, base, centro, umbral)
+        return True
+    except Exception as e:
+        print(f"  Error: {e}")
+        return False
+
+# ============================================================
+# EJECUCIÓN
+# ============================================================
+def main():
+    parser = crear_parser("Prerenderizado de figuras del dashboard")
+    parser.add_argument("--modelos", nargs="+", default=None,
+                        help="Selección de modelos adicional a prerenderizar")
+    parser.add_argument("--no-purgar", action="store_true",
+                        help="No borrar las figuras que no corresponden a la matriz actual")
+    parser.add_argument("--limite-mb", type=float, default=None,
+                        help="Tamaño máximo de la caché de figuras (borra las menos usadas)")
+    args = parser.parse_args()
+    configurar_perfilado(args)
+
+    selecciones = selecciones_modelos(obtener_lista_modelos(), args.modelos)
+    print(f"Selecciones de modelos: {len(selecciones)}")
+
+    cambios = combinaciones_cambios(selecciones)
+    promedio = combinaciones_promedio()
+
+    r1 = ejecutar_combinaciones(renderizar_cambios, cambios, args.workers,
+                                titulo="Figuras CAMBIOS")
+    r2 = ejecutar_combinaciones(renderizar_promedio, promedio, args.workers,
+                                titulo="Figuras PROMEDIO")
+
+    vigentes = None
+    if not args.no_purgar:
+        vigentes = ([clave_cambios(*c) for c in cambios] +
+                    [clave_promedio(*c) for c in promedio])
+    if vigentes is not None or args.limite_mb is not None:
+        borradas = purgar_figuras(vigentes, args.limite_mb)
+        print(f"  -> Figuras obsoletas borradas: {borradas}")
+
+    print(f"\n✓ Proceso completado. Éxitos: {r1['exitos'] + r2['exitos']}/"
+          f"{len(cambios) + len(promedio)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,181 @@
+#!/usr/bin/env python
+# coding: utf-8
+"""
+01_preproc_pipeline.py - Preprocesamiento completo en una sola corrida
+Equivale a ejecutar en orden 01_preproc_01_dep.py, _02_cambio.py,
+_03_ens_cdo.py y _04_toe.py, pero como un grafo de etapas sobre artefactos
+(aux_grafo):
+- Los archivos de data/modelos_agre se listan una sola vez y cada script
+  planifica sus salidas pendientes con un único manifiesto
+- Las etapas de una misma variable y agregación (series y cambios de cada
+  modelo, ensambles, cambios de los ensambles y TOE) forman un componente
+  que lee cada archivo de modelo una sola vez y lo comparte entre todas
+- Los componentes, independientes entre sí, se ejecutan en paralelo; entre
+  procesos y corridas los archivos se comparten a través de la caché de
+  entradas mapeada en memoria (aux_cache_entradas)
+La configuración (REF_PERIODS, CENTER_YEARS, resolución...) es la de cada
+script. Para entradas más grandes que la memoria, ejecutar los scripts por
+separado con --lazy.
+"""
+import os
+import sys
+
+# Añadir carpeta src al path
+sys.path.append(os.path.join(os.path.dirname(__file__), "src"))
+from aux_grafo import etapa, cargar_script, ejecutar_grafo
+from aux_paralelo import crear_parser
+from aux_perfilado import configurar_perfilado
+from aux_cache_entradas import configurar_cache_entradas, purgar_cache_entradas
+from aux_manifiesto import (agregar_argumento_forzar, cargar_manifiesto, guardar_manifiesto,
+                            registrar)
+from aux_almacen import consolidar_almacen
+from aux_catalogo import actualizar_catalogo
+
+# ============================================================
+# CONFIGURACIÓN
+# ============================================================
+BASE_DIR = "data"
+DIR_SCRIPTS = os.path.dirname(os.path.abspath(__file__))
+SCRIPT_SERIES = os.path.join(DIR_SCRIPTS, "01_preproc_01_dep.py")
+SCRIPT_CAMBIOS = os.path.join(DIR_SCRIPTS, "01_preproc_02_cambio.py")
+SCRIPT_ENSAMBLES = os.path.join(DIR_SCRIPTS, "01_preproc_03_ens_cdo.py")
+SCRIPT_TOE = os.path.join(DIR_SCRIPTS, "01_preproc_04_toe.py")
+
+# ============================================================
+# CONSTRUCCIÓN DEL GRAFO
+# ============================================================
+
+def construir_etapas(manifiesto, archivos_nc, forzar=False, usar_cdo=False):
+    """
+    Etapas pendientes de los cuatro scripts según el manifiesto.
+
+    Returns:
+        (lista de etapas, planes para registrar() al terminar)
+    """
+    series = cargar_script(SCRIPT_SERIES)
+    cambios = cargar_script(SCRIPT_CAMBIOS)
+    ensambles = cargar_script(SCRIPT_ENSAMBLES)
+    toe = cargar_script(SCRIPT_TOE)
+    mod_dir = series.MOD_DIR
+
+    etapas = []
+    planes = []
+
+    # 1. Series por departamento (una por archivo)
+    plan, pendientes = series.planificar_series(manifiesto, archivos_nc, forzar)
+    planes.append(plan)
+    for archivo_nc, in pendientes:
+        dims = series.extraer_dimensiones_archivo(archivo_nc)
+        etapas.append(etapa(
+            'series', f"series {archivo_nc}", SCRIPT_SERIES, 'procesar_archivo',
+            args=(archivo_nc,),
+            produce=[series.ruta_salida(dims)],
+            requiere=[os.path.join(mod_dir, archivo_nc)],
+            grupo=f"{dims['variable']}_{dims['agregacion']}"))
+
+    # 2. Cambios y significancia por modelo (periodos base y años centro pendientes)
+    plan, pendientes = cambios.planificar_cambios(manifiesto, archivos_nc, forzar)
+    planes.append(plan)
+    for modelo, var, agg, ssp, ventanas in pendientes:
+        etapas.append(etapa(
+            'cambios', f"cambios {modelo}_{var}_{agg}_{ssp}", SCRIPT_CAMBIOS,
+            'procesar_combinacion',
+            args=(modelo, var, agg, ssp, ventanas),
+            produce=[r for ref, cy in ventanas
+                     for r in cambios.rutas_salida(modelo, var, agg, ssp, ref, cy)],
+            requiere=[os.path.join(mod_dir, f"{var}_{agg}_{modelo}_{ssp}.nc")],
+            grupo=f"{var}_{agg}"))
+
+    # 3. Ensambles y sus cambios (los cambios esperan al ensemble si se recalcula)
+    combinaciones = ensambles.obtener_combinaciones_unicas(archivos_nc)
+    plan, pendientes = ensambles.planificar_ensambles(manifiesto, combinaciones, forzar)
+    planes.append(plan)
+    for var, agg, ssp, rehacer, ventanas in pendientes:
+        ruta_ensemble = ensambles.ruta_ensemble_bruto(var, agg, ssp)
+        if rehacer:
+            etapas.append(etapa(
+                'ensemble', f"ensemble {var}_{agg}_{ssp}", SCRIPT_ENSAMBLES,
+                'calcular_ensemble',
+                args=(var, agg, ssp, usar_cdo),
+                produce=[ruta_ensemble],
+                requiere=ensambles.buscar_archivos_miembros(mod_dir, var, agg, ssp),
+                grupo=f"{var}_{agg}"))
+        if ventanas:
+            etapas.append(etapa(
+                'cambios_ensemble', f"cambios ensemble_{var}_{agg}_{ssp}", SCRIPT_ENSAMBLES,
+                'procesar_cambios_ensemble',
+                args=(ruta_ensemble, var, agg, ssp, ventanas),
+                produce=[r for ref, cy in ventanas
+                         for r in ensambles.rutas_cambios(var, agg, ssp, ref, cy)],
+                requiere=[ruta_ensemble],
+                grupo=f"{var}_{agg}"))
+
+    # 4. Time of Emergence (todos los modelos de ambos escenarios)
+    combinaciones = toe.obtener_combinaciones(archivos_nc)
+    plan, pendientes = toe.planificar_toe(manifiesto, combinaciones, forzar)
+    planes.append(plan)
+    for var, agg, umbrales in pendientes:
+        etapas.append(etapa(
+            'toe', f"toe {var}_{agg}", SCRIPT_TOE, 'procesar_variable',
+            args=(var, agg, umbrales),
+            produce=[toe.ruta_toe(var, agg)],
+            requiere=toe.archivos_entrada(var, agg),
+            grupo=f"{var}_{agg}"))
+
+    return etapas, planes
+
+
+# ============================================================
+# EJECUCIÓN PRINCIPAL
+# ============================================================
+
+def main():
+    parser = crear_parser("Preprocesamiento completo: series, cambios, ensambles y TOE",
+                          cache_entradas=True)
+    parser.add_argument("--cdo", action="store_true",
+                        help="Calcular los ensambles con `cdo ensmean` en lugar de NumPy")
+    agregar_argumento_forzar(parser)
+    args = parser.parse_args()
+    configurar_perfilado(args)
+    configurar_cache_entradas(args)
+
+    mod_dir = cargar_script(SCRIPT_SERIES).MOD_DIR
+    print(f"Buscando archivos en: {mod_dir}")
+    archivos_nc = sorted(f for f in os.listdir(mod_dir) if f.endswith('.nc'))
+
+    if not archivos_nc:
+        print("No se encontraron archivos .nc en la ruta especificada")
+        return
+
+    print(f"Se encontraron {len(archivos_nc)} archivos")
+
+    manifiesto = cargar_manifiesto()
+    etapas, planes = construir_etapas(manifiesto, archivos_nc, args.forzar, args.cdo)
+
+    conteo = {}
+    for e in etapas:
+        conteo[e['tipo']] = conteo.get(e['tipo'], 0) + 1
+    print("Etapas pendientes: " + (", ".join(f"{tipo} {n}" for tipo, n in conteo.items())
+                                   or "ninguna"))
+
+    ejecutar_grafo(etapas, args.workers, titulo="Pipeline de preprocesamiento")
+
+    for plan in planes:
+        registrar(manifiesto, plan)
+    guardar_manifiesto(manifiesto)
+
+    # Copias decodificadas de archivos de modelo que ya no existen o cambiaron
+    purgar_cache_entradas([os.path.join(mod_dir, a) for a in archivos_nc])
+
+    # Consolidar deltas y p-values en un almacén por variable_agregación
+    cambios = cargar_script(SCRIPT_CAMBIOS)
+    consolidar_almacen(cambios.OUT_CAMBIOS, cambios.OUT_SIGNIF, cambios.OUT_ALMACEN)
+
+    # Registrar las salidas en el catálogo del dashboard
+    actualizar_catalogo(BASE_DIR)
+
+    print("\n¡Procesamiento completado!")
+
+
+if __name__ == "__main__":
+    main()
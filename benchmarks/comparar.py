@@ -0,0 +1,103 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+"""
+comparar.py - Compara dos resultados de ejecutar_benchmarks.py (p. ej. dos commits)
+
+Empareja configuraciones (resolución, modelos, años, archivos) y mediciones (etapa o
+función del dashboard) y muestra la razón nuevo/base de tiempo y memoria.
+Sale con código 1 si alguna medición empeora más que el umbral.
+
+Uso:
+    python benchmarks/comparar.py base.json nuevo.json --umbral 0.10
+"""
+import sys
+import json
+import argparse
+
+# ============================================================
+# FUNCIONES
+# ============================================================
+def _clave_configuracion(conf):
+    # Con los archivos presentes no se comparan corridas con otras variables/agregaciones
+    return (conf['resolucion'], conf['modelos'], conf['anios'], conf['archivos'])
+
+def mediciones(conf):
+    """{nombre: {métrica: valor}} de una configuración."""
+    out = {}
+    for e in conf.get('etapas', []):
+        if e.get('ok'):
+            out[e['etapa']] = {'segundos': e['segundos'], 'memoria_mb': e['memoria_pico_mb']}
+    for d in conf.get('dashboard', []):
+        if d.get('ok'):
+            out[f"dashboard:{d['funcion']}"] = {
+                'segundos': d['frio_s'], 'caliente_s': d['caliente_s'],
+                'memoria_mb': d['memoria_pico_mb']}
+    return out
+
+def comparar(base, nuevo, umbral):
+    """
+    Imprime la tabla de comparación.
+
+    Returns:
+        Lista de (configuración, medición, métrica, razón) que empeoran más que el umbral
+    """
+    regresiones = []
+    confs_base = {_clave_configuracion(c): c for c in base['configuraciones']}
+
+    for conf in nuevo['configuraciones']:
+        clave = _clave_configuracion(conf)
+        if clave not in confs_base:
+            print(f"\nConfiguración {clave} sin referencia en la base, se omite")
+            continue
+        m_base, m_nuevo = mediciones(confs_base[clave]), mediciones(conf)
+
+        print(f"\nResolución {clave[0]}°, {clave[1]} modelos, {clave[2]} años, "
+              f"{clave[3]} archivos")
+        print(f"  {'medición':<48} {'métrica':<11} {'base':>10} {'nuevo':>10} {'razón':>7}")
+        for nombre in m_nuevo:
+            if nombre not in m_base:
+                continue
+            for metrica, valor in m_nuevo[nombre].items():
+                ref = m_base[nombre].get(metrica)
+                if ref is None or valor is None or ref <= 0:
+                    continue
+                razon = valor / ref
+                marca = ""
+                if razon > 1 + umbral:
+                    marca = "  ▲"
+                    regresiones.append((clave, nombre, metrica, razon))
+                elif razon < 1 - umbral:
+                    marca = "  ▼"
+                print(f"  {nombre:<48} {metrica:<11} {ref:>10.3f} {valor:>10.3f} "
+                      f"{razon:>7.2f}{marca}")
+    return regresiones
+
+# ============================================================
+# EJECUCIÓN
+# ============================================================
+def main():
+    parser = argparse.ArgumentParser(description="Compara dos resultados de benchmark")
+    parser.add_argument("base", help="JSON de referencia")
+    parser.add_argument("nuevo", help="JSON a comparar")
+    parser.add_argument("--umbral", type=float, default=0.10,
+                        help="Fracción de empeoramiento tolerada (0.10 = 10 %%)")
+    args = parser.parse_args()
+
+    with open(args.base) as f:
+        base = json.load(f)
+    with open(args.nuevo) as f:
+        nuevo = json.load(f)
+
+    print(f"Base:  {base.get('commit')} ({base.get('fecha')})")
+    print(f"Nuevo: {nuevo.get('commit')} ({nuevo.get('fecha')})")
+
+    regresiones = comparar(base, nuevo, args.umbral)
+    if regresiones:
+        print(f"\n✗ {len(regresiones)} mediciones empeoran más de {args.umbral:.0%}")
+        sys.exit(1)
+    print("\n✓ Sin regresiones")
+
+
+if __name__ == "__main__":
+    main()
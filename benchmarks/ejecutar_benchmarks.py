@@ -0,0 +1,227 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+"""
+ejecutar_benchmarks.py - Benchmark de extremo a extremo del preprocesamiento y el dashboard
+
+Para cada configuración (resolución × número de modelos × años):
+    1. Genera (o reutiliza) datos sintéticos con generar_datos.py
+    2. Borra las salidas previas y ejecuta cada script 01_preproc_* como
+       subproceso, midiendo tiempo de pared y memoria residente máxima
+       (incluye los procesos de trabajo)
+    3. Mide las funciones de carga/render del dashboard (medir_dashboard.py)
+
+Los resultados se guardan en JSON (benchmarks/resultados/) junto con el
+commit y el entorno, para compararlos entre versiones con comparar.py.
+
+Uso:
+    python benchmarks/ejecutar_benchmarks.py --resolucion 0.5 0.25 --modelos 4 10
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import tempfile
+import itertools
+import subprocess
+from datetime import datetime
+
+import numpy as np
+import xarray as xr
+
+from generar_datos import generar, ANIOS_DEFECTO, VARIABLES, AGREGACIONES
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+RAIZ = os.path.dirname(BENCH_DIR)
+
+# ============================================================
+# CONFIGURACIÓN
+# ============================================================
+ETAPAS = {
+    "01": "01_preproc_01_dep.py",
+    "02": "01_preproc_02_cambio.py",
+    "03": "01_preproc_03_ens_cdo.py",
+    "04": "01_preproc_04_toe.py",
+    "05": "01_preproc_05_figuras.py",
+    # 01–04 en una sola corrida (medir por separado: --etapas pipeline)
+    "pipeline": "01_preproc_pipeline.py",
+}
+ETAPAS_DEFECTO = ["01", "02", "03", "04"]
+# Directorios de data/ que no son salidas (se conservan entre corridas)
+ENTRADAS = {"modelos_agre", "geo"}
+RESULTADOS_DIR = os.path.join(BENCH_DIR, "resultados")
+VERSION_RESULTADOS = 1
+
+# ============================================================
+# FUNCIONES
+# ============================================================
+def info_commit():
+    """Commit actual del repositorio (y si hay cambios sin confirmar)."""
+    try:
+        commit = subprocess.check_output(["git", "rev-parse", "HEAD"], cwd=RAIZ,
+                                         text=True, stderr=subprocess.DEVNULL).strip()
+        estado = subprocess.check_output(["git", "status", "--porcelain", "--untracked-files=no"],
+                                         cwd=RAIZ, text=True, stderr=subprocess.DEVNULL)
+        return {'commit': commit, 'modificado': bool(estado.strip())}
+    except (OSError, subprocess.CalledProcessError):
+        return {'commit': None, 'modificado': None}
+
+def info_entorno():
+    """Versiones y máquina donde se ejecuta el benchmark."""
+    return {
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'xarray': xr.__version__,
+        'plataforma': platform.platform(),
+        'procesador': platform.processor(),
+        'cpus': os.cpu_count(),
+    }
+
+def limpiar_salidas(trabajo):
+    """Borra todo lo generado en data/ salvo las entradas (corrida en frío)."""
+    data_dir = os.path.join(trabajo, "data")
+    for nombre in os.listdir(data_dir):
+        if nombre in ENTRADAS:
+            continue
+        ruta = os.path.join(data_dir, nombre)
+        if os.path.isdir(ruta):
+            shutil.rmtree(ruta)
+        else:
+            os.remove(ruta)
+
+def ejecutar_medido(comando, trabajo, log):
+    """
+    Ejecuta un comando en el directorio de trabajo y devuelve
+    (código de salida, segundos, memoria residente máxima en MB).
+    """
+    with open(log, 'w') as f:
+        t0 = time.perf_counter()
+        proceso = subprocess.Popen(comando, cwd=trabajo, stdout=f, stderr=subprocess.STDOUT)
+        # wait4 devuelve el uso de recursos de ese hijo (y de sus procesos de trabajo)
+        _, estado, uso = os.wait4(proceso.pid, 0)
+        segundos = time.perf_counter() - t0
+    # Estado ya recogido con wait4 (Popen no debe volver a esperarlo)
+    proceso.returncode = os.WEXITSTATUS(estado) if os.WIFEXITED(estado) else -1
+    # ru_maxrss está en KB en Linux y en bytes en macOS
+    escala = 1024 ** 2 if sys.platform == 'darwin' else 1024
+    return proceso.returncode, segundos, uso.ru_maxrss / escala
+
+def medir_etapas(trabajo, etapas, workers):
+    """Ejecuta las etapas del preprocesamiento en orden y mide cada una."""
+    resultados = []
+    for etapa in etapas:
+        script = ETAPAS[etapa]
+        print(f"  [{etapa}] {script}...")
+        log = os.path.join(trabajo, f"log_{etapa}.txt")
+        codigo, segundos, memoria = ejecutar_medido(
+            [sys.executable, os.path.join(RAIZ, script), "--workers", str(workers)],
+            trabajo, log)
+        resultados.append({
+            'etapa': os.path.splitext(script)[0],
+            'segundos': segundos,
+            'memoria_pico_mb': memoria,
+            'ok': codigo == 0,
+        })
+        print(f"      {segundos:.1f} s, {memoria:.0f} MB" + ("" if codigo == 0 else
+                                                           f" (ERROR, ver {log})"))
+    return resultados
+
+def medir_funciones_dashboard(trabajo, repeticiones):
+    """Mide las funciones del dashboard en un subproceso aparte."""
+    salida = os.path.join(trabajo, "dashboard.json")
+    log = os.path.join(trabajo, "log_dashboard.txt")
+    codigo, _, memoria = ejecutar_medido(
+        [sys.executable, os.path.join(BENCH_DIR, "medir_dashboard.py"), salida,
+         "--repeticiones", str(repeticiones)], trabajo, log)
+    if codigo != 0 or not os.path.exists(salida):
+        print(f"  Error midiendo el dashboard (ver {log})")
+        return [], memoria
+    with open(salida) as f:
+        resultados = json.load(f)
+    for r in resultados:
+        if r['ok']:
+            frio, caliente = r.get('cache_frio', {}), r.get('cache_caliente', {})
+            print(f"      {r['funcion']}: frío {r['frio_s']:.3f} s, "
+                  f"caliente {r['caliente_s']:.3f} s, {r['memoria_pico_mb']:.1f} MB, "
+                  f"caché frío {frio.get('aciertos', 0)}/{frio.get('fallos', 0)} "
+                  f"caliente {caliente.get('aciertos', 0)}/{caliente.get('fallos', 0)} "
+                  f"(aciertos/fallos)")
+    return resultados, memoria
+
+def ejecutar_configuracion(trabajo_dir, resolucion, n_modelos, n_anios, args):
+    """Genera datos, ejecuta etapas y dashboard para una configuración."""
+    nombre = f"res{resolucion:g}_mod{n_modelos}_anios{n_anios}"
+    trabajo = os.path.join(trabajo_dir, nombre)
+    print(f"\n{'=' * 60}\nConfiguración {nombre}\n{'=' * 60}")
+
+    t0 = time.perf_counter()
+    info = generar(trabajo, resolucion, n_modelos, n_anios,
+                   args.variables, args.agregaciones)
+    info['generacion_s'] = time.perf_counter() - t0
+    print(f"  Datos: {info['archivos']} archivos, {info['lat']}×{info['lon']} celdas, "
+          f"~{info['mb_entrada']:.0f} MB")
+
+    limpiar_salidas(trabajo)
+    info['etapas'] = medir_etapas(trabajo, args.etapas, args.workers)
+
+    if not args.sin_dashboard:
+        print("  Dashboard...")
+        info['dashboard'], info['dashboard_memoria_pico_mb'] = medir_funciones_dashboard(
+            trabajo, args.repeticiones)
+    return info
+
+# ============================================================
+# EJECUCIÓN
+# ============================================================
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark del preprocesamiento y el dashboard")
+    parser.add_argument("--resolucion", type=float, nargs="+", default=[0.5],
+                        help="Resoluciones de la grilla de entrada (°), p. ej. 0.5 0.25 0.1")
+    parser.add_argument("--modelos", type=int, nargs="+", default=[4],
+                        help="Números de modelos, p. ej. 4 10 40")
+    parser.add_argument("--anios", type=int, nargs="+", default=[ANIOS_DEFECTO],
+                        help="Longitudes del periodo (años desde 1981)")
+    parser.add_argument("--variables", nargs="+", default=VARIABLES)
+    parser.add_argument("--agregaciones", nargs="+", default=AGREGACIONES)
+    parser.add_argument("--etapas", nargs="+", default=ETAPAS_DEFECTO, choices=sorted(ETAPAS),
+                        help="Etapas del preprocesamiento a medir")
+    parser.add_argument("--sin-dashboard", action="store_true",
+                        help="No medir las funciones del dashboard")
+    parser.add_argument("--repeticiones", type=int, default=3,
+                        help="Repeticiones en caliente de cada función del dashboard")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Procesos de trabajo de cada etapa (1 = serial, comparable)")
+    parser.add_argument("--trabajo", default=os.path.join(tempfile.gettempdir(), "benchmarks_e7cc"),
+                        help="Directorio para datos sintéticos y salidas")
+    parser.add_argument("--salida", default=None, help="Archivo JSON de resultados")
+    args = parser.parse_args()
+
+    resultado = {
+        'version': VERSION_RESULTADOS,
+        'fecha': datetime.now().isoformat(timespec='seconds'),
+        'entorno': info_entorno(),
+        'configuraciones': [],
+    }
+    resultado.update(info_commit())
+
+    for resolucion, n_modelos, n_anios in itertools.product(args.resolucion, args.modelos,
+                                                            args.anios):
+        resultado['configuraciones'].append(
+            ejecutar_configuracion(args.trabajo, resolucion, n_modelos, n_anios, args))
+
+    salida = args.salida
+    if salida is None:
+        os.makedirs(RESULTADOS_DIR, exist_ok=True)
+        commit = (resultado['commit'] or "sin-git")[:8]
+        salida = os.path.join(RESULTADOS_DIR,
+                              f"bench_{datetime.now():%Y%m%d-%H%M%S}_{commit}.json")
+    with open(salida, 'w') as f:
+        json.dump(resultado, f, indent=1)
+    print(f"\n✓ Resultados guardados en {salida}")
+
+
+if __name__ == "__main__":
+    main()
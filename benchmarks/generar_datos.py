@@ -0,0 +1,186 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+"""
+generar_datos.py - Datos sintéticos tipo CMIP para los benchmarks
+
+Genera un directorio de trabajo con la misma estructura que espera el
+preprocesamiento:
+
+    {destino}/data/modelos_agre/{variable}_{AGREGACION}_{modelo}_{ssp}.nc
+    {destino}/data/geo/peru32.geojson   (copia del repositorio)
+
+Los archivos imitan a los reales (paso anual el 1 de enero, float64, tiempo en
+días desde el primer año, temperatura con celdas oceánicas en NaN y
+precipitación acumulada positiva), pero con resolución, número de modelos y
+longitud del periodo configurables.
+
+Uso:
+    python benchmarks/generar_datos.py /tmp/bench --resolucion 0.25 --modelos 10
+"""
+import os
+import shutil
+import argparse
+
+import numpy as np
+import pandas as pd
+import xarray as xr
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+GEO_REPO = os.path.join(RAIZ, "data", "geo", "peru32.geojson")
+
+# ============================================================
+# CONFIGURACIÓN
+# ============================================================
+VARIABLES = ["pr", "tasmax", "tasmin"]
+AGREGACIONES = ["ANUAL", "DEF", "MAM", "JJA", "SON"]
+ESCENARIOS = ["ssp245", "ssp585"]
+# Dominio de los archivos reales (grados)
+LAT_MIN, LAT_MAX = -19.0, 1.0
+LON_MIN, LON_MAX = -82.0, -68.0
+ANIO_INICIO = 1981
+ANIOS_DEFECTO = 83                     # 1981-2063, como los archivos reales
+# Tendencia (por año) según escenario
+TENDENCIA_TEMP = {"ssp245": 0.025, "ssp585": 0.045}   # °C
+TENDENCIA_PR = {"ssp245": 0.001, "ssp585": 0.002}     # fracción
+# Fracción del total anual por agregación (precipitación)
+FRACCION_PR = {"ANUAL": 1.0, "DEF": 0.35, "MAM": 0.3, "JJA": 0.1, "SON": 0.25}
+# Desplazamiento estacional de temperatura (°C)
+OFFSET_TEMP = {"ANUAL": 0.0, "DEF": 1.0, "MAM": 0.5, "JJA": -1.5, "SON": 0.0}
+
+# ============================================================
+# FUNCIONES
+# ============================================================
+def nombres_modelos(n_modelos):
+    """Nombres sintéticos sin '_' (el guion bajo separa dimensiones)."""
+    return [f"sint-{i:02d}" for i in range(1, n_modelos + 1)]
+
+def grilla(resolucion):
+    """Latitudes y longitudes de la grilla regular del dominio."""
+    lats = np.round(np.arange(LAT_MIN, LAT_MAX + resolucion / 2, resolucion), 6)
+    lons = np.round(np.arange(LON_MIN, LON_MAX + resolucion / 2, resolucion), 6)
+    return lats, lons
+
+def mascara_oceano(lats, lons):
+    """Celdas al oeste de una costa aproximada de Perú (True = océano)."""
+    LAT, LON = np.meshgrid(lats, lons, indexing='ij')
+    costa = np.where(LAT < -5, -81.0 + (-5.0 - LAT) * 0.85, -81.0)
+    return LON < costa
+
+def campo_base(variable, agregacion, lats, lons, rng):
+    """Climatología espacial suave (lat, lon) de una variable."""
+    LAT, LON = np.meshgrid(lats, lons, indexing='ij')
+    relieve = np.exp(-((LON + 74.0) / 3.0) ** 2)           # cordillera
+    ruido = rng.normal(0, 0.3, size=LAT.shape)
+    if variable == "pr":
+        anual = 300 + 2500 * np.clip((LON + 78.0) / 10.0, 0, 1) + 400 * relieve
+        return FRACCION_PR[agregacion] * anual * np.exp(ruido * 0.2)
+    base = 26.0 + 0.15 * LAT - 18.0 * relieve + OFFSET_TEMP[agregacion] + ruido
+    return base + (6.0 if variable == "tasmax" else -6.0)
+
+def serie_sintetica(variable, agregacion, ssp, lats, lons, anios, semilla):
+    """Arreglo (time, lat, lon) con tendencia, variabilidad interanual y ruido."""
+    rng = np.random.default_rng(semilla)
+    base = campo_base(variable, agregacion, lats, lons, rng)
+    t = np.arange(len(anios), dtype=float)[:, None, None]
+    interanual = rng.normal(0, 1, size=(len(anios), 1, 1))
+
+    if variable == "pr":
+        factor = 1 + TENDENCIA_PR[ssp] * t + 0.15 * interanual
+        datos = base[None] * np.clip(factor, 0.05, None)
+        datos *= rng.gamma(20.0, 1 / 20.0, size=datos.shape)
+        return datos
+
+    datos = (base[None] + TENDENCIA_TEMP[ssp] * t + 0.6 * interanual
+             + rng.normal(0, 0.5, size=(len(anios),) + base.shape))
+    datos[:, mascara_oceano(lats, lons)] = np.nan
+    return datos
+
+def escribir_archivo(ruta, variable, datos, lats, lons, anios):
+    """Escribe un NetCDF con la misma codificación que los archivos reales."""
+    tiempos = pd.to_datetime([f"{a}-01-01" for a in anios])
+    ds = xr.Dataset({variable: (("time", "lat", "lon"), datos)},
+                    coords={"time": tiempos, "lat": lats, "lon": lons})
+    encoding = {"time": {"units": f"days since {anios[0]}-01-01 00:00:00",
+                         "calendar": "proleptic_gregorian"},
+                variable: {"_FillValue": np.nan}}
+    ds.to_netcdf(ruta, encoding=encoding)
+
+def generar(destino, resolucion=1.0, n_modelos=4, n_anios=ANIOS_DEFECTO,
+            variables=VARIABLES, agregaciones=AGREGACIONES, escenarios=ESCENARIOS,
+            semilla=0):
+    """
+    Genera (si no existe ya) el directorio de trabajo con los datos sintéticos.
+    Los NetCDF de modelos_agre que no pertenecen a la configuración pedida
+    (p. ej. de una corrida anterior con otras variables) se borran, para que
+    el preprocesamiento procese exactamente la matriz indicada.
+
+    Returns:
+        Diccionario con el tamaño de la configuración
+    """
+    mod_dir = os.path.join(destino, "data", "modelos_agre")
+    geo_dir = os.path.join(destino, "data", "geo")
+    os.makedirs(mod_dir, exist_ok=True)
+    os.makedirs(geo_dir, exist_ok=True)
+    shutil.copy(GEO_REPO, os.path.join(geo_dir, "peru32.geojson"))
+
+    lats, lons = grilla(resolucion)
+    anios = list(range(ANIO_INICIO, ANIO_INICIO + n_anios))
+    modelos = nombres_modelos(n_modelos)
+
+    esperados = set()
+    for i_mod, modelo in enumerate(modelos):
+        for i_var, variable in enumerate(variables):
+            for i_agg, agregacion in enumerate(agregaciones):
+                for i_ssp, ssp in enumerate(escenarios):
+                    ruta = os.path.join(mod_dir, f"{variable}_{agregacion}_{modelo}_{ssp}.nc")
+                    esperados.add(os.path.basename(ruta))
+                    if os.path.exists(ruta):
+                        continue
+                    # Semilla distinta y reproducible por archivo
+                    semilla_archivo = [semilla, i_mod, i_var, i_agg, i_ssp]
+                    datos = serie_sintetica(variable, agregacion, ssp, lats, lons,
+                                            anios, semilla_archivo)
+                    escribir_archivo(ruta, variable, datos, lats, lons, anios)
+
+    for nombre in os.listdir(mod_dir):
+        if nombre.endswith('.nc') and nombre not in esperados:
+            os.remove(os.path.join(mod_dir, nombre))
+    # Archivos realmente presentes (los que verá el preprocesamiento)
+    n_archivos = sum(1 for nombre in os.listdir(mod_dir) if nombre.endswith('.nc'))
+
+    return {
+        'resolucion': resolucion,
+        'modelos': n_modelos,
+        'anios': n_anios,
+        'variables': list(variables),
+        'agregaciones': list(agregaciones),
+        'lat': len(lats),
+        'lon': len(lons),
+        'archivos': n_archivos,
+        'mb_entrada': n_archivos * len(anios) * len(lats) * len(lons) * 8 / 1024 ** 2,
+    }
+
+# ============================================================
+# EJECUCIÓN
+# ============================================================
+def main():
+    parser = argparse.ArgumentParser(description="Datos sintéticos tipo CMIP para benchmarks")
+    parser.add_argument("destino", help="Directorio de trabajo a generar")
+    parser.add_argument("--resolucion", type=float, default=1.0, help="Resolución (°)")
+    parser.add_argument("--modelos", type=int, default=4, help="Número de modelos")
+    parser.add_argument("--anios", type=int, default=ANIOS_DEFECTO,
+                        help=f"Longitud del periodo desde {ANIO_INICIO} (años)")
+    parser.add_argument("--variables", nargs="+", default=VARIABLES)
+    parser.add_argument("--agregaciones", nargs="+", default=AGREGACIONES)
+    parser.add_argument("--semilla", type=int, default=0)
+    args = parser.parse_args()
+
+    info = generar(args.destino, args.resolucion, args.modelos, args.anios,
+                   args.variables, args.agregaciones, semilla=args.semilla)
+    print(f"✓ {info['archivos']} archivos ({info['lat']}×{info['lon']} celdas, "
+          f"{info['anios']} años, ~{info['mb_entrada']:.0f} MB) en {args.destino}")
+
+
+if __name__ == "__main__":
+    main()
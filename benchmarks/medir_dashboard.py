@@ -0,0 +1,165 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+"""
+medir_dashboard.py - Tiempos y memoria de las funciones de carga/render del dashboard
+
+Se ejecuta con el directorio de trabajo del benchmark como directorio actual
+(los módulos de src/ usan rutas relativas a data/). Cada función se mide:
+    - en frío: con la caché de datos vacía (aux_cache_datos.limpiar_cache)
+    - en caliente: mediana de varias repeticiones
+    - memoria: pico de asignaciones Python/NumPy (tracemalloc) en la llamada en frío
+    - caché: aciertos y fallos de aux_cache_datos en la llamada en frío y en
+      las repeticiones en caliente
+
+Uso (normalmente lo invoca ejecutar_benchmarks.py):
+    python medir_dashboard.py resultado.json --repeticiones 3
+"""
+import os
+import sys
+import io
+import json
+import time
+import argparse
+import tracemalloc
+
+import matplotlib
+matplotlib.use("Agg")
+import matplotlib.pyplot as plt
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(os.path.join(RAIZ, "src"))
+from aux_cache_datos import limpiar_cache, estadisticas_cache
+from aux_geometria import GEO_FILE, obtener_departamentos
+from data_loader_cambios import (cargar_cambios, cargar_significancia,
+                                 cargar_puntos_significancia, obtener_vmin_vmax)
+from data_loader_series import cargar_serie_departamento
+from dashboard_utils import obtener_lista_modelos
+from graficos_cambios import generar_mapa_multimodelo
+from graficos_promedio import generar_mapa_promedio
+from graficos_series import crear_grafico_series
+from estadisticas_series import calcular_estadisticas_periodos
+from mapa_interactivo import crear_mapa_departamentos
+
+# ============================================================
+# CONFIGURACIÓN (selección que se mide)
+# ============================================================
+VARIABLE = "pr"
+AGREGACION = "ANUAL"
+SSP = "ssp245"
+BASE = "1981-2010"            # base de los cambios por modelo (01_preproc_02)
+BASE_ENSAMBLE = "1991-2020"   # base del ensamble (01_preproc_03)
+CENTRO = "2050"
+
+# ============================================================
+# FUNCIONES
+# ============================================================
+def _png_cambios(modelos, significancia):
+    """Carga y renderiza el mapa multimodelo a PNG (vista CAMBIOS sin caché de figuras)."""
+    dict_cambios = cargar_cambios(modelos, VARIABLE, AGREGACION, SSP, BASE, CENTRO)
+    dict_puntos = (cargar_puntos_significancia(modelos, VARIABLE, AGREGACION, SSP, BASE, CENTRO)
+                   if significancia else None)
+    vmin, vmax = obtener_vmin_vmax(VARIABLE)
+    fig = generar_mapa_multimodelo(dict_cambios, dict_puntos, vmin, vmax, VARIABLE,
+                                   agregacion=AGREGACION, sel_base=BASE, ssp=SSP,
+                                   centro=CENTRO)
+    buffer = io.BytesIO()
+    try:
+        fig.savefig(buffer, format='png', dpi=200, bbox_inches='tight')
+    finally:
+        plt.close(fig)
+    return buffer.getvalue()
+
+def _serie(modelos, departamento):
+    df = cargar_serie_departamento(modelos, VARIABLE, AGREGACION, SSP, departamento)
+    if df is None:
+        raise ValueError(f"Sin series para {departamento}")
+    return df
+
+def casos(modelos, departamento):
+    """Lista de (nombre, función sin argumentos) que se miden."""
+    return [
+        ("cargar_cambios",
+         lambda: cargar_cambios(modelos, VARIABLE, AGREGACION, SSP, BASE, CENTRO)),
+        ("cargar_significancia",
+         lambda: cargar_significancia(modelos, VARIABLE, AGREGACION, SSP, BASE, CENTRO)),
+        ("cargar_puntos_significancia",
+         lambda: cargar_puntos_significancia(modelos, VARIABLE, AGREGACION, SSP, BASE, CENTRO)),
+        ("generar_mapa_multimodelo", lambda: _png_cambios(modelos, False)),
+        ("generar_mapa_multimodelo_significancia", lambda: _png_cambios(modelos, True)),
+        ("generar_mapa_promedio",
+         lambda: generar_mapa_promedio(VARIABLE, AGREGACION, BASE_ENSAMBLE, CENTRO).to_json()),
+        ("cargar_serie_departamento", lambda: _serie(modelos, departamento)),
+        ("crear_grafico_series",
+         lambda: crear_grafico_series(_serie(modelos, departamento), departamento, VARIABLE)),
+        ("calcular_estadisticas_periodos",
+         lambda: calcular_estadisticas_periodos(_serie(modelos, departamento).copy(),
+                                                VARIABLE, BASE, f"{CENTRO}_{SSP}")),
+        ("crear_mapa_departamentos",
+         lambda: crear_mapa_departamentos(GEO_FILE, departamento)),
+    ]
+
+def _contadores_cache(previos=None):
+    """Aciertos y fallos de la caché de datos (desde previos, si se indica)."""
+    e = estadisticas_cache()
+    actuales = {'aciertos': e['aciertos'], 'fallos': e['fallos']}
+    if previos is None:
+        return actuales
+    return {k: actuales[k] - previos[k] for k in actuales}
+
+def medir(nombre, funcion, repeticiones):
+    """Mide una función en frío (con memoria) y en caliente."""
+    resultado = {'funcion': nombre, 'ok': True}
+    try:
+        limpiar_cache()
+        contadores = _contadores_cache()
+        tracemalloc.start()
+        t0 = time.perf_counter()
+        funcion()
+        resultado['frio_s'] = time.perf_counter() - t0
+        resultado['memoria_pico_mb'] = tracemalloc.get_traced_memory()[1] / 1024 ** 2
+        tracemalloc.stop()
+        resultado['cache_frio'] = _contadores_cache(contadores)
+        contadores = _contadores_cache()
+
+        tiempos = []
+        for _ in range(repeticiones):
+            t0 = time.perf_counter()
+            funcion()
+            tiempos.append(time.perf_counter() - t0)
+        tiempos.sort()
+        resultado['caliente_s'] = tiempos[len(tiempos) // 2] if tiempos else None
+        resultado['cache_caliente'] = _contadores_cache(contadores)
+    except Exception as e:
+        if tracemalloc.is_tracing():
+            tracemalloc.stop()
+        resultado['ok'] = False
+        resultado['error'] = str(e)
+        print(f"  Error en {nombre}: {e}")
+    return resultado
+
+# ============================================================
+# EJECUCIÓN
+# ============================================================
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de funciones del dashboard")
+    parser.add_argument("salida", help="Archivo JSON de resultados")
+    parser.add_argument("--repeticiones", type=int, default=3,
+                        help="Repeticiones en caliente por función")
+    args = parser.parse_args()
+
+    modelos = obtener_lista_modelos()
+    departamentos = obtener_departamentos()
+    departamento = "LIMA" if "LIMA" in departamentos else departamentos[0]
+
+    resultados = []
+    for nombre, funcion in casos(modelos, departamento):
+        print(f"Midiendo {nombre}...")
+        resultados.append(medir(nombre, funcion, args.repeticiones))
+
+    with open(args.salida, 'w') as f:
+        json.dump(resultados, f, indent=1)
+
+
+if __name__ == "__main__":
+    main()
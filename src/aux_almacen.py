@@ -0,0 +1,201 @@
+#!/usr/bin/env python
+# coding: utf-8
+"""
+aux_almacen.py - Almacén consolidado de cambios y p-values por modelo
+
+Reúne los resultados individuales de data/mod_cambios (.nc) y
+data/mod_significancia (.nc, aux_significancia) en un único NetCDF4 por variable_agregación:
+
+    data/mod_almacen/cambios_{variable}_{agregacion}.nc
+        delta      (model, ssp, base, center_year, lat, lon)
+        pval       (model, ssp, base, center_year, lat, lon)
+        disponible (model, ssp, base, center_year)
+
+Cada mapa (lat, lon) es un chunk sin compresión, de modo que el dashboard
+obtiene cualquier corte con una sola lectura indexada. El atributo 'fuentes'
+lista los archivos con que se construyó: si cambia (p. ej. se borra un
+archivo o un modelo) el almacén se reconstruye aunque las fuentes restantes
+sean más antiguas.
+"""
+
+import os
+from collections import defaultdict
+
+import numpy as np
+import xarray as xr
+
+from aux_paralelo import guardar_atomico
+from aux_significancia import EXTENSION as EXT_SIGNIF, ATRIBUTOS as ATRIBUTOS_PVAL, abrir_significancia
+
+ALMACEN_DIR = os.path.join("data", "mod_almacen")
+DIMS_ALMACEN = ('model', 'ssp', 'base', 'center_year', 'lat', 'lon')
+
+
+def ruta_almacen(variable, agregacion, almacen_dir=ALMACEN_DIR):
+    """
+    Ruta del almacén consolidado para una variable y agregación.
+    """
+    return os.path.join(almacen_dir, f"cambios_{variable}_{agregacion}.nc")
+
+
+def parsear_nombre_cambio(nombre):
+    """
+    Extrae dimensiones de un nombre de salida de cambios/significancia.
+    Formato: {modelo}_{variable}_{agregacion}_{ssp}_{base}_centro-{año}.{ext}
+    """
+    base_name = os.path.splitext(nombre)[0]
+    partes = base_name.split('_')
+
+    if len(partes) != 6 or not partes[5].startswith('centro-'):
+        return None
+    try:
+        centro = int(partes[5].replace('centro-', ''))
+    except ValueError:
+        return None
+
+    return {
+        'modelo': partes[0],
+        'variable': partes[1],
+        'agregacion': partes[2],
+        'ssp': partes[3],
+        'base': partes[4],
+        'centro': centro,
+    }
+
+
+def _lista_fuentes(entradas):
+    """Nombres de los archivos de cambios y p-values de las entradas, uno por línea."""
+    return "\n".join(os.path.basename(r) for _, nc, signif in entradas
+                     for r in (nc, signif) if r is not None)
+
+
+def _fuentes_guardadas(ruta):
+    """Lista de fuentes registrada en un almacén existente (None si no hay)."""
+    try:
+        with xr.open_dataset(ruta) as ds:
+            return ds.attrs.get('fuentes')
+    except Exception:
+        return None
+
+
+def _construir_almacen(variable, agregacion, entradas, ruta):
+    """
+    Escribe el almacén de una variable_agregación a partir de sus entradas
+    (lista de (dims, ruta_nc, ruta_signif)).
+    """
+    modelos = sorted({d['modelo'] for d, _, _ in entradas})
+    ssps = sorted({d['ssp'] for d, _, _ in entradas})
+    bases = sorted({d['base'] for d, _, _ in entradas})
+    centros = sorted({d['centro'] for d, _, _ in entradas})
+
+    # Grilla de referencia: primer archivo de cambios
+    with xr.open_dataset(entradas[0][1]) as ds0:
+        da0 = ds0[f"delta_{variable}"] if f"delta_{variable}" in ds0 else list(ds0.data_vars.values())[0]
+        lat = da0['lat'].values
+        lon = da0['lon'].values
+        attrs_delta = dict(da0.attrs)
+
+    forma = (len(modelos), len(ssps), len(bases), len(centros), len(lat), len(lon))
+    delta = np.full(forma, np.nan, dtype=np.float32)
+    pval = np.full(forma, np.nan, dtype=np.float32)
+    disponible = np.zeros(forma[:4], dtype=np.int8)
+
+    for dims, ruta_nc, ruta_signif in entradas:
+        idx = (modelos.index(dims['modelo']), ssps.index(dims['ssp']),
+               bases.index(dims['base']), centros.index(dims['centro']))
+        try:
+            with xr.open_dataset(ruta_nc) as ds:
+                da = ds[f"delta_{variable}"] if f"delta_{variable}" in ds else list(ds.data_vars.values())[0]
+                if da.shape != (len(lat), len(lon)):
+                    print(f"  -> Advertencia: grilla distinta en {os.path.basename(ruta_nc)}, se omite")
+                    continue
+                delta[idx] = da.transpose('lat', 'lon').values
+            if ruta_signif is not None:
+                pval[idx] = abrir_significancia(ruta_signif).transpose('lat', 'lon').values
+            disponible[idx] = 1
+        except Exception as e:
+            print(f"  -> Error leyendo {os.path.basename(ruta_nc)}: {e}")
+
+    ds_out = xr.Dataset(
+        {
+            'delta': (DIMS_ALMACEN, delta, attrs_delta),
+            'pval': (DIMS_ALMACEN, pval, dict(ATRIBUTOS_PVAL)),
+            'disponible': (DIMS_ALMACEN[:4], disponible),
+        },
+        coords={
+            'model': modelos,
+            'ssp': ssps,
+            'base': bases,
+            'center_year': centros,
+            'lat': lat,
+            'lon': lon,
+        },
+    )
+    ds_out.attrs['variable'] = variable
+    ds_out.attrs['agregacion'] = agregacion
+    ds_out.attrs['fuentes'] = _lista_fuentes(entradas)
+
+    # Un chunk por mapa (lat, lon), sin compresión
+    chunk = (1, 1, 1, 1, len(lat), len(lon))
+    encoding = {
+        'delta': {'chunksizes': chunk, 'zlib': False, '_FillValue': np.nan},
+        'pval': {'chunksizes': chunk, 'zlib': False, '_FillValue': np.nan},
+    }
+
+    guardar_atomico(ruta, lambda tmp: ds_out.to_netcdf(tmp, engine='netcdf4',
+                                                       format='NETCDF4',
+                                                       encoding=encoding))
+    return ruta
+
+
+def consolidar_almacen(dir_cambios, dir_signif, almacen_dir=ALMACEN_DIR):
+    """
+    Consolida los resultados individuales en un almacén por variable_agregación.
+    Solo reconstruye los almacenes cuyas fuentes son más recientes o cambiaron
+    (archivos nuevos o borrados); borra los almacenes que ya no tienen fuentes.
+
+    Returns:
+        Lista de rutas de almacenes (re)escritos
+    """
+    if not os.path.exists(dir_cambios):
+        return []
+
+    grupos = defaultdict(list)
+    for nombre in sorted(os.listdir(dir_cambios)):
+        if not nombre.endswith('.nc'):
+            continue
+        dims = parsear_nombre_cambio(nombre)
+        if dims is None:
+            continue
+        ruta_signif = os.path.join(dir_signif, nombre.replace('.nc', EXT_SIGNIF))
+        grupos[(dims['variable'], dims['agregacion'])].append(
+            (dims, os.path.join(dir_cambios, nombre),
+             ruta_signif if os.path.exists(ruta_signif) else None))
+
+    os.makedirs(almacen_dir, exist_ok=True)
+    escritos = []
+
+    for (variable, agregacion), entradas in sorted(grupos.items()):
+        ruta = ruta_almacen(variable, agregacion, almacen_dir)
+
+        fuentes = [r for _, nc, signif in entradas for r in (nc, signif) if r is not None]
+        if (os.path.exists(ruta)
+                and os.path.getmtime(ruta) >= max(os.path.getmtime(r) for r in fuentes)
+                and _fuentes_guardadas(ruta) == _lista_fuentes(entradas)):
+            continue
+
+        print(f"  -> Consolidando almacén: {os.path.basename(ruta)} ({len(entradas)} campos)")
+        try:
+            escritos.append(_construir_almacen(variable, agregacion, entradas, ruta))
+        except Exception as e:
+            print(f"  -> Error consolidando {variable}_{agregacion}: {e}")
+
+    # Almacenes de variables/agregaciones sin ningún archivo de cambios
+    vigentes = {os.path.basename(ruta_almacen(v, a, almacen_dir)) for v, a in grupos}
+    for nombre in sorted(os.listdir(almacen_dir)):
+        if (nombre.startswith("cambios_") and nombre.endswith(".nc")
+                and nombre not in vigentes):
+            print(f"  -> Borrando almacén sin fuentes: {nombre}")
+            os.remove(os.path.join(almacen_dir, nombre))
+
+    return escritos
@@ -0,0 +1,136 @@
+#!/usr/bin/env python
+# coding: utf-8
+"""
+aux_almacen_series.py - Almacén columnar (Parquet) de series por departamento
+
+Reemplaza los CSV de data/procesados por un conjunto Parquet particionado
+por variable, agregación y escenario, con un archivo por modelo:
+
+    data/series/variable={var}/agregacion={agg}/ssp={ssp}/{modelo}.parquet
+        model (str), department (str), time (timestamp), value (float64)
+
+Las filas están ordenadas por departamento y tiempo, con un row group por
+departamento. Los filtros por modelo y departamento se resuelven con las
+estadísticas de Parquet (pushdown), así que la serie de un departamento
+para varios modelos lee solo un row group de cada archivo.
+"""
+
+import os
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+from aux_paralelo import guardar_atomico
+
+SERIES_DIR = os.path.join("data", "series")
+COMPRESION = 'zstd'
+
+
+def ruta_particion(variable, agregacion, ssp, series_dir=SERIES_DIR):
+    """
+    Directorio de la partición variable/agregación/escenario.
+    """
+    return os.path.join(series_dir, f"variable={variable}",
+                        f"agregacion={agregacion}", f"ssp={ssp}")
+
+
+def ruta_serie(modelo, variable, agregacion, ssp, series_dir=SERIES_DIR):
+    """
+    Archivo Parquet de un modelo dentro de su partición.
+    """
+    return os.path.join(ruta_particion(variable, agregacion, ssp, series_dir),
+                        f"{modelo}.parquet")
+
+
+def tabla_larga(df, modelo):
+    """
+    Convierte un DataFrame ancho (time × departamento) en la tabla larga
+    (model, department, time, value), ordenada por departamento y tiempo.
+    """
+    departamentos = sorted(df.columns)
+    tiempos = pd.DatetimeIndex(df.index).values.astype('datetime64[ns]')
+    n_tiempos, n_depas = len(tiempos), len(departamentos)
+
+    valores = df[departamentos].to_numpy(dtype=np.float64).T.ravel()
+    indices_depa = np.repeat(np.arange(n_depas, dtype=np.int32), n_tiempos)
+
+    return pa.table({
+        'model': pa.DictionaryArray.from_arrays(
+            pa.array(np.zeros(n_depas * n_tiempos, dtype=np.int32)), pa.array([modelo])),
+        'department': pa.DictionaryArray.from_arrays(
+            pa.array(indices_depa), pa.array(departamentos, pa.string())),
+        'time': pa.array(np.tile(tiempos, n_depas), pa.timestamp('ns')),
+        'value': pa.array(valores, pa.float64()),
+    })
+
+
+def guardar_serie(df, modelo, variable, agregacion, ssp, series_dir=SERIES_DIR):
+    """
+    Guarda las series (time × departamento) de un modelo en el almacén,
+    con un row group por departamento.
+
+    Returns:
+        Ruta del archivo escrito
+    """
+    ruta = ruta_serie(modelo, variable, agregacion, ssp, series_dir)
+    os.makedirs(os.path.dirname(ruta), exist_ok=True)
+    tabla = tabla_larga(df, modelo)
+    filas_grupo = max(len(df.index), 1)
+
+    guardar_atomico(ruta, lambda tmp: pq.write_table(
+        tabla, tmp, row_group_size=filas_grupo, compression=COMPRESION))
+    return ruta
+
+
+def _a_ancho(tabla, columna):
+    """Tabla larga -> DataFrame ancho (time × columna)."""
+    df = tabla.to_pandas()
+    if df.empty:
+        return None
+    df[columna] = df[columna].astype(str)
+    ancho = df.pivot(index='time', columns=columna, values='value')
+    ancho.columns.name = None
+    return ancho
+
+
+def leer_modelo(ruta):
+    """
+    Lee el archivo de un modelo completo como DataFrame (time × departamento).
+    """
+    return _a_ancho(pq.read_table(ruta, columns=['department', 'time', 'value']),
+                    'department')
+
+
+def leer_departamento(particion, departamento, modelos=None):
+    """
+    Serie de un departamento para varios modelos, leyendo solo los row groups
+    que cumplen el filtro.
+
+    Args:
+        particion: Directorio variable/agregación/escenario
+        departamento: Nombre del departamento
+        modelos: Modelos a leer (None = todos los de la partición)
+
+    Returns:
+        DataFrame (time × modelo) en el orden de `modelos`, o None si no hay datos
+    """
+    filtro = ds.field('department') == departamento
+    if modelos is None:
+        fuente = particion
+    else:
+        # Poda de archivos por modelo antes de abrirlos
+        fuente = [os.path.join(particion, f"{mod}.parquet") for mod in modelos]
+        fuente = [ruta for ruta in fuente if os.path.exists(ruta)]
+        if not fuente:
+            return None
+        filtro = filtro & ds.field('model').isin(list(modelos))
+
+    dataset = ds.dataset(fuente, format='parquet')
+    ancho = _a_ancho(dataset.to_table(columns=['model', 'time', 'value'], filter=filtro),
+                     'model')
+    if ancho is None or modelos is None:
+        return ancho
+    return ancho[[mod for mod in modelos if mod in ancho.columns]]
@@ -0,0 +1,150 @@
+#!/usr/bin/env python
+# coding: utf-8
+"""
+aux_cache_datos.py - Caché de datos compartida por todo el proceso del dashboard
+
+Streamlit vuelve a ejecutar main() en cada interacción. Las funciones
+data_loader_* leen sus archivos a través de esta caché, de modo que cada
+archivo se decodifica una sola vez y todas las sesiones del servidor
+comparten los mismos arreglos.
+
+    - Clave: ruta absoluta + mtime + tamaño del archivo (+ parámetros del lector)
+    - Presupuesto de memoria configurable con expulsión LRU
+    - Contadores de aciertos / fallos / expulsiones
+
+Los arreglos NumPy que se devuelven son de solo lectura: se comparten entre
+sesiones y no deben modificarse en su lugar.
+"""
+
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+import xarray as xr
+
+# Presupuesto de memoria (MB); se puede fijar con la variable de entorno DASHBOARD_CACHE_MB
+MEMORIA_MAX_MB = float(os.environ.get("DASHBOARD_CACHE_MB", 512))
+
+_entradas = OrderedDict()   # clave -> (valor, bytes)
+_lock = threading.Lock()
+_estado = {
+    'memoria_max': int(MEMORIA_MAX_MB * 1024 ** 2),
+    'bytes': 0,
+    'aciertos': 0,
+    'fallos': 0,
+    'expulsiones': 0,
+}
+
+
+def _tamano(valor):
+    """Memoria aproximada (bytes) de un valor cacheado."""
+    if valor is None:
+        return 0
+    if isinstance(valor, (xr.DataArray, xr.Dataset)):
+        return int(valor.nbytes)
+    if isinstance(valor, pd.DataFrame):
+        return int(valor.memory_usage(index=True).sum())
+    if isinstance(valor, np.ndarray):
+        return int(valor.nbytes)
+    if isinstance(valor, (bytes, str)):
+        return len(valor)
+    if isinstance(valor, dict):
+        return sum(_tamano(v) for v in valor.values())
+    return 0
+
+
+def _solo_lectura(valor):
+    """Marca como no escribibles los arreglos NumPy compartidos."""
+    if isinstance(valor, np.ndarray):
+        valor.flags.writeable = False
+    elif isinstance(valor, xr.DataArray):
+        _solo_lectura(valor.values)
+    elif isinstance(valor, xr.Dataset):
+        for v in valor.data_vars.values():
+            _solo_lectura(v)
+    elif isinstance(valor, dict):
+        for v in valor.values():
+            _solo_lectura(v)
+    return valor
+
+
+def _expulsar():
+    """Expulsa las entradas menos usadas hasta cumplir el presupuesto (con el lock tomado)."""
+    while _estado['bytes'] > _estado['memoria_max'] and len(_entradas) > 1:
+        _, (_, tam) = _entradas.popitem(last=False)
+        _estado['bytes'] -= tam
+        _estado['expulsiones'] += 1
+
+
+def configurar_memoria(memoria_mb):
+    """
+    Cambia el presupuesto de memoria de la caché (MB).
+    """
+    with _lock:
+        _estado['memoria_max'] = int(float(memoria_mb) * 1024 ** 2)
+        _expulsar()
+
+
+def limpiar_cache():
+    """
+    Vacía la caché (los contadores se conservan).
+    """
+    with _lock:
+        _entradas.clear()
+        _estado['bytes'] = 0
+
+
+def estadisticas_cache():
+    """
+    Devuelve aciertos, fallos, expulsiones, entradas y memoria usada.
+    """
+    with _lock:
+        total = _estado['aciertos'] + _estado['fallos']
+        return {
+            'aciertos': _estado['aciertos'],
+            'fallos': _estado['fallos'],
+            'expulsiones': _estado['expulsiones'],
+            'tasa_aciertos': _estado['aciertos'] / total if total else 0.0,
+            'entradas': len(_entradas),
+            'memoria_mb': _estado['bytes'] / 1024 ** 2,
+            'memoria_max_mb': _estado['memoria_max'] / 1024 ** 2,
+        }
+
+
+def cargar_con_cache(ruta, lector, *parametros):
+    """
+    Devuelve lector(ruta, *parametros) desde la caché si el archivo no cambió.
+
+    Args:
+        ruta: Archivo que se lee (su mtime y tamaño forman parte de la clave)
+        lector: Función que abre el archivo y devuelve datos ya cargados en memoria
+        parametros: Argumentos adicionales del lector (también forman la clave)
+
+    Returns:
+        El valor devuelto por el lector (compartido; no modificar en su lugar)
+    """
+    info = os.stat(ruta)
+    clave = (os.path.abspath(ruta), info.st_mtime_ns, info.st_size,
+             getattr(lector, '__qualname__', repr(lector)), parametros)
+
+    with _lock:
+        if clave in _entradas:
+            _entradas.move_to_end(clave)
+            _estado['aciertos'] += 1
+            return _entradas[clave][0]
+        _estado['fallos'] += 1
+
+    # La lectura se hace fuera del lock para no bloquear a otras sesiones
+    valor = _solo_lectura(lector(ruta, *parametros))
+    tam = _tamano(valor)
+
+    with _lock:
+        if clave not in _entradas:
+            _entradas[clave] = (valor, tam)
+            _estado['bytes'] += tam
+            _expulsar()
+        else:
+            valor = _entradas[clave][0]
+    return valor
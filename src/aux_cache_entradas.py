@@ -0,0 +1,289 @@
+#!/usr/bin/env python
+# coding: utf-8
+"""
+aux_cache_entradas.py - Entradas decodificadas una sola vez y compartidas por memoria mapeada
+
+Cada archivo de data/modelos_agre lo leían y decodificaban por separado las
+series (01), los cambios (02), el ensemble (03) y el TOE (04). Con esta caché
+el primero que lo abre lo vuelca a data/cache/entradas/<hash del contenido>/
+(un .npy sin comprimir por variable y coordenada, más la estructura del
+dataset); los siguientes, en cualquier script o proceso de trabajo, lo abren
+con np.load(mmap_mode='r'): sin decodificar ni copiar, y las páginas leídas
+se comparten entre procesos a través de la caché del sistema operativo.
+La estructura (nombres, dims, atributos y encoding) se guarda en JSON: leer
+la caché nunca ejecuta pickle.
+
+    - Clave: SHA1 del contenido; el hash se memoriza por ruta + tamaño + mtime
+      en data/cache/entradas/firmas/ para no releer el archivo
+    - Los arreglos conservan el tipo decodificado (float64 si el NetCDF es
+      float64) y son de solo lectura
+    - Archivos con variables no numéricas (p. ej. fechas cftime) se leen del
+      NetCDF como siempre
+    - purgar_cache_entradas() borra las entradas de archivos que ya no existen
+
+Se activa en los scripts 01–04 y en el pipeline (--sin-cache-entradas lo
+desactiva); no se usa en modo --lazy.
+"""
+
+import os
+import json
+import shutil
+import hashlib
+
+import numpy as np
+import xarray as xr
+
+from aux_hash import hash_archivo
+
+CACHE_DIR = os.path.join("data", "cache", "entradas")
+VERSION_CACHE = 2
+ESTRUCTURA = "estructura.json"
+
+# La configuración viaja en variables de entorno, igual que en aux_perfilado
+_ENV_CACHE = "PREPROC_CACHE_ENTRADAS"
+
+
+# ============================================================
+# CONFIGURACIÓN
+# ============================================================
+
+def agregar_argumentos(parser):
+    """
+    Agrega --sin-cache-entradas al parser común de los scripts.
+    """
+    parser.add_argument(
+        "--sin-cache-entradas", action="store_true",
+        help=f"Leer siempre los NetCDF de entrada en lugar de la caché mapeada en {CACHE_DIR}")
+    return parser
+
+
+def configurar_cache_entradas(args):
+    """
+    Activa la caché de entradas salvo que se pida --sin-cache-entradas.
+    """
+    activa = not getattr(args, 'sin_cache_entradas', False)
+    os.environ[_ENV_CACHE] = "1" if activa else "0"
+    return activa
+
+
+def cache_entradas_activa():
+    """True si los scripts leen las entradas a través de la caché."""
+    return os.environ.get(_ENV_CACHE) == "1"
+
+
+# ============================================================
+# CLAVES
+# ============================================================
+
+def _ruta_firma(ruta, cache_dir):
+    """Archivo que memoriza el hash de una ruta con su tamaño y mtime actuales."""
+    info = os.stat(ruta)
+    firma = f"{os.path.abspath(ruta)}|{info.st_size}|{info.st_mtime_ns}"
+    return os.path.join(cache_dir, "firmas", hashlib.sha1(firma.encode()).hexdigest() + ".txt")
+
+
+def hash_entrada(ruta, cache_dir=CACHE_DIR):
+    """
+    SHA1 del contenido de un archivo; solo se relee si cambió su tamaño o mtime.
+    """
+    ruta_firma = _ruta_firma(ruta, cache_dir)
+    try:
+        with open(ruta_firma) as f:
+            return f.read().strip()
+    except OSError:
+        pass
+
+    sha1 = hash_archivo(ruta)
+    try:
+        os.makedirs(os.path.dirname(ruta_firma), exist_ok=True)
+        tmp = f"{ruta_firma}.{os.getpid()}.tmp"
+        with open(tmp, 'w') as f:
+            f.write(sha1)
+        os.replace(tmp, ruta_firma)
+    except OSError as e:
+        print(f"  -> Advertencia: no se pudo memorizar el hash de {ruta}: {e}")
+    return sha1
+
+
+# ============================================================
+# ESCRITURA Y LECTURA
+# ============================================================
+
+def _a_json(valor):
+    """
+    Valor de atributos o encoding en tipos JSON; los tipos que JSON no tiene
+    (tuplas, conjuntos, dtypes y arreglos o escalares NumPy) se marcan para
+    reconstruirlos en _de_json.
+    """
+    if isinstance(valor, dict):
+        return {str(k): _a_json(v) for k, v in valor.items()}
+    if isinstance(valor, tuple):
+        return {'__tupla__': [_a_json(v) for v in valor]}
+    if isinstance(valor, (set, frozenset)):
+        return {'__conjunto__': [_a_json(v) for v in sorted(valor, key=str)]}
+    if isinstance(valor, list):
+        return [_a_json(v) for v in valor]
+    if isinstance(valor, np.dtype):
+        return {'__dtype__': valor.str}
+    if isinstance(valor, (np.ndarray, np.generic)):
+        return {'__numpy__': np.asarray(valor).tolist(), 'dtype': valor.dtype.str,
+                'escalar': isinstance(valor, np.generic)}
+    if valor is None or isinstance(valor, (str, bool, int, float)):
+        return valor
+    raise TypeError(f"{type(valor).__name__} no se puede guardar en la caché")
+
+
+def _de_json(objeto):
+    """object_hook de json.load: reconstruye los valores marcados por _a_json."""
+    if '__tupla__' in objeto:
+        return tuple(objeto['__tupla__'])
+    if '__conjunto__' in objeto:
+        return set(objeto['__conjunto__'])
+    if '__dtype__' in objeto:
+        return np.dtype(objeto['__dtype__'])
+    if '__numpy__' in objeto:
+        valor = np.array(objeto['__numpy__'], dtype=objeto['dtype'])
+        return valor[()] if objeto['escalar'] else valor
+    return objeto
+
+
+def _cacheable(ds):
+    """Solo se vuelcan datasets con todas sus variables numéricas o de fecha."""
+    return all(v.dtype.kind in 'biufcmM' for v in ds.variables.values())
+
+
+def _volcar(ruta, destino):
+    """
+    Decodifica el NetCDF y lo escribe en destino (un .npy por variable y la
+    estructura en ESTRUCTURA). Se escribe en un directorio temporal que
+    luego se renombra: otro proceso nunca ve una entrada a medias.
+
+    Returns:
+        False si el archivo no es cacheable
+    """
+    with xr.open_dataset(ruta) as ds:
+        ds = ds.load()
+    if not _cacheable(ds):
+        return False
+
+    estructura = {
+        'version': VERSION_CACHE,
+        'origen': os.path.basename(ruta),
+        'attrs': dict(ds.attrs),
+        'encoding': dict(ds.encoding),
+        'variables': [],
+    }
+    directorio, nombre = os.path.split(destino)
+    tmp = os.path.join(directorio, f".{nombre}.{os.getpid()}.tmp")
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+    try:
+        for i, (nombre_var, var) in enumerate(ds.variables.items()):
+            np.save(os.path.join(tmp, f"{i}.npy"), np.ascontiguousarray(var.values))
+            estructura['variables'].append({
+                'nombre': nombre_var,
+                'coordenada': nombre_var in ds.coords,
+                'dims': var.dims,
+                'attrs': dict(var.attrs),
+                'encoding': dict(var.encoding),
+            })
+        with open(os.path.join(tmp, ESTRUCTURA), 'w') as f:
+            json.dump(_a_json(estructura), f)
+        if not os.path.exists(os.path.join(destino, ESTRUCTURA)):
+            # Entrada de una versión anterior de la caché
+            shutil.rmtree(destino, ignore_errors=True)
+        try:
+            os.rename(tmp, destino)
+        except OSError:
+            # Otro proceso la escribió primero
+            if not os.path.exists(os.path.join(destino, ESTRUCTURA)):
+                raise
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+    return True
+
+
+def _leer(destino):
+    """Dataset con los arreglos de destino mapeados en memoria (solo lectura)."""
+    with open(os.path.join(destino, ESTRUCTURA)) as f:
+        estructura = json.load(f, object_hook=_de_json)
+    if estructura.get('version') != VERSION_CACHE:
+        return None
+
+    datos, coords = {}, {}
+    for i, info in enumerate(estructura['variables']):
+        ruta = os.path.join(destino, f"{i}.npy")
+        try:
+            valores = np.load(ruta, mmap_mode='r')
+        except ValueError:  # un arreglo vacío no se puede mapear
+            valores = np.load(ruta)
+        variable = xr.Variable(info['dims'], valores, info['attrs'])
+        variable.encoding = info['encoding']
+        (coords if info['coordenada'] else datos)[info['nombre']] = variable
+
+    ds = xr.Dataset(datos, coords=coords, attrs=estructura['attrs'])
+    ds.encoding = estructura['encoding']
+    return ds
+
+
+def abrir_entrada(ruta, cache_dir=CACHE_DIR):
+    """
+    Abre un NetCDF de entrada desde la caché, volcándolo antes si hace falta.
+
+    Returns:
+        Dataset respaldado por arreglos mapeados en memoria (no debe
+        modificarse), o None si el archivo no es cacheable o la caché falla
+        (el llamador lo lee del NetCDF)
+    """
+    try:
+        destino = os.path.join(cache_dir, hash_entrada(ruta, cache_dir)[:20])
+        if not os.path.exists(os.path.join(destino, ESTRUCTURA)):
+            os.makedirs(cache_dir, exist_ok=True)
+            if not _volcar(ruta, destino):
+                return None
+        return _leer(destino)
+    except Exception as e:
+        print(f"  -> Advertencia: caché de entradas no disponible para "
+              f"{os.path.basename(ruta)} ({e}), se lee el NetCDF")
+        return None
+
+
+# ============================================================
+# MANTENIMIENTO
+# ============================================================
+
+def purgar_cache_entradas(rutas_vigentes, cache_dir=CACHE_DIR):
+    """
+    Borra de la caché las entradas que no corresponden a ninguno de los
+    archivos indicados (p. ej. modelos reemplazados o eliminados) y las
+    firmas que apuntan a ellas.
+
+    Returns:
+        Número de entradas borradas
+    """
+    if not os.path.isdir(cache_dir):
+        return 0
+    vigentes = {hash_entrada(r, cache_dir)[:20] for r in rutas_vigentes if os.path.exists(r)}
+
+    borradas = 0
+    for nombre in os.listdir(cache_dir):
+        ruta = os.path.join(cache_dir, nombre)
+        if (nombre != "firmas" and not nombre.startswith('.') and os.path.isdir(ruta)
+                and nombre not in vigentes):
+            shutil.rmtree(ruta, ignore_errors=True)
+            borradas += 1
+
+    dir_firmas = os.path.join(cache_dir, "firmas")
+    if os.path.isdir(dir_firmas):
+        for nombre in os.listdir(dir_firmas):
+            ruta = os.path.join(dir_firmas, nombre)
+            try:
+                with open(ruta) as f:
+                    if f.read().strip()[:20] not in vigentes:
+                        os.remove(ruta)
+            except OSError:
+                pass
+
+    if borradas:
+        print(f"  -> Caché de entradas: {borradas} entradas obsoletas borradas")
+    return borradas
@@ -0,0 +1,245 @@
+#!/usr/bin/env python
+# coding: utf-8
+"""
+aux_cache_figuras.py - Caché de figuras renderizadas (vistas CAMBIOS y PROMEDIO)
+
+Cada figura se identifica por sus parámetros (modelos, variable, agregación,
+base, centro, escenario, umbral de significancia) y por el hash del contenido
+de los archivos de los que sale. Se guarda en data/cache/figuras/:
+
+    - CAMBIOS (matplotlib): PNG ya renderizado
+    - PROMEDIO (Plotly):    JSON de la figura
+
+Si los datos no cambiaron, una vista repetida se sirve directamente desde
+disco (o desde memoria, vía aux_cache_datos). 01_preproc_05_figuras.py
+prerenderiza toda la matriz de opciones y, con purgar_figuras(), borra las
+figuras de datos o parámetros que ya no están vigentes.
+"""
+
+import io
+import os
+
+import matplotlib.pyplot as plt
+
+from aux_hash import hash_contenido
+from aux_paralelo import guardar_atomico
+from aux_cache_datos import cargar_con_cache
+from aux_geometria import GEO_FILE
+from aux_significancia import EXTENSION as EXT_SIGNIF
+from data_loader_cambios import (ALMACEN_DIR, cargar_cambios, cargar_puntos_significancia,
+                                 obtener_vmin_vmax)
+from graficos_cambios import generar_mapa_multimodelo
+from graficos_promedio import generar_mapa_promedio
+
+FIGURAS_DIR = os.path.join("data", "cache", "figuras")
+# Subir al cambiar el aspecto de las figuras (invalida la caché)
+VERSION_FIGURAS = 2
+DPI_PNG = 200
+
+
+def umbral_significancia(significancia):
+    """
+    Umbral de significancia de una figura: None (sin puntos), un umbral o
+    True (el umbral por defecto, 0.05).
+    """
+    if significancia is None or significancia is False:
+        return None
+    if significancia is True:
+        return 0.05
+    return float(significancia)
+
+
+def fuentes_cambios(modelos, var, agregacion, ssp, base, centro, significancia):
+    """
+    Archivos de los que depende el mapa multimodelo de cambios.
+    """
+    rutas = [os.path.join(ALMACEN_DIR, f"cambios_{var}_{agregacion}.nc")]
+    for mod in modelos:
+        nombre = f"{mod}_{var}_{agregacion}_{ssp}_{base}_centro-{centro}"
+        rutas.append(os.path.join("data", "mod_cambios", f"{nombre}.nc"))
+        if significancia:
+            rutas.append(os.path.join("data", "mod_significancia", f"{nombre}{EXT_SIGNIF}"))
+    rutas.append(GEO_FILE)
+    return rutas
+
+
+def fuentes_promedio(variable, agregacion, periodo_base, centro_year):
+    """
+    Archivos de los que depende el gráfico de promedio (3 mapas).
+    """
+    rutas = []
+    for ssp in ("ssp245", "ssp585"):
+        for base in sorted({periodo_base, periodo_base.replace("-", "_")}):
+            nombre = f"ensemble_{variable}_{agregacion}_{ssp}_{base}_centro-{centro_year}"
+            rutas.append(os.path.join("data", "ensamble", "cambios", f"{nombre}.nc"))
+            rutas.append(os.path.join("data", "ensamble", "significancia", f"{nombre}{EXT_SIGNIF}"))
+    rutas.append(os.path.join("data", "mod_toe", f"ensemble_{variable}_{agregacion}_toe.nc"))
+    rutas.append(GEO_FILE)
+    return rutas
+
+
+def _ruta_figura(clave, extension):
+    return os.path.join(FIGURAS_DIR, f"{clave}.{extension}")
+
+
+def _leer_bytes(ruta):
+    with open(ruta, 'rb') as f:
+        return f.read()
+
+
+def _marcar_uso(ruta):
+    """Actualiza la fecha de modificación (orden de uso para purgar_figuras)."""
+    try:
+        os.utime(ruta)
+    except OSError:
+        pass
+
+
+def _guardar_bytes(ruta, contenido):
+    os.makedirs(os.path.dirname(ruta), exist_ok=True)
+
+    def _escribir(tmp):
+        with open(tmp, 'wb') as f:
+            f.write(contenido)
+
+    guardar_atomico(ruta, _escribir)
+
+
+def clave_cambios(modelos, var, agregacion, ssp, base, centro, significancia):
+    """
+    Clave de contenido del mapa de cambios.
+    """
+    parametros = {
+        'vista': 'cambios', 'version': VERSION_FIGURAS, 'dpi': DPI_PNG,
+        'modelos': list(modelos), 'var': var, 'agregacion': agregacion,
+        'ssp': ssp, 'base': base, 'centro': str(centro),
+        'significancia': umbral_significancia(significancia),
+    }
+    return hash_contenido(parametros, fuentes_cambios(
+        modelos, var, agregacion, ssp, base, centro, significancia))
+
+
+def clave_promedio(variable, agregacion, periodo_base, centro_year, umbral=0.05):
+    """
+    Clave de contenido del gráfico de promedio.
+    """
+    parametros = {
+        'vista': 'promedio', 'version': VERSION_FIGURAS,
+        'variable': variable, 'agregacion': agregacion,
+        'base': periodo_base, 'centro': str(centro_year),
+        'umbral': float(umbral),
+    }
+    return hash_contenido(parametros, fuentes_promedio(
+        variable, agregacion, periodo_base, centro_year))
+
+
+def figura_cambios_png(modelos, var, agregacion, ssp, base, centro, significancia=False):
+    """
+    PNG del mapa multimodelo de cambios, desde la caché o renderizado y guardado.
+    significancia: None/False (sin puntos), umbral (0.01, 0.05, 0.10) o True (0.05).
+
+    Returns:
+        Bytes del PNG
+    """
+    ruta = _ruta_figura(clave_cambios(modelos, var, agregacion, ssp, base,
+                                      centro, significancia), "png")
+    if os.path.exists(ruta):
+        _marcar_uso(ruta)
+        return cargar_con_cache(ruta, _leer_bytes)
+
+    dict_cambios = cargar_cambios(modelos, var, agregacion, ssp, base, centro)
+    if not dict_cambios:
+        raise ValueError(f"No hay cambios para {var}_{agregacion} {ssp} {base} centro-{centro}")
+    dict_puntos = None
+    umbral = umbral_significancia(significancia)
+    if umbral is not None:
+        dict_puntos = cargar_puntos_significancia(modelos, var, agregacion, ssp, base,
+                                                  centro, umbral)
+
+    vmin_global, vmax_global = obtener_vmin_vmax(var)
+    fig = generar_mapa_multimodelo(
+        dict_cambios, dict_puntos, vmin_global, vmax_global, var,
+        agregacion=agregacion, sel_base=base, ssp=ssp, centro=centro)
+
+    buffer = io.BytesIO()
+    try:
+        fig.savefig(buffer, format='png', dpi=DPI_PNG, bbox_inches='tight')
+    finally:
+        plt.close(fig)
+
+    png = buffer.getvalue()
+    _guardar_bytes(ruta, png)
+    return png
+
+
+def figura_promedio_json(variable, agregacion, periodo_base, centro_year="2050", umbral=0.05):
+    """
+    JSON de la figura Plotly de promedio, desde la caché o generado y guardado.
+
+    Returns:
+        Texto JSON (plotly.io.from_json lo convierte en figura)
+    """
+    ruta = _ruta_figura(clave_promedio(variable, agregacion, periodo_base, centro_year, umbral),
+                        "json")
+    if os.path.exists(ruta):
+        _marcar_uso(ruta)
+        return cargar_con_cache(ruta, _leer_bytes).decode('utf-8')
+
+    fig = generar_mapa_promedio(
+        variable=variable, agregacion=agregacion,
+        periodo_base=periodo_base, centro_year=centro_year, umbral=umbral)
+
+    contenido = fig.to_json().encode('utf-8')
+    _guardar_bytes(ruta, contenido)
+    return contenido.decode('utf-8')
+
+
+def purgar_figuras(claves_vigentes=None, limite_mb=None, figuras_dir=FIGURAS_DIR):
+    """
+    Borra de la caché las figuras cuya clave no está entre las vigentes
+    (datos regenerados u opciones que ya no se ofrecen) y, si se indica
+    limite_mb, las usadas hace más tiempo (por fecha de modificación) hasta
+    que el directorio quede bajo el límite. Los temporales de escrituras en
+    curso (".*") no se tocan.
+
+    Args:
+        claves_vigentes: Claves a conservar (None: no filtrar por clave)
+        limite_mb: Tamaño máximo del directorio en MB (None: sin límite)
+
+    Returns:
+        Número de figuras borradas
+    """
+    if not os.path.isdir(figuras_dir):
+        return 0
+    vigentes = set(claves_vigentes) if claves_vigentes is not None else None
+
+    borradas = 0
+    restantes = []
+    for nombre in os.listdir(figuras_dir):
+        clave, extension = os.path.splitext(nombre)
+        if nombre.startswith('.') or extension not in (".png", ".json"):
+            continue
+        ruta = os.path.join(figuras_dir, nombre)
+        try:
+            if vigentes is not None and clave not in vigentes:
+                os.remove(ruta)
+                borradas += 1
+            else:
+                estado = os.stat(ruta)
+                restantes.append((estado.st_mtime, estado.st_size, ruta))
+        except OSError:
+            pass
+
+    if limite_mb is not None:
+        total = sum(tamano for _, tamano, _ in restantes)
+        limite = limite_mb * 1024 * 1024
+        for _, tamano, ruta in sorted(restantes):
+            if total <= limite:
+                break
+            try:
+                os.remove(ruta)
+                borradas += 1
+            except OSError:
+                pass
+            total -= tamano
+    return borradas
@@ -12,133 +12,250 @@ from glob import glob
 import os
 import warnings
 
+from aux_paralelo import guardar_atomico
+from aux_perfilado import medir_etapa
+from aux_perezoso import abrir_dataset
+
 warnings.filterwarnings('ignore', message='Degrees of freedom <= 0 for slice')
 
-def polinom(d, var):
-    """Función polinom original exacta."""
-    coef = d.polyfit(dim='time', deg=4, full=True)
-    s_poli = xr.polyval(coord=d.time, coeffs=coef[f'{var}_polyfit_coefficients'])
+# Series (miembro × celda) por bloque en el ajuste por lotes: acota la memoria temporal
+COLUMNAS_BLOQUE = 4096
+
+def _tiempo_numerico(tiempo):
+    """Tiempo como float (ns desde 1970 si es fecha), igual que polyfit/polyval de xarray."""
+    valores = np.asarray(tiempo)
+    if np.issubdtype(valores.dtype, np.datetime64):
+        return (valores - np.datetime64('1970-01-01')).astype('timedelta64[ns]').astype(float)
+    return valores.astype(float)
+
+def _base_polinomica(x, deg=4):
+    """
+    Matriz de Vandermonde escalada como en xarray.polyfit y su factor Q
+    (QR), comunes a todas las series con el mismo eje de tiempo.
+    """
+    lhs = np.vander(x, deg + 1)
+    lhs /= np.sqrt((lhs * lhs).sum(axis=0))
+    Q, _ = np.linalg.qr(lhs)
+    return lhs, Q
+
+def _ajustar_bloque(bloque, lhs, Q):
+    """
+    Curvas ajustadas de un bloque (member, time, celdas) con un único
+    producto matricial, Q (Qᵀ Y). Las series con NaN parciales se ajustan
+    solo con sus datos válidos y las series sin datos quedan en NaN.
+    """
+    valido = ~np.isnan(bloque)
+    completas = valido.all(axis=1)
     
-    residuo0 = ((d[var] / s_poli) * 100) - 100
-    prom_PR = s_poli.sel(time=slice('1981', '2010')).mean(dim='time')
+    proy = Q @ (Q.T @ np.where(valido, bloque, 0.0))
+    proy = np.where(completas[:, None, :], proy, np.nan)
     
-    if 't' in var:
-        delta0 = s_poli - ((s_poli / s_poli) * prom_PR)
-    else:
-        delta0 = ((s_poli / prom_PR) * 100) - 100
+    for m, c in np.argwhere(valido.any(axis=1) & ~completas):
+        ok = valido[m, :, c]
+        coef = np.linalg.lstsq(lhs[ok], bloque[m, ok, c], rcond=None)[0]
+        proy[m, :, c] = lhs @ coef
+    return proy
+
+@medir_etapa()
+def polinom_lote(datasets, var, delta_out, residuo_out, posiciones,
+                 columnas_bloque=COLUMNAS_BLOQUE):
+    """
+    Versión por lotes de polinom: ajusta todos los miembros de una sola vez
+    (una factorización por eje de tiempo distinto) y escribe delta0 y
+    residuo0 de cada miembro en su lugar.
+    
+    Se recorre la grilla por bloques de filas de latitud con unas
+    columnas_bloque series entre todos los miembros: de cada miembro se lee
+    solo el bloque (si el dataset es perezoso o está mapeado no se carga
+    entero), se ajusta y se escribe en la salida. La memoria temporal no
+    depende del número de miembros ni del tamaño de la grilla.
+    
+    Args:
+        datasets: Datasets de los miembros
+        var: Variable a ajustar
+        delta_out, residuo_out: Salidas indexables por miembro; cada una
+            (time, lat, lon) con el eje de tiempo común
+        posiciones: Índices en ese eje de tiempo de los años de cada miembro
+    """
+    grupos = {}
+    for idx, ds in enumerate(datasets):
+        clave = ds['time'].values.tobytes()
+        grupos.setdefault(clave, []).append(idx)
     
-    return delta0, residuo0
+    for indices in grupos.values():
+        variables = [datasets[i][var].transpose('time', 'lat', 'lon').variable
+                     for i in indices]
+        tiempo = datasets[indices[0]]['time'].values
+        lhs, Q = _base_polinomica(_tiempo_numerico(tiempo))
+        anios = pd.DatetimeIndex(tiempo).year
+        en_base = (anios >= 1981) & (anios <= 2010)
+        
+        n_tiempo, n_lat, n_lon = variables[0].shape
+        filas = max(1, columnas_bloque // max(n_lon * len(indices), 1))
+        for a in range(0, n_lat, filas):
+            b = min(a + filas, n_lat)
+            datos = np.stack([np.asarray(v[:, a:b].values, dtype=float)
+                              for v in variables])
+            s_poli = _ajustar_bloque(datos.reshape(len(indices), n_tiempo, -1),
+                                     lhs, Q).reshape(datos.shape)
+            
+            with np.errstate(divide='ignore', invalid='ignore'), warnings.catch_warnings():
+                warnings.simplefilter('ignore', category=RuntimeWarning)
+                prom_PR = np.nanmean(s_poli[:, en_base], axis=1, keepdims=True)
+                residuo0 = ((datos / s_poli) * 100) - 100
+                if 't' in var:
+                    delta0 = s_poli - ((s_poli / s_poli) * prom_PR)
+                else:
+                    delta0 = ((s_poli / prom_PR) * 100) - 100
+            
+            for j, i in enumerate(indices):
+                delta_out[i][posiciones[i], a:b] = delta0[j]
+                residuo_out[i][posiciones[i], a:b] = residuo0[j]
 
+def polinom(d, var):
+    """Función polinom original (un solo miembro, vía polinom_lote)."""
+    ref = d[var].transpose('time', 'lat', 'lon')
+    delta0, residuo0 = np.empty(ref.shape), np.empty(ref.shape)
+    polinom_lote([d], var, [delta0], [residuo0], [np.arange(ref.sizes['time'])])
+    return (xr.DataArray(delta0, dims=ref.dims, coords=ref.coords),
+            xr.DataArray(residuo0, dims=ref.dims, coords=ref.coords))
+
+def _anios(tiempo):
+    """Años de una coordenada temporal."""
+    return pd.DatetimeIndex(np.asarray(tiempo)).year.values
+
+@medir_etapa()
 def parte_1(var, agg, data_dir):
-    """PARTE 1 exacta de tu script - CORREGIDO para usar datetime64."""
+    """
+    PARTE 1 de tu script: delta y residuo de cada miembro más la media y la
+    varianza multimodelo por escenario.
+    
+    Todo se guarda en arreglos preasignados por año (member/ssp, time, lat, lon)
+    que se llenan en su lugar, en vez de acumular con xr.concat.
+    """
     experimentos = ['245', '585']
-    j = 0
-    k = 0
     
+    datasets = {}
     for exp in experimentos:
         files = glob(os.path.join(data_dir, f"{var}_{agg}_*_ssp{exp}*.nc"))
-        i = 0
-        
-        for file in files:
-            ds = xr.open_dataset(file)
-            delta, residuo = polinom(ds, var)
-            
-            if i == 0:
-                delta2 = delta
-            else:
-                delta2 = xr.concat([delta, delta2], dim='time')
-                
-            if j == 0:
-                delta3 = delta
-                residuo4 = residuo
-            else:
-                delta3 = xr.concat([delta, delta3], dim='time')
-                residuo4 = xr.concat([residuo, residuo4], dim='time')
-            
-            j += 1
-            k += 1
-            i += 1
-        
-        delta21 = delta2.sortby('time', ascending=True)
-        
-        # CORRECCIÓN: Convertir años a datetime64 después del groupby
-        var_delta21 = delta21.groupby('time.year').var()
-        prom_delta21 = delta21.groupby('time.year').mean()
-        
-        # Convertir coordenada 'year' (entero) a 'time' (datetime64)
-        var_delta21 = var_delta21.rename({'year': 'time'})
-        var_delta21['time'] = pd.to_datetime(var_delta21['time'].values, format='%Y')
+        datasets[exp] = [abrir_dataset(file) for file in files]
+    
+    miembros = [ds for exp in experimentos for ds in datasets[exp]]
+    k = len(miembros)
+    if k == 0:
+        raise ValueError(f"No hay archivos {var}_{agg} en {data_dir}")
+    
+    for ds in miembros:
+        anios_ds = _anios(ds['time'].values)
+        if len(np.unique(anios_ds)) != len(anios_ds):
+            raise ValueError("Se esperaba un solo paso de tiempo por año en cada archivo")
+    anios = np.unique(np.concatenate([_anios(ds['time'].values) for ds in miembros]))
+    
+    ref = miembros[0][var].transpose('time', 'lat', 'lon')
+    forma = (len(anios), ref.sizes['lat'], ref.sizes['lon'])
+    
+    delta3 = np.full((k,) + forma, np.nan)
+    residuo4 = np.full((k,) + forma, np.nan)
+    lst_var_mdl = np.full((len(experimentos),) + forma, np.nan)
+    lst_prom_mdl = np.full((len(experimentos),) + forma, np.nan)
+    
+    m = 0
+    for e, exp in enumerate(experimentos):
+        inicio = m
         
-        prom_delta21 = prom_delta21.rename({'year': 'time'})
-        prom_delta21['time'] = pd.to_datetime(prom_delta21['time'].values, format='%Y')
+        # Ajuste polinómico de todos los miembros del escenario de una vez,
+        # escrito directamente en delta3/residuo4
+        m += len(datasets[exp])
+        polinom_lote(datasets[exp], var, delta3[inicio:m], residuo4[inicio:m],
+                     [np.searchsorted(anios, _anios(ds['time'].values))
+                      for ds in datasets[exp]])
         
-        if '245' in exp:
-            lst_var_mdl = var_delta21
-            lst_prom_mdl = prom_delta21
-        else:
-            lst_var_mdl = xr.concat([lst_var_mdl, var_delta21], dim='time')
-            lst_prom_mdl = xr.concat([lst_prom_mdl, prom_delta21], dim='time')
+        # Varianza (ddof=0) y media multimodelo por año
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore', category=RuntimeWarning)
+            lst_var_mdl[e] = np.nanvar(delta3[inicio:m], axis=0)
+            lst_prom_mdl[e] = np.nanmean(delta3[inicio:m], axis=0)
+    
+    coords = {'time': pd.to_datetime(anios.astype(str), format='%Y'),
+              'lat': ref['lat'].values, 'lon': ref['lon'].values}
+    dims_ssp = ('ssp', 'time', 'lat', 'lon')
+    dims_mdl = ('member', 'time', 'lat', 'lon')
+    
+    lst_var_mdl = xr.DataArray(lst_var_mdl, dims=dims_ssp, coords={'ssp': experimentos, **coords})
+    lst_prom_mdl = xr.DataArray(lst_prom_mdl, dims=dims_ssp, coords={'ssp': experimentos, **coords})
+    delta3 = xr.DataArray(delta3, dims=dims_mdl, coords=coords)
+    residuo4 = xr.DataArray(residuo4, dims=dims_mdl, coords=coords)
     #print('PARTE 1')
     return lst_var_mdl, lst_prom_mdl, delta3, residuo4, k
 
 
+@medir_etapa()
 def parte_2(lst_var_mdl, lst_prom_mdl, delta3, residuo4):
-    """PARTE 2 exacta de tu script - CORREGIDO para usar datetime64."""
-    var_mdl_2 = lst_var_mdl.sortby('time', ascending=True)
-    prom_mdl_2 = lst_prom_mdl.sortby('time', ascending=True)
-    delta31 = delta3.sortby('time', ascending=True)
-    residuo41 = residuo4.sortby('time', ascending=True)
-    
-    # CORRECCIÓN: Convertir años a datetime64 después del groupby
-    G0 = delta31.groupby('time.year').mean().rename({'year': 'time'})
+    """
+    PARTE 2 de tu script: G (media de todos los miembros), SU (varianza entre
+    escenarios de la media multimodelo) y MU (media entre escenarios de la
+    varianza multimodelo), por año.
+    """
+    G0 = delta3.mean(dim='member')
     G0['time'] = pd.date_range('1981-01-01', periods=len(G0.time), freq='YS')
     
-    SU0 = prom_mdl_2.groupby('time.year').var().rename({'year': 'time'})
+    SU0 = lst_prom_mdl.var(dim='ssp')
     SU0['time'] = pd.date_range('1981-01-01', periods=len(SU0.time), freq='YS')
     
-    MU0 = var_mdl_2.groupby('time.year').mean().rename({'year': 'time'})
+    MU0 = lst_var_mdl.mean(dim='ssp')
     MU0['time'] = pd.date_range('1981-01-01', periods=len(MU0.time), freq='YS')
     print('  Parte 2: Gaea')
-    return G0, SU0, MU0, residuo41
+    return G0, SU0, MU0, residuo4
 
+@medir_etapa()
 def parte_3(residuo41, k):
-    """PARTE 3 exacta de tu script - YA CORREGIDO."""
-    # Extraer años correctamente
-    if hasattr(residuo41.time, 'dt'):
-        years = residuo41.time.dt.year.values
-    else:
-        time_values = residuo41['time'].values
-        years = np.array([pd.to_datetime(str(t)).year for t in time_values])
+    """
+    PARTE 3 de tu script: desviación estándar (ddof=0) del residuo de todos
+    los miembros en ventanas móviles de 30 años, a partir de sumas acumuladas
+    por año (cada ventana cuesta O(1) por celda).
+    """
+    anios = _anios(residuo41['time'].values)
+    datos = residuo41.transpose('member', 'time', 'lat', 'lon').values
+    valido = ~np.isnan(datos)
     
-    year_c = 2010
-    l = 0
+    # Número de miembros con datos en cada año (entradas del eje apilado original)
+    por_anio = valido.any(axis=(2, 3)).sum(axis=0)
+    years = np.repeat(anios, por_anio)
+    n_ventanas = max(len(years) // k - 30, 0)
     
-    for ktime in range(len(years) // k - 30):
-        y_i = years[ktime * k]
-        yi = str(y_i)
-        y_f = y_i + 29
-        yf = str(y_f)
-        
-        residuo42 = residuo41.sel(time=slice(yi, yf))
-        
-        residuo43_std = residuo42.std(dim='time')
-        
-        year_c += 1
-        
-        time_d = pd.date_range(f'{year_c}-01-01', periods=1, freq='YS')
-        time_ds = xr.DataArray(time_d, [('time', time_d)])
-        
-        residuo44_std = residuo43_std.expand_dims(time=time_ds)
-        
-        if l == 0:
-            residuo_45_std = residuo44_std
-        else:
-            residuo_45_std = xr.concat([residuo44_std, residuo_45_std], dim='time')
-        
-        l += 1
+    # Momentos acumulados, centrados en la media de cada celda
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', category=RuntimeWarning)
+        centro = np.nanmean(datos, axis=(0, 1))
+    x = np.where(valido, datos - centro, 0.0)
+    
+    def _acumular(a):
+        return np.concatenate([np.zeros((1,) + a.shape[1:]), np.cumsum(a, axis=0)])
+    
+    cn = _acumular(valido.sum(axis=0).astype(float))
+    cs1 = _acumular(x.sum(axis=0))
+    cs2 = _acumular((x * x).sum(axis=0))
+    
+    # Ventana [y_i, y_i + 29] para cada y_i (años presentes)
+    y_i = years[np.arange(n_ventanas) * k]
+    lo = np.searchsorted(anios, y_i, side='left')
+    hi = np.searchsorted(anios, y_i + 29, side='right')
+    
+    n = cn[hi] - cn[lo]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        media = (cs1[hi] - cs1[lo]) / n
+        varianza = np.maximum((cs2[hi] - cs2[lo]) / n - media ** 2, 0.0)
+    std = np.where(n > 0, np.sqrt(varianza), np.nan)
+    
+    time_d = pd.date_range('2011-01-01', periods=n_ventanas, freq='YS')
+    residuo_45_std = xr.DataArray(
+        std, dims=('time', 'lat', 'lon'),
+        coords={'time': time_d, 'lat': residuo41['lat'].values,
+                'lon': residuo41['lon'].values})
     #print('PARTE 3')
     return residuo_45_std, None  # Solo necesitamos std, no var
 
+@medir_etapa()
 def parte_4(residuo_45_std, G0, SU0, MU0):
     """PARTE 4 exacta de tu script."""
     VI0 = residuo_45_std.sortby('time', ascending=True)
@@ -155,59 +272,77 @@ def parte_4(residuo_45_std, G0, SU0, MU0):
     #print(MU)
     return VI, G, SU, MU
 
-def parte_5(VI, G, SU, MU, var, agg):
-    """PARTE 5 exacta de tu script con umbrales."""
+def umbrales_por_defecto(var):
+    """Umbrales de TOE_1 y TOE_2 según la variable."""
+    return [-1, 1] if var == 'pr' else [1, 2]
+
+def calcular_anio_toe(TOE, tpr=2020):
+    """
+    Año de cada paso (t_TOE): el año del paso donde TOE < año, NaN en otro caso.
+    Solo cuentan los años tpr .. tpr + len(time) - 1, igual que el bucle original.
+    """
+    if hasattr(TOE.time, 'dt'):
+        toe_years = TOE.time.dt.year.values
+    else:
+        toe_years = np.array([pd.to_datetime(str(t)).year for t in TOE['time'].values])
+    
+    years_array = xr.DataArray(toe_years, dims=['time'], coords={'time': TOE.time})
+    en_rango = (years_array >= tpr) & (years_array < tpr + len(TOE.time))
+    return (TOE * np.nan).where(~((TOE < years_array) & en_rango), years_array)
+
+def calcular_toe_umbrales(TOE, t_TOE, umbrales):
+    """
+    Año del primer cruce de cada umbral, en una sola pasada vectorizada.
+    Umbrales negativos se cruzan hacia abajo (TOE < umbral), el resto hacia
+    arriba (TOE > umbral). Sin cruce, o con TOE inicial NaN, el resultado es NaN.
+    
+    Returns:
+        DataArray (umbral, ...) con el año del primer cruce
+    """
+    umbrales = np.asarray(umbrales, dtype=float)
+    TOE = TOE.transpose('time', ...)
+    toe = TOE.values
+    anios = t_TOE.transpose('time', ...).values
+    
+    # Máscara de cruce (umbral, time, ...)
+    u = umbrales.reshape((-1,) + (1,) * toe.ndim)
+    with np.errstate(invalid='ignore'):
+        cruce = np.where(u < 0, toe[None] < u, toe[None] > u)
+    
+    primero = np.argmax(cruce, axis=1)
+    hay_cruce = cruce.any(axis=1) & np.isfinite(toe[0])[None]
+    anio_cruce = np.take_along_axis(
+        np.broadcast_to(anios, cruce.shape), primero[:, None], axis=1)[:, 0]
+    
+    plantilla = TOE.isel(time=0, drop=True)
+    return xr.DataArray(
+        np.where(hay_cruce, anio_cruce, np.nan),
+        dims=('umbral',) + plantilla.dims,
+        coords={'umbral': umbrales, **plantilla.coords},
+    )
+
+@medir_etapa()
+def parte_5(VI, G, SU, MU, var, agg, umbrales=None):
+    """
+    PARTE 5 exacta de tu script con umbrales.
+    TOE_1 y TOE_2 usan los umbrales de la variable; `umbrales` agrega otros
+    (p. ej. [0.5, 1, 1.5, 2, 3]) en la misma pasada, en 'TOE_umbrales'.
+    """
     # Calcular TOE crudo
     TU = VI + MU.values + SU.values
     
     STN = G / (TU.values ** 0.5)
     TOE = G / (VI.values ** 0.5)
     #print(TOE)
-    # Calcular t_TOE - EXACTO como tu script
-    t_TOE = TOE * np.nan
-    tpr = 2020
+    t_TOE = calcular_anio_toe(TOE)
     
-    # CORRECCIÓN: Extraer años de TOE correctamente
-    if hasattr(TOE.time, 'dt'):
-        toe_years = TOE.time.dt.year.values
-    else:
-        toe_years = np.array([pd.to_datetime(str(t)).year for t in TOE['time'].values])
+    # Aplicar umbrales según variable (más los pedidos) en una sola pasada
+    base = umbrales_por_defecto(var)
+    extra = [u for u in (umbrales or []) if u not in base]
+    TOE_umbrales = calcular_toe_umbrales(TOE, t_TOE, base + extra)
     
-    for tpru in range(len(TOE.time)):
-        # Crear DataArray de años para comparación
-        years_array = xr.DataArray(toe_years, dims=['time'], coords={'time': TOE.time})
-        
-        # EXACTA lógica de tu script
-        t_TOE = t_TOE.where(~((TOE < tpr) & (years_array == tpr)), tpr)
-        tpr += 1
-    
-    # Aplicar umbrales según variable - EXACTO como tu código adicional
-    if var == 'pr':
-        for umbr in [-1, 1]:
-            TOE_umbr = TOE[0] * 0
-            for t in range(len(TOE.time)):
-                if umbr == -1:
-                    TOE_umbr = TOE_umbr.where(~((TOE[t] < umbr) & (TOE_umbr <= 0)), t_TOE[t])
-                    TOE_umbralnegativo_pr = TOE_umbr
-                else:
-                    TOE_umbr = TOE_umbr.where(~((TOE[t] > umbr) & (TOE_umbr <= 0)), t_TOE[t])
-                    TOE_umbralpositivo_pr = TOE_umbr
-        
-        TOE_1 = TOE_umbralnegativo_pr.where(~(TOE_umbralnegativo_pr == 0), np.nan)
-        TOE_2 = TOE_umbralpositivo_pr.where(~(TOE_umbralpositivo_pr == 0), np.nan)
-        
-    else:
-        for umbr in [1, 2]:
-            TOE_umbr = TOE[0] * 0
-            for t in range(len(TOE.time)):
-                TOE_umbr = TOE_umbr.where(~((TOE[t] > umbr) & (TOE_umbr <= 0)), t_TOE[t])
-                if umbr == 1:
-                    TOE_u1_tas = TOE_umbr
-                else:
-                    TOE_u2_tas = TOE_umbr
-        
-        TOE_1 = TOE_u1_tas.where(~(TOE_u1_tas == 0), np.nan)
-        TOE_2 = TOE_u2_tas.where(~(TOE_u2_tas == 0), np.nan)
+    TOE_1 = TOE_umbrales.isel(umbral=0, drop=True)
+    TOE_2 = TOE_umbrales.isel(umbral=1, drop=True)
     #print('PARTE 5')
     return {
         'TOE_1': TOE_1,
@@ -217,11 +352,12 @@ def parte_5(VI, G, SU, MU, var, agg):
         'MU': MU.mean(dim='time'),
         'G': G.mean(dim='time'),
         'STN': STN.mean(dim='time'),
-        'TOE_raw': TOE
+        'TOE_raw': TOE,
+        'TOE_umbrales': TOE_umbrales
     }
 
-def calcular_toe_completo(var, agg, data_dir="data/modelos_agre"):
-    """Calcula TOE completo llamando a cada parte."""
+def calcular_toe_completo(var, agg, data_dir="data/modelos_agre", umbrales=None):
+    """Calcula TOE completo llamando a cada parte (umbrales extra opcionales)."""
     print(f"Calculando TOE para {var}_{agg}")
     
     try:
@@ -241,7 +377,7 @@ def calcular_toe_completo(var, agg, data_dir="data/modelos_agre"):
         print(f"  Parte 4: datos preparados")
         
         # Parte 5
-        resultados = parte_5(VI, G, SU, MU, var, agg)
+        resultados = parte_5(VI, G, SU, MU, var, agg, umbrales)
         print(f"  Parte 5: TOE calculado")
         
         return resultados
@@ -258,11 +394,13 @@ def guardar_toe(resultados, output_dir, var, agg):
     ruta_toe = os.path.join(output_dir, f"ensemble_{var}_{agg}_toe.nc")
     ds_toe = xr.Dataset({
         'TOE_1': resultados['TOE_1'],
-        'TOE_2': resultados['TOE_2']
+        'TOE_2': resultados['TOE_2'],
+        # Año de cruce de cada umbral (los de TOE_1/TOE_2 y los adicionales)
+        'TOE_umbrales': resultados['TOE_umbrales']
     })
     ds_toe.attrs['variable'] = var
     ds_toe.attrs['aggregation'] = agg
-    ds_toe.to_netcdf(ruta_toe)
+    guardar_atomico(ruta_toe, ds_toe.to_netcdf)
     
     # Guardar componentes
     ruta_comp = os.path.join(output_dir, f"ensemble_{var}_{agg}_components.nc")
@@ -275,6 +413,6 @@ def guardar_toe(resultados, output_dir, var, agg):
     })
     ds_comp.attrs['variable'] = var
     ds_comp.attrs['aggregation'] = agg
-    ds_comp.to_netcdf(ruta_comp)
+    guardar_atomico(ruta_comp, ds_comp.to_netcdf)
     
     return ruta_toe
\ No newline at end of file
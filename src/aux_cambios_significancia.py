@@ -7,6 +7,9 @@ import xarray as xr
 import numpy as np
 from scipy import stats
 
+from aux_perfilado import medir_etapa
+from aux_perezoso import es_perezoso
+
 def seleccionar_periodo(da, start_year, end_year):
     """
     Selecciona datos dentro de un rango de años.
@@ -45,6 +48,7 @@ def seleccionar_periodo(da, start_year, end_year):
             return da
 
 
+@medir_etapa()
 def calcular_delta(da_hist, da_fut, variable):
     """
     Calcula diferencia entre futuro e histórico.
@@ -68,6 +72,21 @@ def calcular_delta(da_hist, da_fut, variable):
         hist_mean = da_hist.mean(dim=time_dim, skipna=True)
         fut_mean = da_fut.mean(dim=time_dim, skipna=True)
         
+        return calcular_delta_medias(hist_mean, fut_mean, variable)
+        
+    except Exception as e:
+        print(f"  -> Error calculando delta para {variable}: {e}")
+        import traceback
+        traceback.print_exc()
+        return None
+
+
+def calcular_delta_medias(hist_mean, fut_mean, variable):
+    """
+    Calcula el cambio a partir de los campos medios histórico y futuro.
+    Temperatura: diferencia absoluta. Precipitación: cambio porcentual.
+    """
+    try:
         # Verificar que las dimensiones coinciden
         if hist_mean.shape != fut_mean.shape:
             print(f"  -> Advertencia: Formas no coinciden. "
@@ -109,14 +128,67 @@ def calcular_delta(da_hist, da_fut, variable):
         traceback.print_exc()
         return None
 
+def _buscar_dim_tiempo(da):
+    """
+    Devuelve el nombre de la dimensión temporal (o None si no existe).
+    """
+    for dim in ['time', 't', 'year', 'years']:
+        if dim in da.dims:
+            return dim
+    return None
+
+
+def calcular_momentos(arr, axis=0):
+    """
+    Calcula conteo de valores válidos, media y varianza muestral (ddof=1)
+    a lo largo de un eje, ignorando NaN.
+    Devuelve arrays con el eje reducido: (n, media, varianza).
+    """
+    arr = np.asarray(arr, dtype=float)
+    valido = ~np.isnan(arr)
+    n = valido.sum(axis=axis)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        media = np.where(valido, arr, 0.0).sum(axis=axis) / n
+        desvio = np.where(valido, arr - np.expand_dims(media, axis), 0.0)
+        varianza = (desvio ** 2).sum(axis=axis) / (n - 1)
+
+    return n, media, varianza
+
+
+def ttest_welch_momentos(n1, media1, var1, n2, media2, var2):
+    """
+    Prueba t de Welch (dos colas) vectorizada a partir de momentos por celda.
+    Equivale a stats.ttest_ind(equal_var=False) aplicado punto a punto.
+    Las celdas con menos de 2 datos válidos en alguna muestra quedan en NaN.
+    Con momentos de dask la prueba se aplica bloque a bloque.
+    """
+    if es_perezoso(media1) or es_perezoso(media2):
+        import dask.array as dask_array
+        return dask_array.map_blocks(ttest_welch_momentos, n1, media1, var1,
+                                     n2, media2, var2, dtype=np.float64)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        vn1 = var1 / n1
+        vn2 = var2 / n2
+        df = (vn1 + vn2) ** 2 / (vn1 ** 2 / (n1 - 1) + vn2 ** 2 / (n2 - 1))
+        # Si df no está definido (varianzas nulas) su valor no afecta a p
+        df = np.where(np.isnan(df), 1.0, df)
+        t_stat = (media1 - media2) / np.sqrt(vn1 + vn2)
+        pvals = stats.t.sf(np.abs(t_stat), df) * 2
+
+    suficientes = (np.asarray(n1) > 1) & (np.asarray(n2) > 1)
+    return np.where(suficientes, pvals, np.nan)
+
+
+@medir_etapa()
 def calcular_pvals(da_hist, da_fut):
     """
-    Calcula valores p usando prueba t de Student para cada punto de la grilla.
+    Calcula valores p usando prueba t de Student (Welch) para cada punto de la grilla.
+    La prueba se resuelve de forma vectorizada sobre toda la grilla a partir de
+    medias, varianzas y conteos por celda (sin bucles por lat/lon).
     Devuelve array 2D con dimensiones espaciales (lat, lon).
     """
-    import numpy as np
-    from scipy import stats
-
     try:
         # Obtener dimensiones espaciales
         if 'lat' in da_hist.dims and 'lon' in da_hist.dims:
@@ -130,37 +202,15 @@ def calcular_pvals(da_hist, da_fut):
         print(f"  -> Datos históricos shape: {da_hist.shape}")
         print(f"  -> Datos futuros shape: {da_fut.shape}")
 
-        # Inicializar array de p-values con dimensiones espaciales correctas
-        pvals = np.full((n_lat, n_lon), np.nan)
-
-        # Para cada punto de la grilla
-        for i in range(n_lat):
-            for j in range(n_lon):
-                try:
-                    # Extraer series temporales para este punto
-                    hist_series = da_hist.isel(lat=i, lon=j).values
-                    fut_series = da_fut.isel(lat=i, lon=j).values
-
-                    # Remover NaN
-                    hist_series = hist_series[~np.isnan(hist_series)]
-                    fut_series = fut_series[~np.isnan(fut_series)]
-
-                    # Verificar que tenemos suficientes datos
-                    if len(hist_series) > 1 and len(fut_series) > 1:
-                        # Prueba t de Student para dos muestras independientes
-                        t_stat, p_val = stats.ttest_ind(
-                            hist_series,
-                            fut_series,
-                            equal_var=False,
-                            nan_policy='omit'
-                        )
-                        pvals[i, j] = p_val
-                    else:
-                        pvals[i, j] = np.nan
-
-                except Exception as e:
-                    pvals[i, j] = np.nan
-                    continue
+        # Llevar la dimensión temporal al eje 0: (time, lat, lon)
+        hist = _ordenar_tiempo_primero(da_hist)
+        fut = _ordenar_tiempo_primero(da_fut)
+
+        n_h, media_h, var_h = calcular_momentos(hist, axis=0)
+        n_f, media_f, var_f = calcular_momentos(fut, axis=0)
+
+        pvals = ttest_welch_momentos(n_h, media_h, var_h, n_f, media_f, var_f)
+        pvals = pvals.reshape(n_lat, n_lon)
 
         print(f"  -> p-values shape final: {pvals.shape}")
         print(f"  -> p-values min/max: {np.nanmin(pvals):.4f}/{np.nanmax(pvals):.4f}")
@@ -174,3 +224,130 @@ def calcular_pvals(da_hist, da_fut):
         traceback.print_exc()
         # Devolver array con dimensiones por defecto
         return np.full((15, 21), np.nan)
+
+
+def _ordenar_tiempo_primero(da):
+    """
+    Devuelve los valores de la DataArray como array (time, lat, lon).
+    Si la DataArray está respaldada por dask devuelve el arreglo perezoso.
+    """
+    time_dim = _buscar_dim_tiempo(da)
+    if time_dim is None:
+        raise ValueError("No se encontró dimensión temporal")
+
+    if 'lat' in da.dims and 'lon' in da.dims:
+        ordenado = da.transpose(time_dim, 'lat', 'lon')
+    else:
+        ordenado = da.transpose(time_dim, ...)
+    return ordenado.data if ordenado.chunks is not None else ordenado.values
+
+
+def _extraer_anios(valores):
+    """
+    Convierte los valores de la coordenada temporal en años enteros.
+    """
+    valores = np.asarray(valores)
+    if np.issubdtype(valores.dtype, np.datetime64):
+        return valores.astype('datetime64[Y]').astype(int) + 1970
+    if len(valores) > 0 and hasattr(valores[0], 'year'):
+        return np.array([v.year for v in valores])
+    return valores.astype(int)
+
+
+@medir_etapa()
+def calcular_momentos_acumulados(da):
+    """
+    Precalcula, una sola vez por archivo, sumas acumuladas a lo largo del tiempo:
+    conteo de valores válidos, suma y suma de cuadrados por celda.
+    Con esto las estadísticas de cualquier ventana de años (periodo base o
+    ventana futura de cualquier año centro) se obtienen en O(grilla).
+
+    Los datos se centran en la media de toda la serie de cada celda antes de
+    acumular, para evitar pérdida de precisión en la varianza.
+
+    Con una DataArray de dask (un solo bloque en el tiempo) los momentos
+    quedan como grafos perezosos por bloque espacial, igual que todo lo que
+    se derive de ellos (estadisticas_ventana, calcular_cambio_ventanas).
+    """
+    time_dim = _buscar_dim_tiempo(da)
+    if time_dim is None:
+        raise ValueError("No se encontró dimensión temporal")
+
+    da = da.sortby(time_dim)
+    arr = _ordenar_tiempo_primero(da).astype(float, copy=False)
+    valido = ~np.isnan(arr)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        ref = np.where(valido, arr, 0.0).sum(axis=0) / valido.sum(axis=0)
+    ref = np.where(np.isnan(ref), 0.0, ref)
+    x = np.where(valido, arr - ref, 0.0)
+
+    # Plantilla 2D (lat, lon) para devolver campos con coordenadas
+    plantilla = da.isel({time_dim: 0}, drop=True).copy(deep=False)
+    plantilla.attrs = {}
+
+    ceros = np.zeros((1,) + arr.shape[1:])
+    return {
+        'anios': _extraer_anios(da[time_dim].values),
+        'n': np.concatenate([ceros, np.cumsum(valido, axis=0)]),
+        's1': np.concatenate([ceros, np.cumsum(x, axis=0)]),
+        's2': np.concatenate([ceros, np.cumsum(x ** 2, axis=0)]),
+        'ref': ref,
+        'plantilla': plantilla,
+    }
+
+
+def estadisticas_ventana(momentos, start_year, end_year):
+    """
+    Devuelve las estadísticas de la ventana [start_year, end_year] a partir
+    de los momentos acumulados: número de pasos de tiempo, conteo de valores
+    válidos, media y varianza muestral (ddof=1) por celda.
+    """
+    anios = momentos['anios']
+    i0 = np.searchsorted(anios, start_year, side='left')
+    i1 = np.searchsorted(anios, end_year, side='right')
+
+    n = momentos['n'][i1] - momentos['n'][i0]
+    s1 = momentos['s1'][i1] - momentos['s1'][i0]
+    s2 = momentos['s2'][i1] - momentos['s2'][i0]
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        media_c = s1 / n
+        varianza = (s2 - s1 * media_c) / (n - 1)
+    # Redondeos pueden dejar varianzas levemente negativas
+    varianza = np.where(varianza < 0, 0.0, varianza)
+
+    return {
+        'pasos': int(i1 - i0),
+        'n': n,
+        'media': media_c + momentos['ref'],
+        'varianza': varianza,
+    }
+
+
+def campo_ventana(momentos, valores):
+    """
+    Envuelve un campo 2D calculado desde los momentos en una DataArray
+    con las coordenadas espaciales del archivo original.
+    """
+    return momentos['plantilla'].copy(data=valores.reshape(momentos['plantilla'].shape))
+
+
+@medir_etapa()
+def calcular_cambio_ventanas(momentos, stats_hist, stats_fut, variable):
+    """
+    Calcula delta y p-values entre dos ventanas ya resumidas con
+    estadisticas_ventana(). Devuelve (delta DataArray, pvals array 2D).
+    """
+    hist_mean = campo_ventana(momentos, stats_hist['media'])
+    fut_mean = campo_ventana(momentos, stats_fut['media'])
+    delta = calcular_delta_medias(hist_mean, fut_mean, variable)
+
+    pvals = ttest_welch_momentos(
+        stats_hist['n'], stats_hist['media'], stats_hist['varianza'],
+        stats_fut['n'], stats_fut['media'], stats_fut['varianza'])
+    pvals = pvals.reshape(momentos['plantilla'].shape)
+
+    if not es_perezoso(pvals):
+        print(f"  -> Puntos significativos (p<0.05): {np.sum(pvals < 0.05)}")
+    return delta, pvals
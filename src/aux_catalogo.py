@@ -0,0 +1,265 @@
+#!/usr/bin/env python
+# coding: utf-8
+"""
+aux_catalogo.py - Catálogo de artefactos del preprocesamiento
+
+Los scripts 01_preproc_* escriben al terminar data/catalogo.json con una
+entrada por archivo generado (o de entrada):
+
+    {'tipo', 'ruta', 'modelo', 'variable', 'agregacion', 'ssp', 'base',
+     'centro', 'forma', 'checksum', 'mtime', 'tamano'}
+
+El dashboard lo carga una vez por proceso (se recarga solo si cambia el
+archivo) y responde listas desplegables y consultas de disponibilidad desde
+memoria, sin recorrer directorios. Si el catálogo no existe se vuelve a
+leer el disco como antes.
+"""
+
+import os
+import json
+import threading
+
+import numpy as np
+import xarray as xr
+import pyarrow.parquet as pq
+
+from aux_hash import hash_archivo
+from aux_paralelo import guardar_atomico
+from aux_almacen import parsear_nombre_cambio
+
+BASE_DIR = "data"
+CATALOGO_PATH = os.path.join(BASE_DIR, "catalogo.json")
+VERSION_CATALOGO = 1
+
+# Catálogo cargado en este proceso: {'mtime', 'datos', 'por_directorio'}
+_catalogo = {}
+_lock = threading.Lock()
+
+
+# ============================================================
+# DIMENSIONES A PARTIR DEL NOMBRE
+# ============================================================
+
+def _dims_modelo(nombre):
+    """{variable}_{agregacion}_{modelo}_{ssp}.nc"""
+    partes = os.path.splitext(nombre)[0].split('_')
+    if len(partes) < 4:
+        return None
+    return {'variable': partes[0], 'agregacion': partes[1],
+            'modelo': partes[2], 'ssp': partes[3]}
+
+
+def _dims_serie(nombre):
+    """variable={var}/agregacion={agg}/ssp={ssp}/{modelo}.parquet"""
+    *particion, archivo = nombre.split(os.sep)
+    dims = dict(p.split('=', 1) for p in particion if '=' in p)
+    if set(dims) != {'variable', 'agregacion', 'ssp'}:
+        return None
+    dims['modelo'] = os.path.splitext(archivo)[0]
+    return dims
+
+
+def _dims_cambio(nombre):
+    """{modelo}_{variable}_{agregacion}_{ssp}_{base}_centro-{año}.{ext}"""
+    dims = parsear_nombre_cambio(nombre)
+    if dims is None:
+        return None
+    dims['centro'] = str(dims['centro'])
+    return dims
+
+
+def _dims_almacen(nombre):
+    """cambios_{variable}_{agregacion}.nc"""
+    partes = os.path.splitext(nombre)[0].split('_')
+    if len(partes) != 3 or partes[0] != 'cambios':
+        return None
+    return {'variable': partes[1], 'agregacion': partes[2]}
+
+
+def _dims_ensamble_datos(nombre):
+    """ensemble_{variable}_{agregacion}_{ssp}.nc"""
+    partes = os.path.splitext(nombre)[0].split('_')
+    if len(partes) != 4 or partes[0] != 'ensemble':
+        return None
+    return {'modelo': 'ensemble', 'variable': partes[1],
+            'agregacion': partes[2], 'ssp': partes[3]}
+
+
+def _dims_toe(nombre):
+    """ensemble_{variable}_{agregacion}_toe.nc / _components.nc"""
+    partes = os.path.splitext(nombre)[0].split('_')
+    if len(partes) != 4 or partes[0] != 'ensemble':
+        return None
+    return {'modelo': 'ensemble', 'variable': partes[1],
+            'agregacion': partes[2], 'contenido': partes[3]}
+
+
+# (tipo, subdirectorio de data/, extensión, parser del nombre)
+DIRECTORIOS = [
+    ('modelo', 'modelos_agre', '.nc', _dims_modelo),
+    ('serie', 'series', '.parquet', _dims_serie),
+    ('cambio', 'mod_cambios', '.nc', _dims_cambio),
+    ('significancia', 'mod_significancia', '.nc', _dims_cambio),
+    ('almacen', 'mod_almacen', '.nc', _dims_almacen),
+    ('ensamble_datos', os.path.join('ensamble', 'datos'), '.nc', _dims_ensamble_datos),
+    ('ensamble_cambio', os.path.join('ensamble', 'cambios'), '.nc', _dims_cambio),
+    ('ensamble_significancia', os.path.join('ensamble', 'significancia'), '.nc', _dims_cambio),
+    ('toe', 'mod_toe', '.nc', _dims_toe),
+]
+
+
+# ============================================================
+# ESCRITURA (scripts de preprocesamiento)
+# ============================================================
+
+def _forma_archivo(ruta):
+    """Forma del contenido principal del archivo ({dim: tamaño} o lista)."""
+    ext = os.path.splitext(ruta)[1]
+    if ext == '.nc':
+        with xr.open_dataset(ruta) as ds:
+            if not ds.data_vars:
+                return dict(ds.sizes)
+            return dict(list(ds.data_vars.values())[0].sizes)
+    if ext == '.npy':
+        return list(np.load(ruta, mmap_mode='r').shape)
+    if ext == '.parquet':
+        metadatos = pq.read_metadata(ruta)
+        return [metadatos.num_rows, metadatos.num_row_groups]
+    return None
+
+
+def _entrada(tipo, ruta, dims, previa):
+    """Entrada del catálogo; reutiliza la previa si el archivo no cambió."""
+    info = os.stat(ruta)
+    if (previa is not None and previa.get('mtime') == info.st_mtime_ns
+            and previa.get('tamano') == info.st_size):
+        return previa
+
+    entrada = {'tipo': tipo, 'ruta': ruta}
+    entrada.update(dims)
+    entrada['mtime'] = info.st_mtime_ns
+    entrada['tamano'] = info.st_size
+    try:
+        entrada['forma'] = _forma_archivo(ruta)
+    except Exception as e:
+        print(f"  -> Advertencia: no se pudo leer la forma de {ruta}: {e}")
+        entrada['forma'] = None
+    entrada['checksum'] = hash_archivo(ruta)
+    return entrada
+
+
+def _listar(directorio):
+    """Rutas relativas (ordenadas) de los archivos del directorio y sus particiones."""
+    nombres = []
+    for raiz, subdirs, archivos in os.walk(directorio):
+        subdirs[:] = [d for d in subdirs if not d.startswith('.')]
+        rel = os.path.relpath(raiz, directorio)
+        nombres.extend(a if rel == '.' else os.path.join(rel, a)
+                       for a in archivos if not a.startswith('.'))
+    return sorted(nombres)
+
+
+def actualizar_catalogo(base_dir=BASE_DIR, ruta_catalogo=CATALOGO_PATH):
+    """
+    Recorre los directorios de datos y reescribe el catálogo. Las entradas de
+    archivos sin cambios (mismo mtime y tamaño) se copian del catálogo previo,
+    así que solo se leen los archivos nuevos o modificados.
+
+    Returns:
+        Número de artefactos catalogados
+    """
+    previas = {}
+    if os.path.exists(ruta_catalogo):
+        try:
+            with open(ruta_catalogo) as f:
+                previas = {e['ruta']: e for e in json.load(f).get('artefactos', [])}
+        except Exception as e:
+            print(f"  -> Advertencia: catálogo previo inválido ({e}), se reconstruye")
+
+    artefactos = []
+    for tipo, subdir, extension, parser in DIRECTORIOS:
+        directorio = os.path.join(base_dir, subdir)
+        if not os.path.isdir(directorio):
+            continue
+        for nombre in _listar(directorio):
+            if not nombre.endswith(extension):
+                continue
+            dims = parser(nombre)
+            if dims is None:
+                continue
+            ruta = os.path.join(directorio, nombre)
+            artefactos.append(_entrada(tipo, ruta, dims, previas.get(ruta)))
+
+    datos = {'version': VERSION_CATALOGO, 'artefactos': artefactos}
+
+    def _escribir(tmp):
+        with open(tmp, 'w') as f:
+            json.dump(datos, f, indent=1)
+
+    os.makedirs(os.path.dirname(ruta_catalogo) or '.', exist_ok=True)
+    guardar_atomico(ruta_catalogo, _escribir)
+    print(f"  -> Catálogo actualizado: {len(artefactos)} artefactos ({ruta_catalogo})")
+    return len(artefactos)
+
+
+# ============================================================
+# LECTURA (dashboard)
+# ============================================================
+
+def cargar_catalogo(ruta_catalogo=CATALOGO_PATH):
+    """
+    Devuelve el catálogo en memoria (se lee solo si cambió el archivo),
+    o None si no existe.
+    """
+    try:
+        mtime = os.stat(ruta_catalogo).st_mtime_ns
+    except OSError:
+        return None
+
+    with _lock:
+        if _catalogo.get('ruta') == ruta_catalogo and _catalogo.get('mtime') == mtime:
+            return _catalogo
+        try:
+            with open(ruta_catalogo) as f:
+                datos = json.load(f)
+        except Exception as e:
+            print(f"  -> Advertencia: no se pudo leer el catálogo: {e}")
+            return None
+
+        por_directorio = {}
+        for entrada in datos.get('artefactos', []):
+            directorio = os.path.normpath(os.path.dirname(entrada['ruta']))
+            por_directorio.setdefault(directorio, []).append(entrada)
+
+        _catalogo.clear()
+        _catalogo.update({'ruta': ruta_catalogo, 'mtime': mtime,
+                          'datos': datos, 'por_directorio': por_directorio})
+        return _catalogo
+
+
+def archivos_catalogados(directorio, extension=None):
+    """
+    Nombres de archivo de un directorio según el catálogo, o None si no hay
+    catálogo o el directorio no está catalogado (hay que leer el disco).
+    """
+    catalogo = cargar_catalogo()
+    if catalogo is None:
+        return None
+    entradas = catalogo['por_directorio'].get(os.path.normpath(directorio))
+    if entradas is None:
+        return None
+    return [os.path.basename(e['ruta']) for e in entradas
+            if extension is None or e['ruta'].endswith(extension)]
+
+
+def consultar_catalogo(tipo=None, **filtros):
+    """
+    Entradas del catálogo que cumplen tipo y filtros de dimensiones
+    (p. ej. variable='pr', ssp='ssp245'). Lista vacía si no hay catálogo.
+    """
+    catalogo = cargar_catalogo()
+    if catalogo is None:
+        return []
+    return [e for e in catalogo['datos'].get('artefactos', [])
+            if (tipo is None or e['tipo'] == tipo)
+            and all(str(e.get(k)) == str(v) for k, v in filtros.items())]
@@ -1,13 +1,25 @@
 #!/usr/bin/env python
 # coding: utf-8
 """
-aux_ens_cdo.py - Funciones para cálculo de ensambles usando CDO
+aux_ens_cdo.py - Funciones para cálculo de ensambles
+- calcular_ensemble_numpy: motor en proceso (NumPy), por bloques de tiempo
+- calcular_ensemble_dask: mismo resultado como grafo de dask (modo --lazy)
+- calcular_ensemble_cdo: alternativa con `cdo ensmean` (requiere CDO)
 """
 
 import os
 import subprocess
 import glob
+import contextlib
 
+import numpy as np
+import xarray as xr
+
+from aux_paralelo import guardar_atomico
+from aux_perfilado import medir_etapa
+from aux_perezoso import abrir_dataset, compartiendo_entradas
+
+@medir_etapa()
 def calcular_ensemble_cdo(base_dir, variable, agregacion, ssp, output_dir):
     """
     Calcula ensemble usando CDO ensmean.
@@ -46,45 +58,268 @@ def calcular_ensemble_cdo(base_dir, variable, agregacion, ssp, output_dir):
     nombre_salida = f"ensemble_{variable}_{agregacion}_{ssp}.nc"
     ruta_salida = os.path.join(output_dir, nombre_salida)
     
-    # Construir comando CDO
+    # Construir comando CDO (escribe en un temporal que luego se renombra)
     archivos_str = " ".join(archivos)
-    comando = f"cdo ensmean {archivos_str} {ruta_salida}"
     
     print(f"  -> Ejecutando: cdo ensmean sobre {len(archivos)} modelos")
     print(f"  -> Salida: {nombre_salida}")
     
-    try:
-        # Ejecutar CDO
-        resultado = subprocess.run(
-            comando, 
+    def _ejecutar_cdo(ruta_tmp):
+        return subprocess.run(
+            f"cdo ensmean {archivos_str} {ruta_tmp}",
             shell=True, 
             capture_output=True, 
             text=True,
             check=True
         )
+    
+    try:
+        # Ejecutar CDO (check=True: un código de salida distinto de 0 lanza excepción)
+        guardar_atomico(ruta_salida, _ejecutar_cdo)
         
-        if resultado.returncode == 0:
-            print(f"  ✓ Ensemble creado exitosamente")
-            # Verificar que el archivo se creó
-            if os.path.exists(ruta_salida):
-                tamaño = os.path.getsize(ruta_salida) / (1024*1024)  # MB
-                print(f"  ✓ Tamaño: {tamaño:.1f} MB")
-                return ruta_salida
-            else:
-                print(f"  ✗ Error: Archivo no creado")
-                return None
+        print(f"  ✓ Ensemble creado exitosamente")
+        # Verificar que el archivo se creó
+        if os.path.exists(ruta_salida):
+            tamaño = os.path.getsize(ruta_salida) / (1024*1024)  # MB
+            print(f"  ✓ Tamaño: {tamaño:.1f} MB")
+            return ruta_salida
         else:
-            print(f"  ✗ Error CDO: {resultado.stderr}")
+            print(f"  ✗ Error: Archivo no creado")
             return None
             
     except subprocess.CalledProcessError as e:
         print(f"  ✗ Error ejecutando CDO: {e}")
+        print(f"  ✗ Error CDO: {e.stderr}")
         return None
     except Exception as e:
         print(f"  ✗ Error inesperado: {e}")
         return None
 
 
+def buscar_archivos_miembros(base_dir, variable, agregacion, ssp):
+    """
+    Lista ordenada de archivos miembro para una combinación.
+    """
+    patron = f"{variable}_{agregacion}_*_{ssp}.nc"
+    return sorted(glob.glob(os.path.join(base_dir, patron)))
+
+
+def _seleccionar_miembros(archivos, datasets, variable):
+    """
+    Miembros compatibles con el primero (misma forma y mismos tiempos).
+
+    Returns:
+        (DataArray de referencia, lista de DataArrays en el orden de
+        dimensiones de la referencia, nombres de archivo incluidos)
+    """
+    ref = datasets[0][variable]
+    miembros = []
+    incluidos = []
+    for archivo, ds in zip(archivos, datasets):
+        modelo = os.path.basename(archivo).split('_')[2]
+        da = ds[variable] if variable in ds else None
+        if (da is None or da.shape != ref.shape
+                or not np.array_equal(da['time'].values, ref['time'].values)):
+            print(f"     ✗ {modelo} (dimensiones o tiempos distintos, se omite)")
+            continue
+        print(f"     ✓ {modelo}")
+        miembros.append(da.transpose(*ref.dims))
+        incluidos.append(os.path.basename(archivo))
+    return ref, miembros, incluidos
+
+
+def _dataset_ensemble(ref, variable, media, desv, minimo, maximo, incluidos):
+    """
+    Dataset de salida del ensemble: media (atributos del primer miembro),
+    desviación estándar, mínimo y máximo entre modelos.
+    """
+    dtype = ref.dtype if np.issubdtype(ref.dtype, np.floating) else np.float64
+    coords = {dim: ref[dim].values for dim in ref.dims}
+    ds_out = xr.Dataset(
+        {
+            variable: (ref.dims, media.astype(dtype), dict(ref.attrs)),
+            f"{variable}_std": (ref.dims, desv.astype(dtype),
+                                {'description': 'Desviación estándar entre modelos (ddof=0)'}),
+            f"{variable}_min": (ref.dims, minimo.astype(dtype),
+                                {'description': 'Mínimo entre modelos'}),
+            f"{variable}_max": (ref.dims, maximo.astype(dtype),
+                                {'description': 'Máximo entre modelos'}),
+        },
+        coords=coords,
+    )
+    ds_out.attrs['miembros'] = ", ".join(incluidos)
+    return ds_out
+
+
+@medir_etapa()
+def calcular_ensemble_numpy(base_dir, variable, agregacion, ssp, output_dir, pasos_bloque=12):
+    """
+    Calcula el ensemble en proceso, sin CDO, recorriendo los miembros por
+    bloques de tiempo. Acumula suma, conteo, suma de cuadrados, mínimo y
+    máximo ignorando NaN, de modo que nunca se cargan todos los miembros a
+    la vez. El promedio coincide con `cdo ensmean` (valores faltantes
+    excluidos; celda faltante si ningún miembro tiene dato).
+    
+    Además de la media guarda la dispersión del ensemble en la misma pasada:
+    {variable}_std (desviación poblacional, como `cdo ensstd`),
+    {variable}_min y {variable}_max.
+    
+    Args:
+        base_dir: Directorio con archivos de modelos
+        variable: Variable climática
+        agregacion: Agregación temporal
+        ssp: Escenario
+        output_dir: Directorio de salida
+        pasos_bloque: Pasos de tiempo leídos por miembro en cada bloque
+    
+    Returns:
+        Ruta al archivo de ensemble creado
+    """
+    archivos = buscar_archivos_miembros(base_dir, variable, agregacion, ssp)
+    
+    if not archivos:
+        print(f"  -> No se encontraron archivos para: {variable}_{agregacion}_{ssp}")
+        return None
+    
+    os.makedirs(output_dir, exist_ok=True)
+    nombre_salida = f"ensemble_{variable}_{agregacion}_{ssp}.nc"
+    ruta_salida = os.path.join(output_dir, nombre_salida)
+    
+    try:
+        with contextlib.ExitStack() as pila:
+            # Abrir los miembros de forma perezosa (solo metadatos), salvo que
+            # ya estén en memoria o mapeados desde la caché de entradas
+            abrir = abrir_dataset if compartiendo_entradas() else xr.open_dataset
+            datasets = [pila.enter_context(abrir(a)) for a in archivos]
+            ref, miembros, incluidos = _seleccionar_miembros(archivos, datasets, variable)
+            
+            print(f"  -> Ensemble NumPy sobre {len(miembros)} modelos -> {nombre_salida}")
+            
+            eje_t = ref.get_axis_num('time')
+            n_t = ref.sizes['time']
+            media = np.full(ref.shape, np.nan)
+            desv = np.full(ref.shape, np.nan)
+            minimo = np.full(ref.shape, np.nan)
+            maximo = np.full(ref.shape, np.nan)
+            
+            for t0 in range(0, n_t, pasos_bloque):
+                bloque = slice(t0, min(t0 + pasos_bloque, n_t))
+                suma = suma_c = suma_c2 = conteo = desplazamiento = None
+                b_min = b_max = None
+                
+                for da in miembros:
+                    x = np.asarray(da.isel(time=bloque).values, dtype=np.float64)
+                    valido = ~np.isnan(x)
+                    x0 = np.where(valido, x, 0.0)
+                    
+                    if suma is None:
+                        # El primer miembro sirve de desplazamiento para la varianza
+                        desplazamiento = x0
+                        suma = np.zeros_like(x0)
+                        suma_c = np.zeros_like(x0)
+                        suma_c2 = np.zeros_like(x0)
+                        conteo = np.zeros(x0.shape, dtype=np.int64)
+                        b_min = np.full(x0.shape, np.inf)
+                        b_max = np.full(x0.shape, -np.inf)
+                    
+                    xc = np.where(valido, x - desplazamiento, 0.0)
+                    suma += x0
+                    suma_c += xc
+                    suma_c2 += xc ** 2
+                    conteo += valido
+                    b_min = np.where(valido, np.minimum(b_min, x0), b_min)
+                    b_max = np.where(valido, np.maximum(b_max, x0), b_max)
+                
+                indice = [slice(None)] * len(ref.shape)
+                indice[eje_t] = bloque
+                indice = tuple(indice)
+                hay = conteo > 0
+                with np.errstate(invalid='ignore', divide='ignore'):
+                    media[indice] = np.where(hay, suma / conteo, np.nan)
+                    var = suma_c2 / conteo - (suma_c / conteo) ** 2
+                desv[indice] = np.where(hay, np.sqrt(np.maximum(var, 0.0)), np.nan)
+                minimo[indice] = np.where(hay, b_min, np.nan)
+                maximo[indice] = np.where(hay, b_max, np.nan)
+            
+            ds_out = _dataset_ensemble(ref, variable, media, desv, minimo, maximo, incluidos)
+        
+        guardar_atomico(ruta_salida, ds_out.to_netcdf)
+        
+        tamaño = os.path.getsize(ruta_salida) / (1024*1024)  # MB
+        print(f"  ✓ Ensemble creado exitosamente ({tamaño:.1f} MB)")
+        return ruta_salida
+    
+    except Exception as e:
+        print(f"  ✗ Error calculando ensemble: {e}")
+        return None
+
+
+@medir_etapa()
+def calcular_ensemble_dask(base_dir, variable, agregacion, ssp, output_dir):
+    """
+    Calcula el ensemble como grafo de dask (modo --lazy): los miembros se
+    abren en bloques y media, dispersión, mínimo y máximo se escriben al
+    NetCDF bloque a bloque, sin tener nunca un campo completo en memoria.
+    Mismo resultado y formato que calcular_ensemble_numpy.
+    
+    Args:
+        base_dir: Directorio con archivos de modelos
+        variable: Variable climática
+        agregacion: Agregación temporal
+        ssp: Escenario
+        output_dir: Directorio de salida
+    
+    Returns:
+        Ruta al archivo de ensemble creado
+    """
+    import dask.array as dask_array
+    
+    archivos = buscar_archivos_miembros(base_dir, variable, agregacion, ssp)
+    
+    if not archivos:
+        print(f"  -> No se encontraron archivos para: {variable}_{agregacion}_{ssp}")
+        return None
+    
+    os.makedirs(output_dir, exist_ok=True)
+    nombre_salida = f"ensemble_{variable}_{agregacion}_{ssp}.nc"
+    ruta_salida = os.path.join(output_dir, nombre_salida)
+    
+    try:
+        with contextlib.ExitStack() as pila:
+            datasets = [pila.enter_context(abrir_dataset(a)) for a in archivos]
+            ref, miembros, incluidos = _seleccionar_miembros(archivos, datasets, variable)
+            
+            print(f"  -> Ensemble dask sobre {len(miembros)} modelos -> {nombre_salida}")
+            
+            # (miembro, ...) con los bloques del primer miembro
+            x = dask_array.stack([m.data.rechunk(ref.data.chunks)
+                                  for m in miembros]).astype(np.float64)
+            valido = ~dask_array.isnan(x)
+            conteo = valido.sum(axis=0)
+            hay = conteo > 0
+            divisor = dask_array.maximum(conteo, 1)
+            
+            media = dask_array.where(hay, dask_array.where(valido, x, 0.0).sum(axis=0) / divisor,
+                                     np.nan)
+            var = (dask_array.where(valido, x - media, 0.0) ** 2).sum(axis=0) / divisor
+            desv = dask_array.where(hay, dask_array.sqrt(var), np.nan)
+            minimo = dask_array.where(hay, dask_array.where(valido, x, np.inf).min(axis=0), np.nan)
+            maximo = dask_array.where(hay, dask_array.where(valido, x, -np.inf).max(axis=0), np.nan)
+            
+            ds_out = _dataset_ensemble(ref, variable, media, desv, minimo, maximo, incluidos)
+            
+            # to_netcdf ejecuta el grafo y escribe bloque a bloque
+            guardar_atomico(ruta_salida, ds_out.to_netcdf)
+        
+        tamaño = os.path.getsize(ruta_salida) / (1024*1024)  # MB
+        print(f"  ✓ Ensemble creado exitosamente ({tamaño:.1f} MB)")
+        return ruta_salida
+    
+    except Exception as e:
+        print(f"  ✗ Error calculando ensemble: {e}")
+        return None
+
+
 def verificar_ensemble_existente(output_dir, variable, agregacion, ssp):
     """
     Verifica si ya existe un ensemble.
@@ -0,0 +1,143 @@
+#!/usr/bin/env python
+# coding: utf-8
+"""
+aux_geometria.py - Capa de geometría compartida para los gráficos del dashboard
+
+Lee peru32.geojson una sola vez por proceso y deja preparados:
+    - el GeoDataFrame (EPSG:4326) y su __geo_interface__ (mapas Plotly)
+    - los Path de matplotlib de cada polígono (contornos en mapas de cambios)
+    - las coordenadas del contorno como una sola línea separada por NaN (Plotly)
+    - la lista ordenada de departamentos
+
+Todo se invalida solo cuando cambia la fecha de modificación del archivo.
+"""
+
+import os
+import threading
+
+import numpy as np
+import geopandas as gpd
+import plotly.graph_objects as go
+from matplotlib.path import Path
+from matplotlib.collections import PathCollection
+
+GEO_FILE = os.path.join("data", "geo", "peru32.geojson")
+CAMPO_DEPARTAMENTO = 'DEPARTAMEN'
+
+# Geometrías ya cargadas en este proceso: ruta -> diccionario
+_geometrias = {}
+_lock = threading.Lock()
+
+
+def _poligonos(geometria):
+    """Lista de polígonos simples de una geometría (Polygon o MultiPolygon)."""
+    if geometria is None or geometria.is_empty:
+        return []
+    if geometria.geom_type == 'Polygon':
+        return [geometria]
+    if geometria.geom_type == 'MultiPolygon':
+        return list(geometria.geoms)
+    return []
+
+
+def _path_poligono(poligono):
+    """Path compuesto (exterior + huecos) de un polígono."""
+    anillos = [poligono.exterior] + list(poligono.interiors)
+    return Path.make_compound_path(*[Path(np.asarray(a.coords)[:, :2], closed=True)
+                                     for a in anillos])
+
+
+def _cargar(geo_file):
+    """Lee el geojson y precalcula todas las representaciones."""
+    gdf = gpd.read_file(geo_file)
+    if gdf.crs is None:
+        print(f"Advertencia: Shapefile {geo_file} no tiene CRS definido")
+        gdf = gdf.set_crs('EPSG:4326')
+    elif gdf.crs.to_epsg() != 4326:
+        gdf = gdf.to_crs(epsg=4326)
+
+    paths = []
+    xs, ys = [], []
+    for geometria in gdf.geometry:
+        for poligono in _poligonos(geometria):
+            paths.append(_path_poligono(poligono))
+            x, y = poligono.exterior.xy
+            xs.extend(list(x) + [np.nan])
+            ys.extend(list(y) + [np.nan])
+
+    # Misma relación de aspecto que usa geopandas para CRS geográficos
+    bounds = gdf.total_bounds
+    aspecto = 1 / np.cos(np.mean([bounds[1], bounds[3]]) * np.pi / 180)
+
+    departamentos = (sorted(gdf[CAMPO_DEPARTAMENTO].tolist())
+                     if CAMPO_DEPARTAMENTO in gdf.columns else [])
+
+    return {
+        'gdf': gdf,
+        'geo_interface': gdf.geometry.__geo_interface__,
+        'paths': paths,
+        'contorno_x': np.array(xs),
+        'contorno_y': np.array(ys),
+        'aspecto': aspecto,
+        'departamentos': departamentos,
+    }
+
+
+def obtener_geometria(geo_file=GEO_FILE):
+    """
+    Devuelve el diccionario de geometría del archivo, leyéndolo solo si
+    no está en memoria o si cambió su fecha de modificación.
+    """
+    mtime = os.path.getmtime(geo_file)
+    with _lock:
+        entrada = _geometrias.get(geo_file)
+        if entrada is None or entrada['mtime'] != mtime:
+            entrada = _cargar(geo_file)
+            entrada['mtime'] = mtime
+            _geometrias[geo_file] = entrada
+        return entrada
+
+
+def obtener_gdf(geo_file=GEO_FILE):
+    """
+    GeoDataFrame de departamentos en EPSG:4326 (copia, se puede modificar).
+    """
+    return obtener_geometria(geo_file)['gdf'].copy()
+
+
+def obtener_departamentos(geo_file=GEO_FILE):
+    """
+    Lista ordenada de nombres de departamentos.
+    """
+    return list(obtener_geometria(geo_file)['departamentos'])
+
+
+def agregar_contorno_mpl(ax, geo_file=GEO_FILE, edgecolor='black', facecolor='none',
+                         linewidth=1, alpha=0.5):
+    """
+    Dibuja los contornos departamentales en un eje de matplotlib con una sola
+    PathCollection construida a partir de los Path en memoria.
+    """
+    geo = obtener_geometria(geo_file)
+    coleccion = PathCollection(geo['paths'], edgecolor=edgecolor, facecolor=facecolor,
+                               linewidth=linewidth, alpha=alpha)
+    ax.add_collection(coleccion, autolim=True)
+    ax.autoscale_view()
+    ax.set_aspect(geo['aspecto'])
+    return coleccion
+
+
+def traza_contorno_plotly(geo_file=GEO_FILE, color='black', width=1.5):
+    """
+    Contorno de todos los departamentos como una sola traza go.Scatter
+    (polígonos separados por NaN).
+    """
+    geo = obtener_geometria(geo_file)
+    return go.Scatter(
+        x=geo['contorno_x'],
+        y=geo['contorno_y'],
+        mode='lines',
+        line=dict(color=color, width=width),
+        showlegend=False,
+        hoverinfo='skip'
+    )
@@ -0,0 +1,211 @@
+#!/usr/bin/env python
+# coding: utf-8
+"""
+aux_grafo.py - Grafo de etapas del preprocesamiento sobre artefactos
+
+Cada etapa es una llamada a una función de un script 01_preproc_* que
+produce unos artefactos (archivos de salida) a partir de otros (archivos de
+modelo o salidas de otras etapas). ejecutar_grafo:
+
+    - agrupa en componentes las etapas conectadas por algún artefacto
+      (p. ej. todas las que leen los archivos de tas_ANUAL); los componentes
+      son independientes entre sí y se ejecutan en paralelo con
+      aux_paralelo.ejecutar_combinaciones
+    - dentro de cada componente ordena las etapas de modo que cada una corre
+      después de las que producen lo que necesita, y lee cada archivo una
+      sola vez (aux_perezoso.entradas_compartidas): todas las etapas que lo
+      usan reciben el mismo dataset, que se libera tras la última
+
+Si una etapa falla, las que dependen de lo que producía se saltan.
+"""
+
+import os
+import sys
+import importlib.util
+
+from aux_paralelo import ejecutar_combinaciones
+from aux_perfilado import etapa as medir
+from aux_perezoso import entradas_compartidas, liberar_entrada
+
+
+# ============================================================
+# ETAPAS
+# ============================================================
+
+def etapa(tipo, nombre, script, funcion, args=(), produce=(), requiere=(), grupo=None):
+    """
+    Especificación de una etapa del grafo.
+
+    Args:
+        tipo: Clase de etapa ('series', 'cambios', ...), para el registro de tiempos
+        nombre: Texto que identifica la etapa en el reporte
+        script: Ruta del script que define la función
+        funcion: Nombre de la función (se llama como funcion(*args); False = falla)
+        args: Argumentos de la función
+        produce: Archivos que escribe
+        requiere: Archivos que lee (entradas o salidas de otras etapas). Los
+            archivos comunes a todo (p. ej. el geojson) no se incluyen: unirían
+            todas las etapas en un solo componente
+        grupo: Datos a los que pertenece (p. ej. 'tas_ANUAL'), para nombrar
+            su componente en el reporte
+    """
+    return {
+        'tipo': tipo,
+        'nombre': nombre,
+        'grupo': grupo or nombre,
+        'script': script,
+        'funcion': funcion,
+        'args': tuple(args),
+        'produce': [os.path.normpath(r) for r in produce],
+        'requiere': [os.path.normpath(r) for r in requiere],
+    }
+
+
+def cargar_script(ruta):
+    """
+    Importa un script 01_preproc_* como módulo (una sola vez por proceso).
+    Los scripts se referencian por ruta para que los procesos de trabajo
+    puedan resolverlos con cualquier método de arranque.
+    """
+    nombre = os.path.splitext(os.path.basename(ruta))[0]
+    if nombre not in sys.modules:
+        spec = importlib.util.spec_from_file_location(nombre, ruta)
+        modulo = importlib.util.module_from_spec(spec)
+        sys.modules[nombre] = modulo
+        try:
+            spec.loader.exec_module(modulo)
+        except BaseException:
+            del sys.modules[nombre]
+            raise
+    return sys.modules[nombre]
+
+
+# ============================================================
+# ESTRUCTURA DEL GRAFO
+# ============================================================
+
+def orden_topologico(etapas):
+    """
+    Etapas ordenadas de modo que cada una va después de las que producen
+    sus requisitos; a igualdad, se conserva el orden original.
+    """
+    productor = {}
+    for i, e in enumerate(etapas):
+        for artefacto in e['produce']:
+            productor[artefacto] = i
+
+    previas = [{productor[a] for a in e['requiere'] if a in productor} - {i}
+               for i, e in enumerate(etapas)]
+    orden = []
+    hechas = set()
+    while len(orden) < len(etapas):
+        listas = [i for i in range(len(etapas))
+                  if i not in hechas and previas[i] <= hechas]
+        if not listas:
+            raise ValueError("El grafo de etapas tiene un ciclo")
+        orden.append(listas[0])
+        hechas.add(listas[0])
+    return [etapas[i] for i in orden]
+
+
+def componentes(etapas):
+    """
+    Grupos de etapas conectadas por algún artefacto (producido o requerido),
+    cada uno en orden topológico.
+    """
+    raiz = list(range(len(etapas)))
+
+    def buscar(i):
+        while raiz[i] != i:
+            raiz[i] = raiz[raiz[i]]
+            i = raiz[i]
+        return i
+
+    primera = {}
+    for i, e in enumerate(etapas):
+        for artefacto in e['produce'] + e['requiere']:
+            j = primera.setdefault(artefacto, i)
+            raiz[buscar(i)] = buscar(j)
+
+    grupos = {}
+    for i, e in enumerate(etapas):
+        grupos.setdefault(buscar(i), []).append(e)
+    return [orden_topologico(grupo) for grupo in grupos.values()]
+
+
+class Componente(list):
+    """Etapas de un componente; en el reporte se muestra solo su nombre."""
+
+    def __init__(self, etapas):
+        super().__init__(etapas)
+        self.nombre = ", ".join(sorted({e['grupo'] for e in etapas}))
+
+    # aux_paralelo usa cada combinación como clave del resumen
+    __hash__ = object.__hash__
+
+    def __str__(self):
+        return f"{self.nombre} ({len(self)} etapas)"
+
+
+# ============================================================
+# EJECUCIÓN
+# ============================================================
+
+def ejecutar_componente(componente):
+    """
+    Ejecuta en orden las etapas de un componente compartiendo sus entradas.
+    Lanza RuntimeError si alguna etapa falló (o se saltó por una falla previa).
+    """
+    ultima = {}  # artefacto -> índice de la última etapa que lo lee
+    for i, e in enumerate(componente):
+        for artefacto in e['requiere']:
+            ultima[artefacto] = i
+
+    no_producidos = set()
+    fallidas = []
+    with entradas_compartidas():
+        for i, e in enumerate(componente):
+            faltan = [a for a in e['requiere'] if a in no_producidos]
+            if faltan:
+                print(f"  -> Saltando {e['nombre']}: no se generó {os.path.basename(faltan[0])}")
+                ok = False
+            else:
+                try:
+                    funcion = getattr(cargar_script(e['script']), e['funcion'])
+                    with medir(e['tipo']):
+                        ok = funcion(*e['args']) is not False
+                except Exception as ex:
+                    print(f"  -> Error en {e['nombre']}: {type(ex).__name__}: {ex}")
+                    ok = False
+
+            if not ok:
+                no_producidos.update(e['produce'])
+                fallidas.append(e['nombre'])
+            for artefacto in e['requiere']:
+                if ultima[artefacto] == i:
+                    liberar_entrada(artefacto)
+
+    if fallidas:
+        raise RuntimeError(f"{len(fallidas)}/{len(componente)} etapas fallaron: "
+                           f"{', '.join(fallidas)}")
+    return True
+
+
+def ejecutar_grafo(etapas, n_workers=None, titulo="Pipeline"):
+    """
+    Ejecuta todas las etapas: los componentes independientes en paralelo y,
+    dentro de cada uno, las etapas en orden con las entradas compartidas.
+
+    Args:
+        etapas: Lista de etapa(...)
+        n_workers: Número de procesos (None = núcleos disponibles, 1 = serial)
+        titulo: Texto del encabezado del reporte
+
+    Returns:
+        Resumen de aux_paralelo.ejecutar_combinaciones (una combinación por componente)
+    """
+    grupos = [Componente(grupo) for grupo in componentes(etapas)]
+    # Los componentes más grandes primero, para repartir mejor la carga
+    grupos.sort(key=len, reverse=True)
+    return ejecutar_combinaciones(ejecutar_componente, [(g,) for g in grupos],
+                                  n_workers, titulo=titulo)
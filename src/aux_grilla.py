@@ -0,0 +1,25 @@
+#!/usr/bin/env python
+# coding: utf-8
+"""
+aux_grilla.py - Utilidades de grillas regulares lat/lon
+
+Funciones sin dependencias más allá de NumPy, compartidas por el
+preprocesamiento (aux_regrid) y los gráficos del dashboard
+(graficos_cambios).
+"""
+
+import numpy as np
+
+
+def bordes_celdas(centros):
+    """
+    Bordes de celda a partir de los centros: puntos medios entre centros y
+    extremos extrapolados (igual que xarray en pcolormesh). Con un solo
+    centro, la celda mide 1.
+    """
+    centros = np.asarray(centros, dtype=float)
+    if len(centros) == 1:
+        return np.array([centros[0] - 0.5, centros[0] + 0.5])
+    medios = (centros[:-1] + centros[1:]) / 2
+    return np.concatenate([[2 * centros[0] - medios[0]], medios,
+                           [2 * centros[-1] - medios[-1]]])
@@ -0,0 +1,53 @@
+#!/usr/bin/env python
+# coding: utf-8
+"""
+aux_hash.py - Hashes de contenido para las cachés en disco
+
+Las cachés (máscaras, figuras, ...) se identifican por el contenido de sus
+archivos fuente y por los parámetros que las generan, no por nombres ni
+fechas. El hash de cada archivo se memoriza por (ruta, mtime, tamaño) para
+no releerlo mientras no cambie.
+"""
+
+import os
+import json
+import hashlib
+import threading
+
+# Hashes ya calculados: (ruta, mtime_ns, tamaño) -> sha1
+_hashes = {}
+_lock = threading.Lock()
+
+
+def hash_archivo(ruta):
+    """
+    Devuelve el hash SHA1 del contenido de un archivo.
+    """
+    info = os.stat(ruta)
+    clave = (os.path.abspath(ruta), info.st_mtime_ns, info.st_size)
+    with _lock:
+        if clave in _hashes:
+            return _hashes[clave]
+
+    sha = hashlib.sha1()
+    with open(ruta, 'rb') as f:
+        for bloque in iter(lambda: f.read(1 << 20), b''):
+            sha.update(bloque)
+
+    with _lock:
+        _hashes[clave] = sha.hexdigest()
+    return _hashes[clave]
+
+
+def hash_contenido(parametros, rutas=()):
+    """
+    Hash de unos parámetros (serializables en JSON) y del contenido de una
+    lista de archivos. Los archivos inexistentes también cuentan (como
+    ausentes), de modo que el hash cambia cuando aparecen.
+    """
+    sha = hashlib.sha1()
+    sha.update(json.dumps(parametros, sort_keys=True, default=str).encode())
+    for ruta in rutas:
+        sha.update(os.path.basename(ruta).encode())
+        sha.update((hash_archivo(ruta) if os.path.exists(ruta) else 'ausente').encode())
+    return sha.hexdigest()
@@ -0,0 +1,212 @@
+#!/usr/bin/env python
+# coding: utf-8
+"""
+aux_manifiesto.py - Manifiesto de construcción para recalcular solo lo necesario
+
+data/manifiesto.json registra, para cada salida de los scripts 01_preproc_01..04:
+    - entradas: hash SHA1 del contenido de cada archivo del que depende
+    - parametros: configuración con la que se generó (periodo base, año centro...)
+    - codigo: hash de los módulos de src/ que la calculan
+
+Una salida está al día si existe y su registro coincide con el estado actual
+de sus dependencias; si no, se recalcula. Reemplazar un .nc, agregar un modelo
+o cambiar REF_PERIODS/CENTER_YEARS recalcula exactamente las salidas afectadas.
+
+Los hashes de las entradas se memorizan en el manifiesto por (tamaño, mtime):
+solo se releen los archivos que cambiaron. Las salidas que ya existían antes
+del manifiesto se adoptan tal cual en la primera corrida (--forzar recalcula
+todo).
+"""
+
+import os
+import sys
+import json
+import hashlib
+
+from aux_hash import hash_archivo
+from aux_paralelo import guardar_atomico
+
+MANIFIESTO = os.path.join("data", "manifiesto.json")
+VERSION_MANIFIESTO = 1
+
+
+# ============================================================
+# CONFIGURACIÓN
+# ============================================================
+
+def agregar_argumento_forzar(parser):
+    """
+    Agrega --forzar al parser de un script que usa el manifiesto.
+    """
+    parser.add_argument(
+        "--forzar", action="store_true",
+        help="Recalcular todas las salidas aunque el manifiesto indique que están al día")
+    return parser
+
+
+def version_codigo(*modulos):
+    """
+    Hash del código que calcula una salida: contenido de los módulos
+    indicados (nombre de un módulo ya importado o ruta a un archivo).
+    """
+    sha = hashlib.sha1()
+    for modulo in modulos:
+        ruta = sys.modules[modulo].__file__ if modulo in sys.modules else modulo
+        sha.update(os.path.basename(ruta).encode())
+        sha.update(hash_archivo(ruta).encode())
+    return sha.hexdigest()[:16]
+
+
+def dependencia(entradas, parametros=None, codigo=None):
+    """
+    Especificación de lo que determina una salida: archivos de entrada,
+    parámetros (serializables en JSON) y versión de código.
+    """
+    return {'entradas': list(entradas), 'parametros': parametros or {}, 'codigo': codigo}
+
+
+# ============================================================
+# LECTURA / ESCRITURA
+# ============================================================
+
+def _vacio():
+    return {'version': VERSION_MANIFIESTO, 'archivos': {}, 'salidas': {}}
+
+
+def cargar_manifiesto(ruta=MANIFIESTO):
+    """
+    Lee el manifiesto (vacío si no existe o es de otra versión).
+    """
+    manifiesto = _vacio()
+    if os.path.exists(ruta):
+        try:
+            with open(ruta, encoding='utf-8') as f:
+                datos = json.load(f)
+            if datos.get('version') == VERSION_MANIFIESTO:
+                manifiesto.update(datos)
+        except (OSError, ValueError) as e:
+            print(f"  -> Advertencia: manifiesto inválido ({e}), se reconstruye")
+    manifiesto['_modificadas'] = set()
+    return manifiesto
+
+
+def guardar_manifiesto(manifiesto, ruta=MANIFIESTO):
+    """
+    Guarda el manifiesto de forma atómica. Se combina con la versión en disco
+    (solo se reemplazan las salidas registradas en esta corrida), de modo que
+    dos scripts que terminan a la vez no se pisan los registros.
+    """
+    en_disco = cargar_manifiesto(ruta)
+    en_disco['archivos'].update(manifiesto['archivos'])
+    for clave in manifiesto['_modificadas']:
+        en_disco['salidas'][clave] = manifiesto['salidas'][clave]
+    # Registros de salidas y entradas borradas
+    for seccion in ('salidas', 'archivos'):
+        en_disco[seccion] = {clave: registro for clave, registro in en_disco[seccion].items()
+                             if os.path.exists(clave)}
+    en_disco.pop('_modificadas')
+
+    os.makedirs(os.path.dirname(ruta) or '.', exist_ok=True)
+
+    def _escribir(tmp):
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(en_disco, f, ensure_ascii=False, indent=1, sort_keys=True)
+
+    guardar_atomico(ruta, _escribir)
+
+
+# ============================================================
+# ESTADO DE LAS SALIDAS
+# ============================================================
+
+def _clave(ruta):
+    return os.path.normpath(ruta)
+
+
+def _firma(ruta):
+    """(tamaño, mtime) de un archivo, o None si no existe."""
+    try:
+        info = os.stat(ruta)
+    except OSError:
+        return None
+    return [info.st_size, info.st_mtime_ns]
+
+
+def hash_entrada(manifiesto, ruta):
+    """
+    Hash del contenido de una entrada; solo se relee si cambió su tamaño o mtime.
+    """
+    firma = _firma(ruta)
+    if firma is None:
+        return 'ausente'
+    clave = _clave(ruta)
+    previo = manifiesto['archivos'].get(clave)
+    if previo is not None and previo['firma'] == firma:
+        return previo['sha1']
+    sha1 = hash_archivo(ruta)
+    manifiesto['archivos'][clave] = {'firma': firma, 'sha1': sha1}
+    return sha1
+
+
+def _estado(manifiesto, dep):
+    """Registro de una salida según el estado actual de sus dependencias."""
+    return {
+        'entradas': {_clave(r): hash_entrada(manifiesto, r) for r in dep['entradas']},
+        # Normalizado por JSON (tuplas -> listas) para comparar con lo guardado
+        'parametros': json.loads(json.dumps(dep['parametros'], sort_keys=True, default=str)),
+        'codigo': dep['codigo'],
+    }
+
+
+def planificar(manifiesto, salidas, forzar=False):
+    """
+    Decide qué salidas hay que recalcular.
+
+    Args:
+        manifiesto: Manifiesto cargado con cargar_manifiesto()
+        salidas: {ruta de salida: dependencia(...)}
+        forzar: Recalcular todas
+
+    Returns:
+        {ruta de salida: pendiente} solo de las salidas faltantes o
+        desactualizadas (se pasa luego a registrar())
+    """
+    pendientes = {}
+    adoptadas = 0
+    for ruta, dep in salidas.items():
+        clave = _clave(ruta)
+        registro = manifiesto['salidas'].get(clave)
+        existe = os.path.exists(ruta)
+
+        if existe and not forzar and registro is None:
+            # Generada antes del manifiesto: se da por buena
+            manifiesto['salidas'][clave] = _estado(manifiesto, dep)
+            manifiesto['_modificadas'].add(clave)
+            adoptadas += 1
+        elif forzar or not existe or registro != _estado(manifiesto, dep):
+            pendientes[ruta] = {'dependencia': dep, 'firma': _firma(ruta)}
+
+    if adoptadas:
+        print(f"  -> Manifiesto: {adoptadas} salidas existentes sin registro adoptadas "
+              f"(--forzar para recalcularlas)")
+    return pendientes
+
+
+def registrar(manifiesto, pendientes):
+    """
+    Registra en el manifiesto las salidas pendientes que se escribieron en
+    esta corrida (las que fallaron siguen pendientes para la próxima).
+
+    Returns:
+        Número de salidas registradas
+    """
+    n = 0
+    for ruta, pendiente in pendientes.items():
+        firma = _firma(ruta)
+        if firma is None or firma == pendiente['firma']:
+            continue
+        clave = _clave(ruta)
+        manifiesto['salidas'][clave] = _estado(manifiesto, pendiente['dependencia'])
+        manifiesto['_modificadas'].add(clave)
+        n += 1
+    return n
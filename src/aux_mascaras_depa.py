@@ -0,0 +1,194 @@
+#!/usr/bin/env python
+# coding: utf-8
+"""
+aux_mascaras_depa.py - Índice de máscaras departamentales reutilizable
+
+Rasteriza los polígonos de peru32.geojson una sola vez por grilla destino y
+guarda una matriz de pesos (celdas × departamentos). Con ella el promedio
+espacial de todos los departamentos sale de un único producto matricial:
+    (time, celdas) @ (celdas, departamentos)
+
+El índice se guarda en disco, identificado por la definición de la grilla,
+las opciones de ponderación y el hash del geojson.
+"""
+
+import os
+import hashlib
+import numpy as np
+import pandas as pd
+import geopandas as gpd
+from affine import Affine
+from rasterio.features import geometry_mask
+
+from aux_hash import hash_archivo
+from aux_paralelo import guardar_atomico
+
+CACHE_DIR = os.path.join("data", "cache", "mascaras")
+
+# Índices ya construidos en este proceso
+_indices = {}
+
+
+def hash_archivo_geo(geo_file):
+    """
+    Devuelve el hash SHA1 del contenido del archivo geojson.
+    """
+    return hash_archivo(geo_file)
+
+
+def _transform_grilla(lats, lons):
+    """
+    Transformación afín de una grilla regular (acepta latitudes ascendentes).
+    """
+    dx = float(lons[1] - lons[0]) if len(lons) > 1 else 1.0
+    dy = float(lats[1] - lats[0]) if len(lats) > 1 else 1.0
+    return (Affine.translation(float(lons[0]) - dx / 2, float(lats[0]) - dy / 2)
+            * Affine.scale(dx, dy))
+
+
+def _clave_indice(lats, lons, hash_geo, fraccional, pesos_coslat, factor, campo):
+    """
+    Clave única del índice: grilla + geojson + opciones.
+    """
+    sha = hashlib.sha1()
+    sha.update(np.asarray(lats, dtype=float).tobytes())
+    sha.update(np.asarray(lons, dtype=float).tobytes())
+    sha.update(f"{hash_geo}|{fraccional}|{pesos_coslat}|{factor}|{campo}".encode())
+    return sha.hexdigest()[:20]
+
+
+def _rasterizar(geom, lats, lons, fraccional, factor):
+    """
+    Devuelve la fracción de cada celda cubierta por la geometría.
+    Sin modo fraccional: 1 si el centro de la celda cae dentro (igual que rio.clip).
+    """
+    transform = _transform_grilla(lats, lons)
+    forma = (len(lats), len(lons))
+
+    if not fraccional:
+        dentro = geometry_mask([geom], out_shape=forma, transform=transform,
+                               all_touched=False, invert=True)
+        return dentro.astype(float)
+
+    # Sobremuestreo: cada celda se divide en factor × factor subceldas
+    fino = geometry_mask([geom], out_shape=(forma[0] * factor, forma[1] * factor),
+                         transform=transform * Affine.scale(1.0 / factor),
+                         all_touched=False, invert=True)
+    return fino.reshape(forma[0], factor, forma[1], factor).mean(axis=(1, 3))
+
+
+def construir_indice_departamentos(geo_file, lats, lons, fraccional=False,
+                                   pesos_coslat=False, factor=10,
+                                   campo='DEPARTAMEN', gdf=None,
+                                   cache_dir=CACHE_DIR):
+    """
+    Construye (o recupera de caché) el índice de máscaras departamentales.
+
+    Args:
+        geo_file: Ruta al geojson de departamentos
+        lats, lons: Coordenadas de la grilla destino
+        fraccional: Usar fracción de área cubierta de cada celda
+        pesos_coslat: Ponderar cada celda por cos(lat)
+        factor: Sobremuestreo por eje para el modo fraccional
+        campo: Columna con el nombre del departamento
+        gdf: GeoDataFrame ya cargado (evita releer geo_file)
+        cache_dir: Carpeta de caché en disco
+
+    Returns:
+        Diccionario con 'departamentos' (lista) y 'pesos' (celdas × departamentos)
+    """
+    lats = np.asarray(lats, dtype=float)
+    lons = np.asarray(lons, dtype=float)
+    hash_geo = hash_archivo_geo(geo_file)
+    clave = _clave_indice(lats, lons, hash_geo, fraccional, pesos_coslat, factor, campo)
+
+    if clave in _indices:
+        return _indices[clave]
+
+    ruta_cache = os.path.join(cache_dir, f"mascara_{clave}.npz")
+    if os.path.exists(ruta_cache):
+        try:
+            with np.load(ruta_cache) as datos:
+                indice = {
+                    'departamentos': [str(d) for d in datos['departamentos']],
+                    'pesos': datos['pesos'],
+                }
+            _indices[clave] = indice
+            return indice
+        except Exception as e:
+            print(f"  -> Advertencia: caché de máscaras inválida ({e}), recalculando")
+
+    if gdf is None:
+        gdf = gpd.read_file(geo_file)
+    if gdf.crs is not None and gdf.crs.to_epsg() != 4326:
+        gdf = gdf.to_crs("EPSG:4326")
+
+    coslat = np.cos(np.deg2rad(lats))[:, None] * np.ones((1, len(lons)))
+
+    departamentos = []
+    columnas = []
+    for _, row in gdf.iterrows():
+        peso = _rasterizar(row.geometry, lats, lons, fraccional, factor)
+        if pesos_coslat:
+            peso = peso * coslat
+
+        if not np.any(peso > 0):
+            print(f"  -> Advertencia: Sin celdas para {row[campo]}")
+            continue
+
+        departamentos.append(row[campo])
+        columnas.append(peso.ravel())
+
+    pesos = np.stack(columnas, axis=1) if columnas else np.zeros((lats.size * lons.size, 0))
+    indice = {'departamentos': departamentos, 'pesos': pesos}
+
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        # Atómico: varios procesos de trabajo pueden construir la misma máscara
+        # (el temporal conserva la extensión .npz, np.savez no agrega otra)
+        guardar_atomico(ruta_cache, lambda tmp: np.savez(
+            tmp, departamentos=np.array(departamentos), pesos=pesos))
+    except Exception as e:
+        print(f"  -> Advertencia: no se pudo guardar caché de máscaras: {e}")
+
+    _indices[clave] = indice
+    return indice
+
+
+def _medias_bloque(datos, W):
+    """Promedios por departamento de un arreglo (time, lat, lon) -> (time, departamentos)."""
+    X = datos.reshape(datos.shape[0], -1)
+    valido = ~np.isnan(X)
+    suma = np.where(valido, X, 0.0) @ W
+    peso_valido = valido.astype(W.dtype) @ W
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return suma / peso_valido
+
+
+def promedios_departamentos(da, indice):
+    """
+    Calcula el promedio espacial (ponderado) de cada departamento para
+    todos los pasos de tiempo con un único producto matricial.
+    Los NaN se excluyen del promedio, igual que mean(skipna=True).
+    Si da está respaldado por dask se calcula por bloques de tiempo.
+
+    Returns:
+        DataFrame (time × departamento)
+    """
+    ordenado = da.transpose('time', 'lat', 'lon')
+    W = indice['pesos']
+
+    if ordenado.chunks is not None:
+        import dask
+        import dask.array as dask_array
+        datos = ordenado.chunk({'lat': -1, 'lon': -1}).data
+        medias = dask_array.map_blocks(
+            _medias_bloque, datos, W, dtype=np.float64, drop_axis=2,
+            chunks=(datos.chunks[0], (W.shape[1],)))
+        medias, = dask.compute(medias)
+    else:
+        medias = _medias_bloque(ordenado.values, W)
+
+    return pd.DataFrame(medias, index=da['time'].to_index(),
+                        columns=indice['departamentos'])
@@ -0,0 +1,197 @@
+#!/usr/bin/env python
+# coding: utf-8
+"""
+aux_paralelo.py - Ejecución en paralelo de combinaciones de preprocesamiento
+
+Las combinaciones de los scripts 01_preproc_* son independientes entre sí.
+Este módulo las reparte en un pool de procesos, escribe las salidas de forma
+atómica (archivo temporal + renombrado) y muestra un único reporte de avance.
+"""
+
+import os
+import io
+import sys
+import time
+import argparse
+import contextlib
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from aux_perfilado import (agregar_argumentos, ejecutar_combinacion, medir_etapa,
+                           ruta_log, corrida_actual, leer_registro,
+                           imprimir_resumen_etapas, conservar_perfiles_lentos)
+import aux_perezoso
+import aux_cache_entradas
+
+
+def crear_parser(descripcion, perezoso=False, cache_entradas=False):
+    """
+    Parser de línea de comandos común a los scripts de preprocesamiento.
+    Con perezoso=True agrega además las opciones del modo dask (--lazy) y con
+    cache_entradas=True la de la caché de entradas (--sin-cache-entradas).
+    """
+    parser = argparse.ArgumentParser(description=descripcion)
+    parser.add_argument(
+        "--workers", type=int, default=None,
+        help="Número de procesos en paralelo (por defecto: núcleos disponibles; 1 = serial)")
+    agregar_argumentos(parser)
+    if perezoso:
+        aux_perezoso.agregar_argumentos(parser)
+    if cache_entradas:
+        aux_cache_entradas.agregar_argumentos(parser)
+    return parser
+
+
+def resolver_n_workers(n_workers, n_tareas):
+    """
+    Número efectivo de procesos: nunca más que tareas ni menos que 1.
+    """
+    if n_workers is None:
+        n_workers = os.cpu_count() or 1
+    return max(1, min(int(n_workers), n_tareas))
+
+
+def ruta_temporal(ruta):
+    """
+    Ruta temporal en el mismo directorio que conserva la extensión
+    (np.save, to_netcdf, etc. dependen de ella).
+    """
+    directorio, nombre = os.path.split(ruta)
+    base, ext = os.path.splitext(nombre)
+    return os.path.join(directorio, f".{base}.{os.getpid()}.tmp{ext}")
+
+
+@medir_etapa('guardar')
+def guardar_atomico(ruta, funcion_guardado):
+    """
+    Escribe una salida de forma atómica: funcion_guardado(ruta_tmp) escribe
+    en un temporal del mismo directorio que luego se renombra a la ruta final.
+    Si la escritura falla no queda ningún archivo parcial.
+    """
+    tmp = ruta_temporal(ruta)
+    try:
+        funcion_guardado(tmp)
+        os.replace(tmp, ruta)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+    return ruta
+
+
+def _ejecutar_tarea(funcion, args, capturar):
+    """
+    Ejecuta una combinación y devuelve (exito, resultado, error, segundos, log).
+    Con capturar=True la salida estándar se devuelve como texto para que el
+    proceso principal la imprima en bloque, sin mezclarse con otras tareas.
+    """
+    inicio = time.time()
+    buffer = io.StringIO()
+    salida = contextlib.redirect_stdout(buffer) if capturar else contextlib.nullcontext()
+    try:
+        with salida:
+            resultado = ejecutar_combinacion(funcion, args, _etiqueta(args))
+        exito = resultado is not False
+        error = None if exito else "la tarea devolvió False"
+    except Exception as e:
+        resultado = None
+        exito = False
+        error = f"{type(e).__name__}: {e}"
+    return exito, resultado, error, time.time() - inicio, buffer.getvalue()
+
+
+def _etiqueta(combinacion):
+    return " | ".join(str(c) for c in combinacion)
+
+
+def ejecutar_combinaciones(funcion, combinaciones, n_workers=None, titulo="Procesando"):
+    """
+    Ejecuta funcion(*combinacion) para cada combinación, en paralelo.
+
+    Args:
+        funcion: Función a nivel de módulo (debe poder serializarse)
+        combinaciones: Lista de tuplas de argumentos
+        n_workers: Número de procesos (None = núcleos disponibles, 1 = serial)
+        titulo: Texto del encabezado del reporte
+
+    Returns:
+        Diccionario resumen con conteos, tiempos y combinaciones fallidas
+    """
+    combinaciones = [tuple(c) for c in combinaciones]
+    total = len(combinaciones)
+    contexto = contextlib.nullcontext()
+    if aux_perezoso.modo_perezoso():
+        # Combinaciones en serie; los procesos pedidos pasan a ser hilos de dask
+        contexto = aux_perezoso.planificador(n_workers)
+        n_workers = 1
+    n_workers = resolver_n_workers(n_workers, max(total, 1))
+
+    print(f"\n{titulo}: {total} combinaciones con {n_workers} proceso(s)")
+
+    resumen = {
+        'total': total,
+        'exitos': 0,
+        'errores': 0,
+        'fallidas': [],
+        'resultados': {},
+        'tiempo_tareas': 0.0,
+        'tiempos': {},
+    }
+    inicio = time.time()
+
+    def _registrar(idx, combinacion, exito, resultado, error, segundos, log):
+        if log:
+            sys.stdout.write(log)
+        estado = "✓" if exito else "✗"
+        linea = f"[{idx}/{total}] {estado} {_etiqueta(combinacion)} ({segundos:.1f} s)"
+        if error:
+            linea += f" -> {error}"
+        print(linea, flush=True)
+
+        resumen['tiempo_tareas'] += segundos
+        resumen['tiempos'][_etiqueta(combinacion)] = segundos
+        resumen['resultados'][combinacion] = resultado
+        if exito:
+            resumen['exitos'] += 1
+        else:
+            resumen['errores'] += 1
+            resumen['fallidas'].append((combinacion, error))
+
+    if n_workers == 1:
+        with contexto:
+            for idx, combinacion in enumerate(combinaciones, 1):
+                _registrar(idx, combinacion, *_ejecutar_tarea(funcion, combinacion, False))
+    else:
+        with ProcessPoolExecutor(max_workers=n_workers) as pool:
+            futuros = {
+                pool.submit(_ejecutar_tarea, funcion, combinacion, True): combinacion
+                for combinacion in combinaciones
+            }
+            for idx, futuro in enumerate(as_completed(futuros), 1):
+                combinacion = futuros[futuro]
+                try:
+                    datos = futuro.result()
+                except Exception as e:
+                    # Falla del proceso trabajador (p. ej. memoria insuficiente)
+                    datos = (False, None, f"{type(e).__name__}: {e}", 0.0, "")
+                _registrar(idx, combinacion, *datos)
+
+    resumen['tiempo_total'] = time.time() - inicio
+
+    print("\n" + "-" * 60)
+    print(f"{titulo} - resumen")
+    print(f"  Éxitos: {resumen['exitos']}/{total} | Errores: {resumen['errores']}")
+    print(f"  Tiempo total: {resumen['tiempo_total']:.1f} s "
+          f"(suma de tareas: {resumen['tiempo_tareas']:.1f} s)")
+    for combinacion, error in resumen['fallidas']:
+        print(f"  ✗ {_etiqueta(combinacion)}: {error}")
+
+    # Tiempos por etapa de estas combinaciones (registro de aux_perfilado)
+    if ruta_log() is not None:
+        registros = [r for r in leer_registro(corrida=corrida_actual())
+                     if r.get('combinacion') in resumen['tiempos']]
+        imprimir_resumen_etapas(registros)
+        print(f"  Registro: {ruta_log()}")
+    print("-" * 60)
+
+    conservar_perfiles_lentos(resumen['tiempos'])
+
+    return resumen
@@ -0,0 +1,238 @@
+#!/usr/bin/env python
+# coding: utf-8
+"""
+aux_perezoso.py - Modo perezoso (dask) para entradas que no caben en memoria
+
+Por defecto los scripts 01_preproc_* leen cada archivo completo en memoria.
+Con --lazy los archivos se abren en bloques (chunks) de dask y los cálculos
+(regrillado, promedios departamentales, momentos, delta, p-values y
+ensemble) se expresan como grafos perezosos que se ejecutan bloque a bloque
+en un planificador local con límite de memoria:
+
+    - con dask.distributed: LocalCluster de un trabajador en el mismo proceso
+      (hilos = --workers) con memory_limit = --memoria-max; al acercarse al
+      límite el trabajador vuelca bloques a disco o se pausa
+    - sin dask.distributed: planificador de hilos de dask; la memoria queda
+      acotada solo por el tamaño de bloque (--bloque-mb) × hilos
+
+En modo perezoso las combinaciones se procesan en serie: el paralelismo lo
+aporta dask dentro de cada combinación.
+
+Dentro de entradas_compartidas() (lo usa el pipeline completo,
+01_preproc_pipeline.py) cada archivo se lee una sola vez: abrir_dataset
+devuelve el mismo dataset en memoria a todas las etapas que lo piden, hasta
+que se libera con liberar_entrada().
+
+Fuera del modo perezoso, si la caché de entradas está activa
+(aux_cache_entradas), los archivos se abren desde sus copias .npy mapeadas
+en memoria en lugar de decodificar el NetCDF.
+
+dask es una dependencia opcional: solo se importa con --lazy.
+"""
+
+import os
+import warnings
+import contextlib
+
+import xarray as xr
+
+from aux_perfilado import medir_etapa
+from aux_cache_entradas import abrir_entrada, cache_entradas_activa
+
+BLOQUE_MB = 128         # tamaño objetivo de cada bloque de dask
+MEMORIA_MAX = "4GB"     # límite de memoria del trabajador de dask
+
+# La configuración viaja en variables de entorno, igual que en aux_perfilado
+_ENV_PEREZOSO = "PREPROC_PEREZOSO"
+_ENV_BLOQUE = "PREPROC_BLOQUE_MB"
+_ENV_MEMORIA = "PREPROC_MEMORIA_MAX"
+
+# Datasets ya leídos dentro de entradas_compartidas() ({ruta absoluta: Dataset})
+_compartidas = None
+
+
+# ============================================================
+# CONFIGURACIÓN
+# ============================================================
+
+def agregar_argumentos(parser):
+    """
+    Agrega --lazy, --bloque-mb y --memoria-max al parser común de los scripts.
+    """
+    parser.add_argument(
+        "--lazy", action="store_true",
+        help="Procesar por bloques con dask (entradas más grandes que la memoria)")
+    parser.add_argument(
+        "--bloque-mb", type=int, default=BLOQUE_MB,
+        help=f"Con --lazy: tamaño objetivo de cada bloque en MB (por defecto {BLOQUE_MB})")
+    parser.add_argument(
+        "--memoria-max", default=MEMORIA_MAX,
+        help=f"Con --lazy: límite de memoria del planificador, p. ej. 2GB "
+             f"(por defecto {MEMORIA_MAX})")
+    return parser
+
+
+def configurar_perezoso(args):
+    """
+    Activa o desactiva el modo perezoso según los argumentos del script.
+    Falla temprano si se pidió --lazy y dask no está instalado.
+    """
+    if not getattr(args, 'lazy', False):
+        os.environ.pop(_ENV_PEREZOSO, None)
+        return False
+
+    try:
+        import dask  # noqa: F401
+    except ImportError:
+        raise SystemExit("--lazy requiere dask: conda install -c conda-forge dask")
+
+    os.environ[_ENV_PEREZOSO] = "1"
+    os.environ[_ENV_BLOQUE] = str(getattr(args, 'bloque_mb', BLOQUE_MB))
+    os.environ[_ENV_MEMORIA] = str(getattr(args, 'memoria_max', MEMORIA_MAX))
+    return True
+
+
+def modo_perezoso():
+    """True si el script se ejecuta con --lazy."""
+    return os.environ.get(_ENV_PEREZOSO) == "1"
+
+
+def es_perezoso(obj):
+    """True si obj (array, DataArray, Dataset) está respaldado por dask."""
+    try:
+        import dask
+    except ImportError:
+        return False
+    return dask.is_dask_collection(obj)
+
+
+# ============================================================
+# LECTURA
+# ============================================================
+
+def chunks_lectura(enteras=()):
+    """
+    Bloques de lectura: las dimensiones de `enteras` quedan en un solo bloque
+    (p. ej. 'time' para estadísticas temporales, 'lat'/'lon' para regrillar)
+    y el resto se divide en bloques de ~BLOQUE_MB. 'lon' (la dimensión más
+    interna de los archivos) nunca se divide, para que cada bloque se lea
+    como filas contiguas del archivo.
+    """
+    enteras = set(enteras) | {'lon'}
+    return {dim: (-1 if dim in enteras else 'auto')
+            for dim in ('time', 'lat', 'lon')}
+
+
+def _leer_completo(ruta, cache):
+    """Dataset en memoria: desde la caché de entradas si está activa, o del NetCDF."""
+    if cache and cache_entradas_activa():
+        ds = abrir_entrada(ruta)
+        if ds is not None:
+            return ds
+    with xr.open_dataset(ruta) as ds:
+        return ds.load()
+
+
+def abrir_dataset(ruta, enteras=(), cache=True):
+    """
+    Abre un NetCDF según el modo:
+        - normal: lo lee completo y cierra el archivo enseguida; con la caché
+          de entradas activa (y cache=True), lo mapea desde su copia .npy
+        - perezoso: lo abre en bloques de dask (chunks_lectura(enteras)); el
+          archivo se lee durante el cálculo y se cierra al cerrar el dataset
+        - dentro de entradas_compartidas(): lo lee la primera vez y devuelve
+          el mismo dataset en las siguientes
+
+    El dataset devuelto puede compartirse y no debe modificarse en su lugar.
+    En todos los casos puede usarse en un bloque `with`.
+    """
+    if _compartidas is not None and not modo_perezoso():
+        clave = os.path.abspath(ruta)
+        if clave not in _compartidas:
+            _compartidas[clave] = _leer_completo(ruta, cache)
+        return _compartidas[clave]
+
+    if not modo_perezoso():
+        return _leer_completo(ruta, cache)
+
+    import dask
+    with dask.config.set({'array.chunk-size': f"{os.environ.get(_ENV_BLOQUE, BLOQUE_MB)}MiB"}):
+        return xr.open_dataset(ruta, chunks=chunks_lectura(enteras))
+
+
+@contextlib.contextmanager
+def entradas_compartidas():
+    """
+    Dentro del bloque, cada archivo abierto con abrir_dataset se lee una sola
+    vez y se comparte entre todas las etapas del proceso. Al salir se liberan.
+    """
+    global _compartidas
+    previas, _compartidas = _compartidas, {}
+    try:
+        yield
+    finally:
+        _compartidas = previas
+
+
+def compartiendo_entradas():
+    """
+    True si abrir_dataset no decodifica cada vez el archivo completo: dentro
+    de entradas_compartidas() o con la caché de entradas activa.
+    """
+    return not modo_perezoso() and (_compartidas is not None or cache_entradas_activa())
+
+
+def liberar_entrada(ruta):
+    """Quita un archivo de las entradas compartidas (ya no lo usa ninguna etapa)."""
+    if _compartidas is not None:
+        _compartidas.pop(os.path.abspath(ruta), None)
+
+
+# ============================================================
+# EJECUCIÓN
+# ============================================================
+
+@medir_etapa('computar')
+def materializar(*objetos):
+    """
+    Ejecuta juntos los grafos perezosos (las lecturas y pasos comunes se
+    calculan una sola vez) y devuelve los objetos ya en memoria. Acepta
+    tuplas, listas y diccionarios anidados; fuera del modo perezoso los
+    objetos se devuelven sin cambios.
+    """
+    if not modo_perezoso():
+        return objetos
+    import dask
+    # Los avisos de división por cero que en modo normal silencia
+    # np.errstate se emiten en los hilos de dask
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)
+        return dask.compute(*objetos)
+
+
+@contextlib.contextmanager
+def planificador(hilos=None):
+    """
+    Planificador local de dask para el modo perezoso, con límite de memoria
+    si dask.distributed está disponible.
+    """
+    import dask
+
+    hilos = hilos or os.cpu_count() or 1
+    memoria = os.environ.get(_ENV_MEMORIA, MEMORIA_MAX)
+    try:
+        from dask.distributed import Client, LocalCluster
+    except ImportError:
+        print(f"  -> Advertencia: dask.distributed no está instalado; se usa el "
+              f"planificador de hilos sin límite de memoria ({hilos} hilo(s))")
+        with dask.config.set(scheduler='threads', num_workers=hilos):
+            yield None
+        return
+
+    with LocalCluster(n_workers=1, threads_per_worker=hilos, processes=False,
+                      memory_limit=memoria, dashboard_address=None) as cluster, \
+            Client(cluster) as cliente:
+        print(f"  -> Modo perezoso: dask con {hilos} hilo(s), "
+              f"límite de memoria {memoria}, bloques de "
+              f"~{os.environ.get(_ENV_BLOQUE, BLOQUE_MB)} MB")
+        yield cliente
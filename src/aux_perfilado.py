@@ -0,0 +1,381 @@
+#!/usr/bin/env python
+# coding: utf-8
+"""
+aux_perfilado.py - Registro de tiempos y recursos por etapa del preprocesamiento
+
+Las funciones principales del pipeline se decoran con @medir_etapa. Cuando un
+script 01_preproc_* activa el registro (configurar_perfilado), cada llamada
+agrega una línea JSON a data/logs/etapas.jsonl con:
+
+    corrida, script, pid, combinacion, etapa, padre, inicio,
+    pared_s, cpu_s, rss_pico_mb, lectura_bytes, escritura_bytes, ok
+
+    - rss_pico_mb: pico de memoria residente durante la etapa. En Linux se
+      muestrea VmRSS cada INTERVALO_MUESTREO s mientras hay etapas abiertas y,
+      si la etapa elevó VmHWM, se usa ese valor (exacto). No se modifica el
+      estado del proceso: el ru_maxrss que ve el proceso padre (p. ej. los
+      benchmarks) sigue siendo el real. En otros sistemas, pico del proceso
+    - lectura/escritura: bytes leídos/escritos por el proceso (/proc/self/io,
+      no incluye subprocesos como CDO)
+
+Con --profile cada combinación se ejecuta bajo cProfile y se conservan los
+perfiles (.prof) de las combinaciones más lentas en data/logs/perfiles/.
+Sin configurar, los decoradores no hacen nada.
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import pstats
+import cProfile
+import threading
+import functools
+import contextlib
+from datetime import datetime
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+LOGS_DIR = os.path.join("data", "logs")
+LOG_ETAPAS = os.path.join(LOGS_DIR, "etapas.jsonl")
+PERFILES_DIR = os.path.join(LOGS_DIR, "perfiles")
+N_PERFILES = 3   # combinaciones más lentas cuyo perfil se conserva
+INTERVALO_MUESTREO = 0.02  # s entre lecturas de VmRSS durante las etapas
+
+# La configuración viaja en variables de entorno para que la hereden los
+# procesos de trabajo de aux_paralelo
+_ENV_LOG = "PREPROC_LOG_ETAPAS"
+_ENV_CORRIDA = "PREPROC_CORRIDA"
+_ENV_SCRIPT = "PREPROC_SCRIPT"
+_ENV_PERFILES = "PREPROC_PERFILES"
+
+# Estado del proceso: combinación en curso, pila de etapas abiertas y pid
+# del proceso donde corre el hilo de muestreo
+_estado = {'combinacion': None, 'pila': [], 'muestreo': None}
+
+
+# ============================================================
+# CONFIGURACIÓN
+# ============================================================
+
+def agregar_argumentos(parser):
+    """
+    Agrega --profile y --log-etapas al parser común de los scripts.
+    """
+    parser.add_argument(
+        "--log-etapas", default=LOG_ETAPAS,
+        help=f"Registro JSONL de tiempos por etapa (por defecto: {LOG_ETAPAS}; '' = desactivado)")
+    parser.add_argument(
+        "--profile", type=int, nargs="?", const=N_PERFILES, default=0, metavar="N",
+        help=f"Perfilar con cProfile y conservar las N combinaciones más lentas "
+             f"(por defecto {N_PERFILES})")
+    return parser
+
+
+def configurar_perfilado(args, script=None):
+    """
+    Activa el registro por etapas según los argumentos del script
+    (--log-etapas, --profile).
+    """
+    ruta_log = getattr(args, 'log_etapas', LOG_ETAPAS)
+    n_perfiles = getattr(args, 'profile', 0) or 0
+
+    os.environ[_ENV_CORRIDA] = f"{datetime.now():%Y%m%dT%H%M%S}-{os.getpid()}"
+    os.environ[_ENV_SCRIPT] = script or os.path.basename(sys.argv[0])
+    if ruta_log:
+        os.makedirs(os.path.dirname(ruta_log) or '.', exist_ok=True)
+        os.environ[_ENV_LOG] = ruta_log
+    else:
+        os.environ.pop(_ENV_LOG, None)
+    if n_perfiles > 0:
+        os.environ[_ENV_PERFILES] = str(n_perfiles)
+    else:
+        os.environ.pop(_ENV_PERFILES, None)
+
+
+def ruta_log():
+    """Ruta del registro activo, o None si está desactivado."""
+    return os.environ.get(_ENV_LOG) or None
+
+
+def corrida_actual():
+    """Identificador de la corrida actual (fecha + pid del script)."""
+    return os.environ.get(_ENV_CORRIDA)
+
+
+def n_perfiles():
+    """Número de perfiles a conservar (0 = sin --profile)."""
+    return int(os.environ.get(_ENV_PERFILES, 0))
+
+
+# ============================================================
+# MEDICIÓN
+# ============================================================
+
+def _leer_io():
+    """(bytes leídos, bytes escritos) del proceso, o (None, None)."""
+    try:
+        with open("/proc/self/io") as f:
+            campos = dict(linea.split(":") for linea in f)
+        return int(campos['rchar']), int(campos['wchar'])
+    except (OSError, KeyError, ValueError):
+        return None, None
+
+
+def _leer_status_mb(campo):
+    """Campo de memoria de /proc/self/status (p. ej. 'VmRSS') en MB, o None."""
+    try:
+        with open("/proc/self/status") as f:
+            for linea in f:
+                if linea.startswith(campo + ":"):
+                    return int(linea.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+
+def _leer_rss_mb():
+    """Memoria residente actual (MB), o None fuera de Linux."""
+    return _leer_status_mb("VmRSS")
+
+
+def _leer_hwm_mb():
+    """Pico de memoria residente del proceso (MB)."""
+    hwm = _leer_status_mb("VmHWM")
+    if hwm is None and resource is not None:
+        escala = 1024 ** 2 if sys.platform == 'darwin' else 1024
+        hwm = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / escala
+    return hwm
+
+
+def _muestrear():
+    """Hilo de muestreo: eleva el pico de las etapas abiertas con VmRSS."""
+    while True:
+        time.sleep(INTERVALO_MUESTREO)
+        abiertas = list(_estado['pila'])
+        if not abiertas:
+            continue
+        rss = _leer_rss_mb()
+        if rss is None:
+            return
+        for e in abiertas:
+            if rss > e['pico']:
+                e['pico'] = rss
+
+
+def _iniciar_muestreo():
+    """Arranca el hilo de muestreo una vez por proceso (también tras un fork)."""
+    if _estado['muestreo'] != os.getpid() and _leer_rss_mb() is not None:
+        _estado['muestreo'] = os.getpid()
+        threading.Thread(target=_muestrear, name="muestreo-rss", daemon=True).start()
+
+
+def _escribir_registro(registro):
+    ruta = ruta_log()
+    if ruta is None:
+        return
+    linea = json.dumps(registro, ensure_ascii=False) + "\n"
+    # Una sola escritura en modo append: las líneas de distintos procesos no se mezclan
+    with open(ruta, "a") as f:
+        f.write(linea)
+
+
+@contextlib.contextmanager
+def etapa(nombre):
+    """
+    Mide el bloque como una etapa del pipeline y la agrega al registro.
+    """
+    if ruta_log() is None:
+        yield
+        return
+
+    _iniciar_muestreo()
+    pila = _estado['pila']
+    hwm0 = _leer_hwm_mb()
+    actual = {'nombre': nombre, 'pico': _leer_rss_mb() or 0.0}
+    pila.append(actual)
+    lectura0, escritura0 = _leer_io()
+    inicio = time.time()
+    t0, cpu0 = time.perf_counter(), time.process_time()
+    ok = True
+    try:
+        yield
+    except BaseException:
+        ok = False
+        raise
+    finally:
+        pared = time.perf_counter() - t0
+        cpu = time.process_time() - cpu0
+        lectura1, escritura1 = _leer_io()
+        pila.pop()
+        pico = max(actual['pico'], _leer_rss_mb() or 0)
+        hwm1 = _leer_hwm_mb()
+        # Si el pico del proceso subió, se alcanzó dentro de esta etapa
+        if hwm1 is not None and (hwm0 is None or hwm1 > hwm0 or not pico):
+            pico = max(pico, hwm1)
+        if pila:
+            pila[-1]['pico'] = max(pila[-1]['pico'], pico)
+
+        _escribir_registro({
+            'corrida': corrida_actual(),
+            'script': os.environ.get(_ENV_SCRIPT),
+            'pid': os.getpid(),
+            'combinacion': _estado['combinacion'],
+            'etapa': nombre,
+            'padre': pila[-1]['nombre'] if pila else None,
+            'inicio': round(inicio, 3),
+            'pared_s': round(pared, 6),
+            'cpu_s': round(cpu, 6),
+            'rss_pico_mb': round(pico, 1),
+            'lectura_bytes': None if lectura0 is None else lectura1 - lectura0,
+            'escritura_bytes': None if escritura0 is None else escritura1 - escritura0,
+            'ok': ok,
+        })
+
+
+def medir_etapa(nombre=None):
+    """
+    Decorador: registra cada llamada a la función como una etapa
+    (por defecto con el nombre de la función).
+    """
+    def decorador(funcion):
+        etiqueta = nombre or funcion.__name__
+
+        @functools.wraps(funcion)
+        def envoltura(*args, **kwargs):
+            with etapa(etiqueta):
+                return funcion(*args, **kwargs)
+        return envoltura
+    return decorador
+
+
+# ============================================================
+# COMBINACIONES Y PERFILES (usado por aux_paralelo)
+# ============================================================
+
+def ruta_perfil(etiqueta_combinacion):
+    """Archivo .prof de una combinación de la corrida actual."""
+    nombre = re.sub(r'[^A-Za-z0-9.-]+', '_', etiqueta_combinacion).strip('_')
+    return os.path.join(PERFILES_DIR, corrida_actual() or "sin-corrida", f"{nombre}.prof")
+
+
+def ejecutar_combinacion(funcion, args, etiqueta_combinacion):
+    """
+    Ejecuta funcion(*args) como etapa 'combinacion' y, con --profile,
+    bajo cProfile (el perfil se guarda en ruta_perfil()).
+    """
+    _estado['combinacion'] = etiqueta_combinacion
+    try:
+        with etapa('combinacion'):
+            if n_perfiles() <= 0:
+                return funcion(*args)
+            perfil = cProfile.Profile()
+            try:
+                return perfil.runcall(funcion, *args)
+            finally:
+                ruta = ruta_perfil(etiqueta_combinacion)
+                os.makedirs(os.path.dirname(ruta), exist_ok=True)
+                perfil.dump_stats(ruta)
+    finally:
+        _estado['combinacion'] = None
+
+
+def conservar_perfiles_lentos(tiempos, n=None, n_funciones=15):
+    """
+    Conserva solo los perfiles de las n combinaciones más lentas, borra el
+    resto y muestra las funciones con más tiempo acumulado de la más lenta.
+
+    Args:
+        tiempos: {etiqueta de combinación: segundos}
+    """
+    n = n_perfiles() if n is None else n
+    if n <= 0 or not tiempos:
+        return []
+
+    ordenadas = sorted(tiempos, key=tiempos.get, reverse=True)
+    conservadas = []
+    for i, etiqueta_combinacion in enumerate(ordenadas):
+        ruta = ruta_perfil(etiqueta_combinacion)
+        if not os.path.exists(ruta):
+            continue
+        if i < n:
+            conservadas.append(ruta)
+        else:
+            os.remove(ruta)
+
+    if conservadas:
+        print(f"\nPerfiles de las {len(conservadas)} combinaciones más lentas:")
+        for ruta in conservadas:
+            print(f"  {ruta}")
+        print(f"\nMás lenta: {ordenadas[0]} ({tiempos[ordenadas[0]]:.1f} s)")
+        pstats.Stats(conservadas[0], stream=sys.stdout).sort_stats(
+            'cumulative').print_stats(n_funciones)
+    return conservadas
+
+
+# ============================================================
+# RESUMEN
+# ============================================================
+
+def leer_registro(ruta=None, corrida=None):
+    """
+    Registros del log JSONL (opcionalmente solo de una corrida).
+    """
+    ruta = ruta or ruta_log() or LOG_ETAPAS
+    if not os.path.exists(ruta):
+        return []
+    registros = []
+    with open(ruta) as f:
+        for linea in f:
+            try:
+                registro = json.loads(linea)
+            except ValueError:
+                continue
+            if corrida is None or registro.get('corrida') == corrida:
+                registros.append(registro)
+    return registros
+
+
+def resumir_etapas(registros):
+    """
+    Resumen por etapa: llamadas, tiempo total/medio/máximo, CPU, pico de
+    memoria y MB leídos/escritos, ordenado por tiempo total.
+    """
+    resumen = {}
+    for r in registros:
+        e = resumen.setdefault(r['etapa'], {
+            'etapa': r['etapa'], 'llamadas': 0, 'pared_s': 0.0, 'max_s': 0.0,
+            'cpu_s': 0.0, 'rss_pico_mb': 0.0, 'lectura_mb': 0.0, 'escritura_mb': 0.0,
+            'errores': 0})
+        e['llamadas'] += 1
+        e['pared_s'] += r['pared_s']
+        e['max_s'] = max(e['max_s'], r['pared_s'])
+        e['cpu_s'] += r['cpu_s']
+        e['rss_pico_mb'] = max(e['rss_pico_mb'], r.get('rss_pico_mb') or 0)
+        e['lectura_mb'] += (r.get('lectura_bytes') or 0) / 1024 ** 2
+        e['escritura_mb'] += (r.get('escritura_bytes') or 0) / 1024 ** 2
+        e['errores'] += 0 if r.get('ok', True) else 1
+
+    filas = sorted(resumen.values(), key=lambda e: e['pared_s'], reverse=True)
+    for e in filas:
+        e['media_s'] = e['pared_s'] / e['llamadas']
+    return filas
+
+
+def imprimir_resumen_etapas(registros):
+    """
+    Imprime la tabla de resumen por etapa.
+    """
+    filas = resumir_etapas(registros)
+    if not filas:
+        return
+    print(f"\n{'Etapa':<28} {'n':>5} {'total s':>9} {'media s':>9} {'máx s':>8} "
+          f"{'CPU s':>8} {'RSS MB':>8} {'leído MB':>9} {'escrito MB':>10}")
+    for e in filas:
+        print(f"{e['etapa']:<28} {e['llamadas']:>5} {e['pared_s']:>9.2f} {e['media_s']:>9.3f} "
+              f"{e['max_s']:>8.2f} {e['cpu_s']:>8.2f} {e['rss_pico_mb']:>8.0f} "
+              f"{e['lectura_mb']:>9.1f} {e['escritura_mb']:>10.1f}")
@@ -0,0 +1,272 @@
+#!/usr/bin/env python
+# coding: utf-8
+"""
+aux_regrid.py - Regrillado con pesos precalculados (matriz dispersa)
+
+Para cada par (grilla origen, grilla destino) y método se calcula una sola
+vez la matriz de pesos W (celdas destino × celdas origen), que se guarda en
+data/cache/regrid/. Regrillar un archivo es entonces un producto disperso
+W @ X sobre todos los pasos de tiempo, sin volver a buscar índices.
+
+Métodos:
+    - 'bilineal':     igual que ds.interp(method='linear'): 2×2 vecinos,
+                      NaN si alguno de los vecinos es NaN o si el punto
+                      cae fuera de la grilla origen
+    - 'conservativo': promedio ponderado por el área de solapamiento de
+                      las celdas (primer orden); los NaN del origen se
+                      excluyen y el peso se renormaliza
+"""
+
+import os
+import hashlib
+
+import numpy as np
+import xarray as xr
+from scipy import sparse
+
+from aux_paralelo import guardar_atomico
+from aux_grilla import bordes_celdas
+
+try:
+    import dask.array as dask_array
+except ImportError:  # solo se usa en modo perezoso (--lazy)
+    dask_array = None
+
+CACHE_DIR = os.path.join("data", "cache", "regrid")
+METODOS = ('bilineal', 'conservativo')
+# Pasos de tiempo por producto disperso (acota la memoria temporal)
+PASOS_BLOQUE = 256
+
+# Pesos ya construidos en este proceso
+_regridders = {}
+
+
+# ============================================================
+# PESOS 1D
+# ============================================================
+
+def _pesos_lineales_1d(x_src, x_dst):
+    """
+    Pesos de interpolación lineal 1D (n_dst × n_src), con los mismos
+    vecinos que scipy.interpolate.interp1d: para un punto sobre un nodo
+    interior se usan ese nodo y el anterior (el anterior con peso 0, de modo
+    que sus NaN se propagan igual que en ds.interp). Las filas de puntos
+    fuera de la grilla quedan vacías.
+    """
+    orden = np.argsort(x_src, kind='mergesort')
+    x = x_src[orden]
+    n = len(x)
+
+    hi = np.clip(np.searchsorted(x, x_dst), 1, n - 1)
+    lo = hi - 1
+    t = (x_dst - x[lo]) / (x[hi] - x[lo])
+    dentro = (x_dst >= x[0]) & (x_dst <= x[-1])
+
+    filas = np.flatnonzero(dentro)
+    return sparse.csr_matrix(
+        (np.concatenate([1.0 - t[filas], t[filas]]),
+         (np.concatenate([filas, filas]), np.concatenate([orden[lo[filas]], orden[hi[filas]]]))),
+        shape=(len(x_dst), n))
+
+
+def _pesos_solapamiento_1d(x_src, x_dst, es_latitud=False):
+    """
+    Fracción de cada celda destino cubierta por cada celda origen
+    (n_dst × n_src), normalizada por la parte cubierta. En latitud el
+    solapamiento se mide en sin(lat) (área sobre la esfera).
+    """
+    b_src, b_dst = bordes_celdas(x_src), bordes_celdas(x_dst)
+    if es_latitud:
+        def transformar(b):
+            return np.sin(np.deg2rad(np.clip(b, -90, 90)))
+        b_src, b_dst = transformar(b_src), transformar(b_dst)
+
+    inf_src, sup_src = np.minimum(b_src[:-1], b_src[1:]), np.maximum(b_src[:-1], b_src[1:])
+    inf_dst, sup_dst = np.minimum(b_dst[:-1], b_dst[1:]), np.maximum(b_dst[:-1], b_dst[1:])
+
+    # Celdas origen contiguas y ordenadas: candidatas por búsqueda binaria
+    orden = np.argsort(inf_src, kind='mergesort')
+    inf_ord, sup_ord = inf_src[orden], sup_src[orden]
+    filas, columnas, valores = [], [], []
+    for i in range(len(inf_dst)):
+        j0 = np.searchsorted(sup_ord, inf_dst[i], side='right')
+        j1 = np.searchsorted(inf_ord, sup_dst[i], side='left')
+        for j in range(j0, j1):
+            solape = min(sup_dst[i], sup_ord[j]) - max(inf_dst[i], inf_ord[j])
+            if solape > 0:
+                filas.append(i)
+                columnas.append(orden[j])
+                valores.append(solape)
+
+    W = sparse.csr_matrix((valores, (filas, columnas)), shape=(len(x_dst), len(x_src)))
+    suma = np.asarray(W.sum(axis=1)).ravel()
+    escala = np.divide(1.0, suma, out=np.zeros_like(suma), where=suma > 0)
+    return sparse.diags(escala) @ W
+
+
+# ============================================================
+# CONSTRUCCIÓN Y CACHÉ
+# ============================================================
+
+def _clave_regrid(metodo, lat_src, lon_src, lat_dst, lon_dst):
+    """
+    Clave única de los pesos: método + coordenadas origen y destino.
+    """
+    sha = hashlib.sha1(metodo.encode())
+    for coords in (lat_src, lon_src, lat_dst, lon_dst):
+        sha.update(np.asarray(coords, dtype=float).tobytes())
+        sha.update(b'|')
+    return sha.hexdigest()[:20]
+
+
+def _construir_pesos(metodo, lat_src, lon_src, lat_dst, lon_dst):
+    """Matriz (nlat_dst·nlon_dst × nlat_src·nlon_src), filas en orden (lat, lon)."""
+    if metodo == 'bilineal':
+        W_lat = _pesos_lineales_1d(lat_src, lat_dst)
+        W_lon = _pesos_lineales_1d(lon_src, lon_dst)
+    else:
+        W_lat = _pesos_solapamiento_1d(lat_src, lat_dst, es_latitud=True)
+        W_lon = _pesos_solapamiento_1d(lon_src, lon_dst)
+    # kron conserva los pesos nulos explícitos (patrón de vecinos del bilineal)
+    return sparse.kron(W_lat, W_lon, format='csr')
+
+
+def obtener_regridder(lat_src, lon_src, lat_dst, lon_dst, metodo='bilineal',
+                      cache_dir=CACHE_DIR):
+    """
+    Devuelve (o construye y guarda) los pesos de regrillado.
+
+    Returns:
+        Diccionario con 'metodo', 'pesos' (CSR completa), 'activas' (celdas
+        destino con vecinos), 'activos' (filas de esas celdas), 'patron_activo'
+        (1 en cada vecino, para propagar NaN), 'lat' y 'lon' destino
+    """
+    if metodo not in METODOS:
+        raise ValueError(f"Método de regrillado desconocido: {metodo} (opciones: {METODOS})")
+
+    lat_src = np.asarray(lat_src, dtype=float)
+    lon_src = np.asarray(lon_src, dtype=float)
+    lat_dst = np.asarray(lat_dst, dtype=float)
+    lon_dst = np.asarray(lon_dst, dtype=float)
+    clave = _clave_regrid(metodo, lat_src, lon_src, lat_dst, lon_dst)
+
+    if clave in _regridders:
+        return _regridders[clave]
+
+    W = None
+    ruta_cache = os.path.join(cache_dir, f"regrid_{metodo}_{clave}.npz")
+    if os.path.exists(ruta_cache):
+        try:
+            W = sparse.load_npz(ruta_cache).tocsr()
+        except Exception as e:
+            print(f"  -> Advertencia: caché de regrillado inválida ({e}), recalculando")
+
+    if W is None:
+        W = _construir_pesos(metodo, lat_src, lon_src, lat_dst, lon_dst)
+        try:
+            os.makedirs(cache_dir, exist_ok=True)
+            guardar_atomico(ruta_cache, lambda tmp: sparse.save_npz(tmp, W))
+        except Exception as e:
+            print(f"  -> Advertencia: no se pudo guardar caché de regrillado: {e}")
+
+    # Celdas destino con al menos un vecino (las demás quedan en NaN)
+    activas = np.flatnonzero(np.diff(W.indptr) > 0)
+    activos = W[activas]
+    patron = activos.copy()
+    patron.data = np.ones_like(patron.data)
+    regridder = {
+        'metodo': metodo,
+        'pesos': W,
+        'activas': activas,
+        'activos': activos,
+        'patron_activo': patron,
+        'lat': lat_dst,
+        'lon': lon_dst,
+    }
+    _regridders[clave] = regridder
+    return regridder
+
+
+# ============================================================
+# APLICACIÓN
+# ============================================================
+
+def _mascara_nan(matriz, nan):
+    """
+    Celdas destino afectadas por NaN del origen: (n_dst,) si el patrón de NaN
+    es el mismo en todos los pasos (se calcula una vez), si no (n_dst, pasos).
+    """
+    if np.all(nan == nan[:1]):
+        return (matriz @ nan[0].astype(float)) > 0
+    return (matriz @ nan.T.astype(float)) > 0
+
+
+def aplicar_regridder(regridder, datos):
+    """
+    Regrilla un arreglo (pasos, n_src) y devuelve (pasos, n_dst).
+    Solo se calculan las celdas destino con vecinos en la grilla origen;
+    el resto queda en NaN.
+    """
+    W = regridder['activos']
+    activas = regridder['activas']
+    pasos = datos.shape[0]
+    salida = np.full((pasos, regridder['pesos'].shape[0]), np.nan)
+
+    for i in range(0, pasos, PASOS_BLOQUE):
+        X = np.asarray(datos[i:i + PASOS_BLOQUE], dtype=np.float64)
+        nan = np.isnan(X)
+        hay_nan = nan.any()
+        X0 = np.where(nan, 0.0, X) if hay_nan else X
+        bloque = W @ X0.T                      # (activas, pasos del bloque)
+
+        if hay_nan and regridder['metodo'] == 'bilineal':
+            mascara = _mascara_nan(regridder['patron_activo'], nan)
+            bloque[np.broadcast_to(mascara[:, None] if mascara.ndim == 1 else mascara,
+                                   bloque.shape)] = np.nan
+        elif hay_nan:
+            # Conservativo: renormalizar por el peso de las celdas válidas
+            validos = W @ (~nan).T.astype(float)
+            with np.errstate(invalid='ignore', divide='ignore'):
+                bloque = np.where(validos > 0, bloque / validos, np.nan)
+
+        salida[i:i + PASOS_BLOQUE, activas] = bloque.T
+    return salida
+
+
+def _regrid_campos(datos, regridder):
+    """Regrilla un arreglo (..., lat, lon) de la grilla origen a la destino."""
+    forma_otras = datos.shape[:-2]
+    salida = aplicar_regridder(regridder, datos.reshape(int(np.prod(forma_otras)), -1))
+    return salida.reshape(forma_otras + (len(regridder['lat']), len(regridder['lon'])))
+
+
+def regrid(da, lat, lon, metodo='bilineal', cache_dir=CACHE_DIR):
+    """
+    Regrilla un DataArray con dimensiones 'lat' y 'lon' a la grilla destino,
+    usando los pesos en caché. Equivale a da.interp(lat=lat, lon=lon) con
+    metodo='bilineal'. Si da está respaldado por dask el resultado también lo
+    está (se regrilla bloque a bloque de las demás dimensiones).
+    """
+    regridder = obtener_regridder(da['lat'].values, da['lon'].values, lat, lon,
+                                  metodo, cache_dir)
+    otras = [d for d in da.dims if d not in ('lat', 'lon')]
+    ordenado = da.transpose(*otras, 'lat', 'lon')
+
+    coords = {nombre: c for nombre, c in ordenado.coords.items()
+              if 'lat' not in c.dims and 'lon' not in c.dims and nombre not in ('lat', 'lon')}
+    coords['lat'] = regridder['lat']
+    coords['lon'] = regridder['lon']
+
+    if ordenado.chunks is not None:
+        # Cada bloque necesita la grilla origen completa
+        ordenado = ordenado.chunk({'lat': -1, 'lon': -1})
+        salida = dask_array.map_blocks(
+            _regrid_campos, ordenado.data, regridder, dtype=np.float64,
+            chunks=ordenado.data.chunks[:-2] + ((len(regridder['lat']),),
+                                                (len(regridder['lon']),)))
+    else:
+        salida = _regrid_campos(ordenado.values, regridder)
+
+    resultado = xr.DataArray(salida, dims=ordenado.dims, coords=coords,
+                             attrs=da.attrs, name=da.name)
+    return resultado.transpose(*da.dims)
@@ -0,0 +1,170 @@
+#!/usr/bin/env python
+# coding: utf-8
+"""
+aux_significancia.py - Archivos de p-values con sus coordenadas
+
+Los p-values de cada mapa (mod_significancia/ y ensamble/significancia/) se
+guardan como NetCDF3 clásico (motor scipy, sin compresión) con la grilla
+lat/lon del campo delta. Al ser NetCDF3 los datos están contiguos en el
+archivo y se abren con scipy.io.netcdf_file(mmap=True):
+
+    - una sola apertura devuelve un DataArray etiquetado, sin leer el delta
+      para obtener las coordenadas
+    - los valores son una vista de solo lectura del archivo mapeado (sin
+      copiar ni decodificar); las páginas se comparten entre procesos
+    - sin pickle: el formato es autodescriptivo
+
+Cada archivo trae además la lista de celdas significativas para los mapas:
+un arreglo float32 empaquetado (punto, [lon, lat, p]) con las celdas de
+p < max(UMBRALES), ordenado por p, y el número de puntos bajo cada umbral
+estándar. Los puntos de cualquier umbral son un prefijo de la lista, de modo
+que los gráficos los dibujan directamente, sin máscaras ni meshgrid, y el
+umbral se puede cambiar en el dashboard sin recalcular nada.
+"""
+
+import os
+
+import numpy as np
+import xarray as xr
+from scipy.io import netcdf_file
+
+from aux_paralelo import guardar_atomico
+
+EXTENSION = ".nc"
+VARIABLE = "pval"
+ATRIBUTOS = {'description': 'p-value prueba t de Welch (futuro vs base)'}
+# Umbrales estándar de significancia (el dashboard ofrece estos)
+UMBRALES = (0.01, 0.05, 0.10)
+COMPONENTES = ('lon', 'lat', 'pval')
+
+
+# ============================================================
+# ESCRITURA
+# ============================================================
+
+def lista_puntos(pvals):
+    """
+    Celdas significativas de un DataArray 2D (lat, lon) de p-values.
+
+    Returns:
+        (puntos float32 (n, 3) con lon, lat y p de las celdas con
+        p < max(UMBRALES), ordenados por p; número de puntos bajo cada umbral)
+    """
+    p = pvals.transpose('lat', 'lon').values
+    i_lat, i_lon = np.nonzero(p < max(UMBRALES))  # los NaN no pasan
+    valores = p[i_lat, i_lon]
+    orden = np.argsort(valores, kind='stable')
+    valores = valores[orden]
+    puntos = np.empty((len(orden), len(COMPONENTES)), dtype=np.float32)
+    puntos[:, 0] = pvals['lon'].values[i_lon[orden]]
+    puntos[:, 1] = pvals['lat'].values[i_lat[orden]]
+    puntos[:, 2] = valores
+    # Conteos con los p-values originales: el corte no depende del redondeo a float32
+    conteos = np.searchsorted(valores, UMBRALES, side='left').astype(np.int32)
+    return puntos, conteos
+
+
+def guardar_significancia(ruta, pvals, plantilla):
+    """
+    Guarda los p-values de un mapa con la grilla de plantilla.
+
+    Args:
+        ruta: Archivo de salida (.nc); se escribe de forma atómica
+        pvals: Arreglo 2D de p-values (misma forma que plantilla)
+        plantilla: DataArray 2D del que se toman dims y coordenadas (el delta)
+    """
+    dims = plantilla.dims
+    da = xr.DataArray(
+        np.asarray(pvals), dims=dims,
+        coords={d: plantilla[d].values for d in dims if d in plantilla.coords},
+        name=VARIABLE, attrs=ATRIBUTOS,
+    )
+    puntos, conteos = lista_puntos(da)
+    ds = da.to_dataset()
+    ds['puntos'] = (('punto', 'componente'), puntos,
+                    {'description': 'celdas significativas ordenadas por p',
+                     'componentes': ' '.join(COMPONENTES)})
+    ds['n_puntos'] = (('umbral',), conteos, {'description': 'puntos con p < umbral'})
+    ds = ds.assign_coords(umbral=np.array(UMBRALES))
+
+    # Sin _FillValue: los NaN se guardan tal cual y la lectura mapeada no
+    # necesita enmascarar
+    encoding = {nombre: {'_FillValue': None} for nombre in ds.variables}
+    guardar_atomico(ruta, lambda tmp: ds.to_netcdf(
+        tmp, engine='scipy', format='NETCDF3_64BIT', encoding=encoding))
+
+    # Versión anterior sin coordenadas (.npy con pickle)
+    anterior = os.path.splitext(ruta)[0] + ".npy"
+    if os.path.exists(anterior):
+        os.remove(anterior)
+
+
+# ============================================================
+# LECTURA
+# ============================================================
+
+def _abrir(ruta, leer):
+    """
+    Abre el archivo mapeado en memoria y devuelve leer(variables). Solo se
+    cierra el descriptor: el mapeo sigue vivo mientras existan arreglos que
+    lo usan (netcdf_file.close() lo impediría con un aviso).
+    """
+    f = netcdf_file(ruta, 'r', mmap=True)
+    try:
+        return leer(f.variables)
+    finally:
+        f.fp.close()
+
+
+def abrir_significancia(ruta):
+    """
+    Abre un archivo de p-values mapeado en memoria.
+
+    Returns:
+        DataArray (lat, lon) cuyos valores son una vista de solo lectura del
+        archivo; el mapeo se libera cuando ya no hay referencias al arreglo
+    """
+    def leer(variables):
+        var = variables[VARIABLE]
+        dims = var.dimensions
+        coords = {d: variables[d].data for d in dims if d in variables}
+        return xr.DataArray(var.data, dims=dims, coords=coords, name=VARIABLE,
+                            attrs=ATRIBUTOS)
+
+    return _abrir(ruta, leer)
+
+
+def abrir_puntos(ruta):
+    """
+    Abre la lista de celdas significativas de un archivo (mapeada en memoria).
+
+    Returns:
+        {'puntos': float32 (n, 3) lon/lat/p ordenado por p,
+         'conteos': {umbral: número de puntos con p < umbral}}
+        para pasar a filtrar_puntos()
+    """
+    def leer(variables):
+        conteos = variables['n_puntos'].data
+        return {'puntos': variables['puntos'].data,
+                'conteos': {float(u): int(n)
+                            for u, n in zip(variables['umbral'].data, conteos)}}
+
+    return _abrir(ruta, leer)
+
+
+def filtrar_puntos(lista, umbral=0.05):
+    """
+    Puntos con p < umbral de una lista de abrir_puntos() (vista, sin copiar).
+    Los umbrales estándar usan el conteo guardado; otros menores que
+    max(UMBRALES) se cortan sobre la columna p.
+
+    Returns:
+        float32 (n, 3): columnas lon, lat, p
+    """
+    puntos = lista['puntos']
+    n = lista['conteos'].get(float(umbral))
+    if n is None:
+        if umbral > max(UMBRALES):
+            raise ValueError(f"La lista solo tiene puntos con p < {max(UMBRALES)}")
+        n = int(np.searchsorted(puntos[:, 2], umbral, side='left'))
+    return puntos[:n]
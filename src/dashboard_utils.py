@@ -6,8 +6,23 @@ dashboard_utils.py - Funciones auxiliares para el dashboard
 """
 
 import os
-import glob
-from typing import List, Dict, Tuple, Set
+from typing import List, Dict, Tuple, Set, Optional
+
+from aux_catalogo import archivos_catalogados
+
+
+def _listar_archivos(ruta_base: str, extension: Optional[str] = None) -> List[str]:
+    """
+    Nombres de archivo de una carpeta: desde el catálogo en memoria
+    (data/catalogo.json, ver aux_catalogo.py) o, si no está, desde el disco.
+    """
+    nombres = archivos_catalogados(ruta_base, extension)
+    if nombres is not None:
+        return nombres
+    if not os.path.exists(ruta_base):
+        return []
+    return [f for f in os.listdir(ruta_base)
+            if extension is None or f.endswith(extension)]
 
 
 def obtener_lista_modelos(ruta_base: str = "data/modelos_agre") -> List[str]:
@@ -20,10 +35,7 @@ def obtener_lista_modelos(ruta_base: str = "data/modelos_agre") -> List[str]:
     Returns:
         Lista de nombres de modelos únicos y ordenados
     """
-    if not os.path.exists(ruta_base):
-        return []
-    
-    archivos = [f for f in os.listdir(ruta_base) if f.endswith('.nc')]
+    archivos = _listar_archivos(ruta_base, '.nc')
     modelos = set()
     
     for archivo in archivos:
@@ -44,10 +56,7 @@ def obtener_lista_var_agre(ruta_base: str = "data/modelos_agre") -> List[str]:
     Returns:
         Lista de combinaciones variable_agregacion
     """
-    if not os.path.exists(ruta_base):
-        return []
-    
-    archivos = [f for f in os.listdir(ruta_base) if f.endswith('.nc')]
+    archivos = _listar_archivos(ruta_base, '.nc')
     var_agre_set = set()
     
     for archivo in archivos:
@@ -77,7 +86,7 @@ def obtener_lista_year_ssp(
     
     # Buscar en modelos individuales
     if os.path.exists(ruta_cambios):
-        archivos = glob.glob(os.path.join(ruta_cambios, "*.nc"))
+        archivos = _listar_archivos(ruta_cambios, '.nc')
         
         for archivo in archivos:
             nombre = os.path.basename(archivo)
@@ -96,7 +105,7 @@ def obtener_lista_year_ssp(
     
     # Buscar en ensemble (si existe)
     if os.path.exists(ruta_ensemble):
-        archivos = glob.glob(os.path.join(ruta_ensemble, "*.nc"))
+        archivos = _listar_archivos(ruta_ensemble, '.nc')
         
         for archivo in archivos:
             nombre = os.path.basename(archivo)
@@ -126,10 +135,7 @@ def obtener_lista_escenarios(ruta_base: str = "data/modelos_agre") -> List[str]:
     Returns:
         Lista de escenarios únicos
     """
-    if not os.path.exists(ruta_base):
-        return []
-    
-    archivos = [f for f in os.listdir(ruta_base) if f.endswith('.nc')]
+    archivos = _listar_archivos(ruta_base, '.nc')
     escenarios = set()
     
     for archivo in archivos:
@@ -292,15 +298,15 @@ def verificar_datos_disponibles() -> Dict[str, bool]:
     """
     disponibilidad = {
         'modelos_individuales': os.path.exists("data/modelos_agre") and 
-                                len(os.listdir("data/modelos_agre")) > 0,
+                                len(_listar_archivos("data/modelos_agre")) > 0,
         'cambios_individuales': os.path.exists("data/mod_cambios") and 
-                                len(os.listdir("data/mod_cambios")) > 0,
+                                len(_listar_archivos("data/mod_cambios")) > 0,
         'ensamble_bruto': os.path.exists("data/ensamble/datos") and 
-                          len(os.listdir("data/ensamble/datos")) > 0,
+                          len(_listar_archivos("data/ensamble/datos")) > 0,
         'ensamble_cambios': os.path.exists("data/ensamble/cambios") and 
-                            len(os.listdir("data/ensamble/cambios")) > 0,
+                            len(_listar_archivos("data/ensamble/cambios")) > 0,
         'toe': os.path.exists("data/mod_toe") and 
-               len(os.listdir("data/mod_toe")) > 0
+               len(_listar_archivos("data/mod_toe")) > 0
     }
     
     return disponibilidad
@@ -1,47 +1,124 @@
 # src/data_loader_cambios.py - Versión adaptada para nueva estructura
 
 import os
-import numpy as np
 import xarray as xr
 
+from aux_cache_datos import cargar_con_cache
+from aux_significancia import (EXTENSION as EXT_SIGNIF, abrir_significancia, abrir_puntos,
+                               filtrar_puntos)
+
+# Almacén consolidado (un NetCDF4 por variable_agregación), ver aux_almacen.py
+ALMACEN_DIR = "data/mod_almacen"
+
+def _leer_corte_almacen(ruta, modelos, ssp, base, cy):
+    """
+    Lee del almacén el corte (modelos, ssp, base, centro) ya cargado en memoria,
+    o None si no contiene la combinación.
+    """
+    with xr.open_dataset(ruta) as ds:
+        if (ssp not in ds['ssp'].values or base not in ds['base'].values
+                or cy not in ds['center_year'].values):
+            return None
+        modelos = [m for m in modelos if m in ds['model'].values]
+        if not modelos:
+            return None
+        return ds.sel(model=modelos, ssp=ssp, base=base, center_year=cy).load()
+
+def _seleccionar_almacen(lista_modelos, var, agregacion, ssp, base, cy):
+    """
+    Lee del almacén consolidado el corte (modelos, ssp, base, centro) con una
+    sola lectura indexada (en caché, ver aux_cache_datos.py). Devuelve un
+    Dataset con dims (model, lat, lon) o None si el almacén no existe o no
+    contiene la combinación.
+    """
+    ruta = os.path.join(ALMACEN_DIR, f"cambios_{var}_{agregacion}.nc")
+    if not os.path.exists(ruta):
+        return None
+    try:
+        return cargar_con_cache(ruta, _leer_corte_almacen,
+                                tuple(lista_modelos), ssp, base, int(cy))
+    except Exception as e:
+        print(f"Error leyendo almacén {ruta}: {e}")
+        return None
+
+def _leer_delta(ruta, var):
+    """
+    Lee el campo delta de un archivo de cambios (cargado en memoria).
+    """
+    with xr.open_dataset(ruta) as ds:
+        # Buscar la variable delta (puede tener nombres diferentes)
+        var_key = f"delta_{var}"
+        if var_key in ds:
+            return ds[var_key].load()
+        # Si no está, tomar la primera variable del dataset
+        return list(ds.data_vars.values())[0].load()
+
+def _disponible_en_almacen(sel, mod):
+    """
+    Indica si el modelo tiene datos en el corte leído del almacén.
+    """
+    return (sel is not None and mod in sel['model'].values
+            and bool(sel['disponible'].sel(model=mod)))
+
 def cargar_cambios(lista_modelos, var, agregacion, ssp, base, cy):
     """
-    Carga los campos delta del directorio mod_cambios/
+    Carga los campos delta del almacén consolidado (data/mod_almacen/) o,
+    si no está disponible, del directorio mod_cambios/
     Nueva estructura: modelo_variable_agregacion_ssp_referencia_centro-XXX.nc
     """
+    sel = _seleccionar_almacen(lista_modelos, var, agregacion, ssp, base, cy)
     out = {}
     for mod in lista_modelos:
+        if _disponible_en_almacen(sel, mod):
+            out[mod] = sel['delta'].sel(model=mod).rename(f"delta_{var}")
+            continue
         ruta = f"data/mod_cambios/{mod}_{var}_{agregacion}_{ssp}_{base}_centro-{cy}.nc"
         if not os.path.exists(ruta):
             print(f"no existe {ruta}")
             continue
         try:
-            ds = xr.open_dataset(ruta)
-            # Buscar la variable delta (puede tener nombres diferentes)
-            var_key = f"delta_{var}"
-            if var_key in ds:
-                out[mod] = ds[var_key]
-            else:
-                # Si no está, tomar la primera variable del dataset
-                out[mod] = list(ds.data_vars.values())[0]
+            out[mod] = cargar_con_cache(ruta, _leer_delta, var)
         except Exception as e:
             print(f"Error cargando {ruta}: {e}")
     return out
 
 def cargar_significancia(lista_modelos, var, agregacion, ssp, base, cy):
     """
-    Carga los archivos npy con p-values del directorio mod_significancia/
-    Nueva estructura: modelo_variable_agregacion_ssp_referencia_centro-XXX.npy
+    Carga los p-values (DataArray lat, lon) del almacén consolidado
+    (data/mod_almacen/) o, si no está disponible, del directorio
+    mod_significancia/ (NetCDF3 mapeado en memoria, ver aux_significancia.py)
+    Nueva estructura: modelo_variable_agregacion_ssp_referencia_centro-XXX.nc
+    """
+    sel = _seleccionar_almacen(lista_modelos, var, agregacion, ssp, base, cy)
+    out = {}
+    for mod in lista_modelos:
+        if _disponible_en_almacen(sel, mod):
+            out[mod] = sel['pval'].sel(model=mod)
+            continue
+        ruta = f"data/mod_significancia/{mod}_{var}_{agregacion}_{ssp}_{base}_centro-{cy}{EXT_SIGNIF}"
+        if not os.path.exists(ruta):
+            print(f"no existe {ruta}")
+            continue
+        try:
+            out[mod] = cargar_con_cache(ruta, abrir_significancia)
+        except Exception as e:
+            print(f"Error cargando {ruta}: {e}")
+    return out
+
+def cargar_puntos_significancia(lista_modelos, var, agregacion, ssp, base, cy, umbral=0.05):
+    """
+    Carga las celdas con p < umbral de cada modelo desde las listas
+    precalculadas de mod_significancia/ (ver aux_significancia.py).
+    Devuelve {modelo: float32 (n, 3) con lon, lat, p}.
     """
     out = {}
     for mod in lista_modelos:
-        ruta = f"data/mod_significancia/{mod}_{var}_{agregacion}_{ssp}_{base}_centro-{cy}.npy"
+        ruta = f"data/mod_significancia/{mod}_{var}_{agregacion}_{ssp}_{base}_centro-{cy}{EXT_SIGNIF}"
         if not os.path.exists(ruta):
             print(f"no existe {ruta}")
             continue
         try:
-            pvals = np.load(ruta, allow_pickle=True)
-            out[mod] = pvals
+            out[mod] = filtrar_puntos(cargar_con_cache(ruta, abrir_puntos), umbral)
         except Exception as e:
             print(f"Error cargando {ruta}: {e}")
     return out
@@ -7,7 +7,38 @@ data_loader_promedio.py - Funciones para cargar datos de promedio/ensemble
 
 import os
 import xarray as xr
-import numpy as np
+
+from aux_cache_datos import cargar_con_cache
+from aux_significancia import (EXTENSION as EXT_SIGNIF, abrir_significancia, abrir_puntos,
+                               filtrar_puntos)
+
+def _leer_delta_ensemble(ruta, variable):
+    """
+    Lee el campo delta de un archivo de cambios del ensemble (en memoria).
+    """
+    with xr.open_dataset(ruta) as ds:
+        # La variable se llama delta_{variable}
+        var_name = f"delta_{variable}"
+        if var_name in ds:
+            return ds[var_name].load()
+        # Buscar cualquier variable que comience con 'delta'
+        for var in ds.data_vars:
+            if var.startswith('delta'):
+                return ds[var].load()
+        return None
+
+
+def _leer_toe(ruta, variable):
+    """
+    Lee el TOE de un archivo (en memoria).
+    TOE1 para temperatura es el TOE 1; para precipitación, el TOE -1.
+    """
+    with xr.open_dataset(ruta) as ds:
+        # Por nombre: el archivo trae además TOE_umbrales
+        if 'pr' in variable: ds_toe_var=ds['TOE_2']
+        else: ds_toe_var=ds['TOE_1']
+        return ds_toe_var.load()
+
 
 def cargar_cambios_ensemble(variable, agregacion, ssp, periodo_base, centro_year="2050"):
     """
@@ -41,17 +72,7 @@ def cargar_cambios_ensemble(variable, agregacion, ssp, periodo_base, centro_year
         return None
     
     try:
-        ds = xr.open_dataset(ruta_completa)
-        # La variable se llama delta_{variable}
-        var_name = f"delta_{variable}"
-        if var_name in ds:
-            return ds[var_name]
-        else:
-            # Buscar cualquier variable que comience con 'delta'
-            for var in ds.data_vars:
-                if var.startswith('delta'):
-                    return ds[var]
-            return None
+        return cargar_con_cache(ruta_completa, _leer_delta_ensemble, variable)
     except Exception as e:
         print(f"  -> Error cargando ensemble: {e}")
         return None
@@ -81,15 +102,7 @@ def cargar_toe(variable, agregacion):
         return None
     
     try:
-        ds = xr.open_dataset(ruta_completa)
-        # # Buscar variable TOE
-        # for var in ds.data_vars:
-        #     if 'toe' in var.lower() or 'emergence' in var.lower():
-        #         return ds[var]
-        # Si no encuentra, retorna la primera variable        
-        if 'pr' in variable: ds_toe_var=ds[list(ds.data_vars)[-1]]
-        else: ds_toe_var=ds[list(ds.data_vars)[0]]
-        return ds_toe_var #ds[list(ds.data_vars)[0]]
+        return cargar_con_cache(ruta_completa, _leer_toe, variable)
     except Exception as e:
         print(f"  -> Error cargando TOE: {e}")
         return None
@@ -118,60 +131,70 @@ def obtener_info_ensemble(variable):
     }
     return config.get(variable, {'cmap': 'viridis', 'units': '', 'label': ''})
 
-def cargar_significancia_ensemble(variable, agregacion, ssp, periodo_base, centro_year="2050"):
+def _ruta_significancia_ensemble(variable, agregacion, ssp, periodo_base, centro_year):
     """
-    Carga los p-values del ensemble para un escenario específico.
-    
-    Args:
-        variable: Variable climática (tasmin, tasmax, pr)
-        agregacion: Agregación temporal (ANUAL, DEF, MAM, etc.)
-        ssp: Escenario (ssp245, ssp585)
-        periodo_base: Periodo base (1981-2010 o 1991-2020)
-        centro_year: Año centro (2030, 2035, ..., 2050)
-    
-    Returns:
-        DataArray con los p-values del ensemble
+    Ruta del archivo de significancia del ensemble, o None si no existe.
     """
     ruta_base = "data/ensamble/significancia"
     
     # Construir nombre del archivo
-    nombre_archivo = f"ensemble_{variable}_{agregacion}_{ssp}_{periodo_base}_centro-{centro_year}.npy"
+    nombre_archivo = f"ensemble_{variable}_{agregacion}_{ssp}_{periodo_base}_centro-{centro_year}{EXT_SIGNIF}"
     ruta_completa = os.path.join(ruta_base, nombre_archivo)
     
     if not os.path.exists(ruta_completa):
         # Intentar con formato alternativo
         if "-" in periodo_base:
             periodo_base_alt = periodo_base.replace("-", "_")
-            nombre_archivo_alt = f"ensemble_{variable}_{agregacion}_{ssp}_{periodo_base_alt}_centro-{centro_year}.npy"
+            nombre_archivo_alt = f"ensemble_{variable}_{agregacion}_{ssp}_{periodo_base_alt}_centro-{centro_year}{EXT_SIGNIF}"
             ruta_completa = os.path.join(ruta_base, nombre_archivo_alt)
     
     if not os.path.exists(ruta_completa):
         print(f"  -> Archivo de significancia no encontrado: {nombre_archivo}")
         return None
+    return ruta_completa
+
+
+def cargar_significancia_ensemble(variable, agregacion, ssp, periodo_base, centro_year="2050"):
+    """
+    Carga los p-values del ensemble para un escenario específico.
+    
+    Args:
+        variable: Variable climática (tasmin, tasmax, pr)
+        agregacion: Agregación temporal (ANUAL, DEF, MAM, etc.)
+        ssp: Escenario (ssp245, ssp585)
+        periodo_base: Periodo base (1981-2010 o 1991-2020)
+        centro_year: Año centro (2030, 2035, ..., 2050)
+    
+    Returns:
+        DataArray con los p-values del ensemble
+    """
+    ruta_completa = _ruta_significancia_ensemble(variable, agregacion, ssp, periodo_base, centro_year)
+    if ruta_completa is None:
+        return None
     
     try:
-        # Cargar array numpy
-        pvals_array = np.load(ruta_completa, allow_pickle=True)
-        
-        # Necesitamos las coordenadas para crear un DataArray
-        # Cargamos un archivo de cambios para obtener las coordenadas
-        cambios_ref = cargar_cambios_ensemble(variable, agregacion, ssp, periodo_base, centro_year)
-        
-        if cambios_ref is not None:
-            # Crear DataArray con las mismas coordenadas
-            pvals_da = xr.DataArray(
-                pvals_array,
-                coords={
-                    'lat': cambios_ref.lat,
-                    'lon': cambios_ref.lon
-                },
-                dims=['lat', 'lon']
-            )
-            return pvals_da
-        else:
-            print(f"  -> No se pudieron obtener coordenadas para la significancia")
-            return None
-            
+        # El archivo trae sus coordenadas: una sola apertura, mapeada en memoria
+        return cargar_con_cache(ruta_completa, abrir_significancia)
     except Exception as e:
         print(f"  -> Error cargando significancia: {e}")
         return None
+
+
+def cargar_puntos_significancia_ensemble(variable, agregacion, ssp, periodo_base,
+                                         centro_year="2050", umbral=0.05):
+    """
+    Carga las celdas significativas (p < umbral) del ensemble desde la lista
+    precalculada (ver aux_significancia.py).
+    
+    Returns:
+        float32 (n, 3) con lon, lat y p, ordenado por p (o None)
+    """
+    ruta_completa = _ruta_significancia_ensemble(variable, agregacion, ssp, periodo_base, centro_year)
+    if ruta_completa is None:
+        return None
+    
+    try:
+        return filtrar_puntos(cargar_con_cache(ruta_completa, abrir_puntos), umbral)
+    except Exception as e:
+        print(f"  -> Error cargando puntos de significancia: {e}")
+        return None
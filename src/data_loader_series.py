@@ -4,30 +4,66 @@ import os
 import pandas as pd
 import numpy as np
 
+from aux_cache_datos import cargar_con_cache
+from aux_almacen_series import leer_departamento, leer_modelo, ruta_particion, ruta_serie
+
+def _leer_departamento(particion, departamento, modelos):
+    """
+    Lee la serie de un departamento (time × modelo) desde el almacén Parquet.
+    """
+    return leer_departamento(particion, departamento, list(modelos))
+
 def cargar_series_modelos(modelos, var, agregacion, ssp):
     """
-    Carga series temporales para múltiples modelos.
-    Nueva estructura: modelo_variable_agregacion_ssp.csv en data/procesados/
+    Carga series temporales completas (time × departamento) para múltiples modelos.
+    Estructura: data/series/variable=.../agregacion=.../ssp=.../{modelo}.parquet
+    Los archivos se leen a través de la caché compartida (aux_cache_datos.py).
     """
     series_dict = {}
-    base_dir = "data/procesados"
 
     for mod in modelos:
-        archivo = f"{mod}_{var}_{agregacion}_{ssp}.csv"
-        ruta = os.path.join(base_dir, archivo)
+        ruta = ruta_serie(mod, var, agregacion, ssp)
 
         if os.path.exists(ruta):
             try:
-                df = pd.read_csv(ruta, index_col=0, parse_dates=True)
-                series_dict[mod] = df
+                df = cargar_con_cache(ruta, leer_modelo)
+                if df is not None:
+                    series_dict[mod] = df
             except Exception as e:
-                print(f"Error cargando {archivo}: {e}")
+                print(f"Error cargando {ruta}: {e}")
                 continue
         else:
-            print(f"Archivo no encontrado: {archivo}")
+            print(f"Archivo no encontrado: {ruta}")
 
     return series_dict
 
+def cargar_serie_departamento(modelos, var, agregacion, ssp, departamento):
+    """
+    Serie temporal de un departamento para varios modelos, leyendo del almacén
+    solo el row group de ese departamento en cada modelo (no los archivos completos).
+    Mismo resultado que obtener_serie_departamento(cargar_series_modelos(...)).
+    """
+    particion = ruta_particion(var, agregacion, ssp)
+    if not os.path.isdir(particion):
+        print(f"Partición no encontrada: {particion}")
+        return None
+
+    try:
+        df = cargar_con_cache(particion, _leer_departamento, departamento, tuple(modelos))
+    except Exception as e:
+        print(f"Error cargando series de {departamento}: {e}")
+        return None
+
+    if df is None or df.empty:
+        return None
+
+    # Copia: el valor cacheado se comparte entre sesiones
+    df_combinado = df.copy()
+    if len(df_combinado.columns) > 1:
+        df_combinado['PROMEDIO'] = df_combinado.mean(axis=1)
+
+    return df_combinado
+
 def obtener_serie_departamento(series_dict, departamento):
     """
     Extrae serie temporal de un departamento específico.
@@ -1,18 +1,31 @@
 # src/graficos_cambios.py - Versión adaptada con subtitle
 import matplotlib.pyplot as plt
+import matplotlib.colors as mcolors
+from matplotlib.cm import ScalarMappable
+import matplotlib.ticker as mticker
 import numpy as np
 import math
-import geopandas as gpd
+
+from aux_geometria import agregar_contorno_mpl
+from aux_grilla import bordes_celdas
 
 shapefile_path = 'data/geo/peru32.geojson'
 
-def generar_mapa_multimodelo(dict_cambios, dict_pvals, vmin_global, vmax_global, var,
-                             agregacion=None, sel_base=None, ssp=None, centro=None):
+def generar_mapa_multimodelo(dict_cambios, dict_puntos, vmin_global, vmax_global, var,
+                             agregacion=None, sel_base=None, ssp=None, centro=None,
+                             rapido=True):
     """
     Genera mapas alineados en filas de 4 con barra global.
-    La significancia se marca con 'x' en el centro de cada celda.
+    La significancia se marca con 'x' en el centro de cada celda; dict_puntos
+    trae por modelo las celdas significativas ya filtradas, float32 (n, 3)
+    con lon, lat y p (ver cargar_puntos_significancia).
     Los rangos y colormap dependen de la variable.
     
+    rapido: los deltas de todos los modelos se cuantizan juntos contra los
+    niveles y cada panel es una sola imagen (imshow) con la paleta discreta
+    compartida; mismo aspecto que da.plot(levels=...), que queda con
+    rapido=False.
+    
     Parámetros adicionales para subtitle:
     - agregacion: tipo de agregación temporal (ej: "anual", "DJF", "MAM")
     - sel_base: periodo base (ej: "1981-2010")
@@ -41,22 +54,32 @@ def generar_mapa_multimodelo(dict_cambios, dict_pvals, vmin_global, vmax_global,
     axes_flat = axes.flatten()
     im = None
 
+    if rapido and n > 0:
+        # Paleta discreta y colores de todos los paneles, calculados una vez
+        cmap_d, norm = _paleta_discreta(cmap, levels)
+        campos, colores = _cuantizar(dict_cambios, modelos, norm, cmap_d)
+        im = ScalarMappable(norm=norm, cmap=cmap_d)
+
     for i, mod in enumerate(modelos):
         ax = axes_flat[i]
         da = dict_cambios[mod]
 
         # mapa de cambios
-        im = da.plot(
-            ax=ax,
-            cmap=cmap,
-            vmin=vmin_global,
-            vmax=vmax_global,
-            levels=levels,
-            add_colorbar=False,
-            extend='both',
-        )
+        if rapido:
+            _dibujar_panel(ax, campos[i], colores[i], cmap_d, norm)
+        else:
+            im = da.plot(
+                ax=ax,
+                cmap=cmap,
+                vmin=vmin_global,
+                vmax=vmax_global,
+                levels=levels,
+                add_colorbar=False,
+                extend='both',
+            )
 
-        ax.set_title(mod.upper())
+        # Con y fija matplotlib no recalcula la posición del título en cada dibujo
+        ax.set_title(mod.upper(), **({'y': 1.0} if rapido else {}))
         #
         _agregar_shapefile(ax, fig, shapefile_path)
         # DEJA SIN NOMBRE EJES
@@ -64,22 +87,13 @@ def generar_mapa_multimodelo(dict_cambios, dict_pvals, vmin_global, vmax_global,
         ax.set_xlabel('')
 
         # marcadores de significancia
-        if dict_pvals is not None and mod in dict_pvals:
-            pvals = dict_pvals[mod]
-
-            mask = (pvals < 0.05)
-
-            if np.any(mask):
-                lats = da["lat"].values
-                lons = da["lon"].values
-                Lon, Lat = np.meshgrid(lons, lats)
-
-                x_sig = Lon[mask]
-                y_sig = Lat[mask]
+        if dict_puntos is not None and mod in dict_puntos:
+            puntos = dict_puntos[mod]
 
+            if len(puntos) > 0:
                 ax.scatter(
-                    x_sig,
-                    y_sig,
+                    puntos[:, 0],
+                    puntos[:, 1],
                     marker="x", ## TIPO DE MARKADOR
                     s=12,
                     linewidths=0.3,
@@ -107,9 +121,85 @@ def generar_mapa_multimodelo(dict_cambios, dict_pvals, vmin_global, vmax_global,
             wspace=0.25,
             hspace=0.25
             )
+
+    if rapido:
+        _compartir_marcas(axes_flat[:n])
     return fig
 
 
+def _paleta_discreta(cmap, levels):
+    """
+    Colormap discreto y BoundaryNorm iguales a los que arma xarray para
+    da.plot(levels=levels, extend='both').
+    """
+    pal = plt.get_cmap(cmap)(np.linspace(0, 1.0, len(levels) + 1))
+    return mcolors.from_levels_and_colors(levels, pal, extend='both')
+
+
+def _cuantizar(dict_cambios, modelos, norm, cmap_d):
+    """
+    Colores RGBA (uint8) de los mapas de todos los modelos: los deltas con la
+    misma grilla se apilan y se cuantizan contra los niveles en una sola
+    operación.
+
+    Returns:
+        (campos (lat, lon) de cada modelo, arreglo RGBA de cada modelo)
+    """
+    campos = [dict_cambios[mod].transpose('lat', 'lon') for mod in modelos]
+    grupos = {}
+    for i, da in enumerate(campos):
+        clave = (da['lat'].values.tobytes(), da['lon'].values.tobytes())
+        grupos.setdefault(clave, []).append(i)
+
+    colores = [None] * len(campos)
+    for indices in grupos.values():
+        pila = np.ma.masked_invalid(np.stack([campos[i].values for i in indices]))
+        rgba = cmap_d(norm(pila), bytes=True)
+        for k, i in enumerate(indices):
+            colores[i] = rgba[k]
+    return campos, colores
+
+
+def _dibujar_panel(ax, da, rgba, cmap_d, norm):
+    """
+    Dibuja un mapa ya cuantizado: una imagen si la grilla es regular, o
+    pcolormesh con la paleta discreta si no lo es.
+    """
+    x = bordes_celdas(da['lon'].values)
+    y = bordes_celdas(da['lat'].values)
+    ax.grid(False)
+    if np.allclose(np.diff(x), x[1] - x[0]) and np.allclose(np.diff(y), y[1] - y[0]):
+        # La fila 0 va en y[0], sea la latitud creciente o decreciente
+        ax.imshow(rgba, extent=(x[0], x[-1], y[0], y[-1]), origin='lower',
+                  interpolation='nearest', aspect='auto')
+    else:
+        ax.pcolormesh(x, y, np.ma.masked_invalid(da.values), cmap=cmap_d, norm=norm)
+    # Límites en los bordes de la grilla y ejes crecientes, como xarray
+    ax.set_xlim(min(x[0], x[-1]), max(x[0], x[-1]))
+    ax.set_ylim(min(y[0], y[-1]), max(y[0], y[-1]))
+
+
+def _compartir_marcas(paneles):
+    """
+    Calcula las marcas de los ejes en el primer panel de cada grilla (con su
+    posición y aspecto finales) y las fija en los demás paneles con los
+    mismos límites; así los localizadores y formateadores corren una vez por
+    grilla y no una vez por panel al guardar. Las marcas son las mismas que
+    pondría matplotlib.
+    """
+    fijas = {}
+    for ax in paneles:
+        clave = (ax.get_xlim(), ax.get_ylim())
+        if clave not in fijas:
+            ax.apply_aspect()
+            fijas[clave] = [(eje.get_majorticklocs(),
+                             eje.major.formatter.format_ticks(eje.get_majorticklocs()))
+                            for eje in (ax.xaxis, ax.yaxis)]
+        for eje, (locs, etiquetas) in zip((ax.xaxis, ax.yaxis), fijas[clave]):
+            eje.set_major_locator(mticker.FixedLocator(locs))
+            eje.set_major_formatter(mticker.FixedFormatter(etiquetas))
+
+
 def _agregar_subtitle(fig, agregacion, sel_base, ssp, centro, var ,n):
     """
     Agrega un subtitle con información de la configuración del análisis.
@@ -210,31 +300,20 @@ def _agregar_barra_d(fig, im, last_ax, rows ,var='pr'):
 def _agregar_shapefile(ax, fig, geojson_path, edgecolor='black', facecolor='none', linewidth=1, alpha=0.5):
     """
     Agrega un shapefile (.geojson) encima del plot.
+    La geometría se lee una sola vez por proceso (ver aux_geometria.py).
     """
     try:
-        # Cargar el shapefile
-        gdf = gpd.read_file(geojson_path)
-
-        # Verificar que tenga sistema de coordenadas
-        if gdf.crs is None:
-            print(f"Advertencia: Shapefile {geojson_path} no tiene CRS definido")
-            # Asumir WGS84 si no tiene CRS
-            gdf = gdf.set_crs('EPSG:4326')
-
-        # Plotear el shapefile encima
-        gdf.plot(
-            ax=ax,
+        return agregar_contorno_mpl(
+            ax, geojson_path,
             edgecolor=edgecolor,
             facecolor=facecolor,
             linewidth=linewidth,
             alpha=alpha
         )
 
-        return gdf
-
     except FileNotFoundError:
         print(f"Error: No se encontró el archivo {geojson_path}")
         return None
     except Exception as e:
         print(f"Error al cargar shapefile: {e}")
-        return None
\ No newline at end of file
+        return None
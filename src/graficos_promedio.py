@@ -9,89 +9,47 @@ y significancia como puntos scatter.
 import plotly.graph_objects as go
 from plotly.subplots import make_subplots
 import numpy as np
-import geopandas as gpd
 import xarray as xr
 
 from data_loader_promedio import (
     cargar_cambios_ensemble,
-    cargar_significancia_ensemble,
+    cargar_puntos_significancia_ensemble,
     cargar_toe,
     obtener_info_ensemble
 )
+from aux_geometria import traza_contorno_plotly
 
 def agregar_contorno_peru(fig, row, col):
     """
-    Agrega el contorno de Perú desde un archivo GeoJSON.
+    Agrega el contorno de Perú desde un archivo GeoJSON
+    (una sola traza, geometría en memoria; ver aux_geometria.py).
     """
     try:
-        peru_gdf = gpd.read_file("data/geo/peru32.geojson")
-        
-        for geometry in peru_gdf.geometry:
-            if geometry.geom_type == 'Polygon':
-                x, y = geometry.exterior.xy
-                fig.add_trace(
-                    go.Scatter(
-                        x=list(x),
-                        y=list(y),
-                        mode='lines',
-                        line=dict(color='black', width=1.5),
-                        showlegend=False,
-                        hoverinfo='skip'
-                    ),
-                    row=row, col=col
-                )
-            elif geometry.geom_type == 'MultiPolygon':
-                for polygon in geometry:
-                    x, y = polygon.exterior.xy
-                    fig.add_trace(
-                        go.Scatter(
-                            x=list(x),
-                            y=list(y),
-                            mode='lines',
-                            line=dict(color='black', width=1.5),
-                            showlegend=False,
-                            hoverinfo='skip'
-                        ),
-                        row=row, col=col
-                    )
+        fig.add_trace(traza_contorno_plotly("data/geo/peru32.geojson"), row=row, col=col)
     except Exception as e:
         print(f"  -> Error cargando GeoJSON: {e}")
 
-def agregar_puntos_significancia(fig, pvals_data, cambios_data, row, col, umbral=0.05):
+def agregar_puntos_significancia(fig, puntos, row, col, umbral=0.05):
     """
     Agrega puntos de significancia (p < umbral) como scatter.
     
     Args:
         fig: Figura de Plotly
-        pvals_data: DataArray con valores p
-        cambios_data: DataArray con cambios (para coordenadas)
+        puntos: Celdas significativas precalculadas, float32 (n, 3) con
+            lon, lat y p (ver aux_significancia.py)
         row: Fila del subplot
         col: Columna del subplot
-        umbral: Umbral de significancia (default: 0.05)
+        umbral: Umbral con el que se filtraron los puntos (para la leyenda)
     """
-    if pvals_data is None or cambios_data is None:
+    if puntos is None:
         return
     
     try:
-        # Obtener coordenadas
-        lon = cambios_data.lon.values
-        lat = cambios_data.lat.values
-        
-        # Crear máscara para p < umbral
-        mask_significativo = pvals_data < umbral
-        
-        # Obtener índices de puntos significativos
-        idx_significativos = np.where(mask_significativo)
-        
-        if len(idx_significativos[0]) > 0:
-            # Obtener coordenadas de puntos significativos
-            lon_significativos = lon[idx_significativos[1]]
-            lat_significativos = lat[idx_significativos[0]]
-            
+        if len(puntos) > 0:
             # Agregar scatter plot con puntos negros pequeños
             scatter = go.Scatter(
-                x=lon_significativos,
-                y=lat_significativos,
+                x=puntos[:, 0].astype(float),
+                y=puntos[:, 1].astype(float),
                 mode='markers',
                 marker=dict(
                     color='black',
@@ -99,7 +57,7 @@ def agregar_puntos_significancia(fig, pvals_data, cambios_data, row, col, umbral
                     symbol='circle',
                     opacity=0.7
                 ),
-                name='Significancia: [ p < 0.05 ]',
+                name=f'Significancia: [ p < {umbral:g} ]',
                 showlegend=(row == 1 and col == 1),  # Mostrar leyenda solo en el primer mapa
                 hoverinfo='skip'
             )
@@ -109,7 +67,7 @@ def agregar_puntos_significancia(fig, pvals_data, cambios_data, row, col, umbral
     except Exception as e:
         print(f"  -> Error agregando puntos de significancia: {e}")
 
-def generar_mapa_promedio(variable, agregacion, periodo_base, centro_year="2050"):
+def generar_mapa_promedio(variable, agregacion, periodo_base, centro_year="2050", umbral=0.05):
     """
     Genera un gráfico con 3 mapas: SSP245, SSP585 y TOE.
     
@@ -118,6 +76,7 @@ def generar_mapa_promedio(variable, agregacion, periodo_base, centro_year="2050"
         agregacion: Agregación temporal
         periodo_base: Periodo base
         centro_year: Año centro para cambios
+        umbral: Umbral de significancia de los puntos (0.01, 0.05 o 0.10)
     
     Returns:
         Plotly Figure con 3 subplots
@@ -127,9 +86,11 @@ def generar_mapa_promedio(variable, agregacion, periodo_base, centro_year="2050"
     cambios_585 = cargar_cambios_ensemble(variable, agregacion, "ssp585", periodo_base, centro_year)
     toe_data = cargar_toe(variable, agregacion)
     
-    # Cargar significancia
-    pvals_245 = cargar_significancia_ensemble(variable, agregacion, "ssp245", periodo_base, centro_year)
-    pvals_585 = cargar_significancia_ensemble(variable, agregacion, "ssp585", periodo_base, centro_year)
+    # Cargar celdas significativas (listas precalculadas)
+    puntos_245 = cargar_puntos_significancia_ensemble(variable, agregacion, "ssp245",
+                                                      periodo_base, centro_year, umbral)
+    puntos_585 = cargar_puntos_significancia_ensemble(variable, agregacion, "ssp585",
+                                                      periodo_base, centro_year, umbral)
     
     # Configuración de colores
     config = obtener_info_ensemble(variable)
@@ -215,7 +176,7 @@ def generar_mapa_promedio(variable, agregacion, periodo_base, centro_year="2050"
         fig.add_trace(heatmap_245, row=1, col=1)
         
         # Agregar puntos de significancia
-        agregar_puntos_significancia(fig, pvals_245, cambios_245, 1, 1)
+        agregar_puntos_significancia(fig, puntos_245, 1, 1, umbral)
         
         # Agregar contorno de Perú
         agregar_contorno_peru(fig, 1, 1)
@@ -254,7 +215,7 @@ def generar_mapa_promedio(variable, agregacion, periodo_base, centro_year="2050"
         fig.add_trace(heatmap_585, row=1, col=2)
         
         # Agregar puntos de significancia
-        agregar_puntos_significancia(fig, pvals_585, cambios_585, 1, 2)
+        agregar_puntos_significancia(fig, puntos_585, 1, 2, umbral)
         
         # Agregar contorno de Perú
         agregar_contorno_peru(fig, 1, 2)
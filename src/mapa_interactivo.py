@@ -1,17 +1,18 @@
 # src/mapa_interactivo.py - Versión adaptada (sin cambios en parámetros)
 
-import geopandas as gpd
 import plotly.express as px
 
+from aux_geometria import obtener_geometria
+
 def crear_mapa_departamentos(geojson_path, departamento_seleccionado=None):
     """
     Crea dos mapas:
     1. Mapa fijo de Sudamérica (Perú completo) - MÁS ZOOM OUT
     2. Mapa con zoom al departamento seleccionado (±1.5 grado) - DEPARTAMENTO EN NEGRO
     """
-    # Cargar y preparar datos
-    gdf = gpd.read_file(geojson_path)
-    gdf = gdf.to_crs(epsg=4326)
+    # Cargar y preparar datos (geometría en memoria, copia del GeoDataFrame)
+    geo = obtener_geometria(geojson_path)
+    gdf = geo['gdf'].copy()
 
     # Crear columna para color: 0=gris, 1=negro (para departamento seleccionado)
     gdf['color_value'] = 0  # Todos grises por defecto
@@ -28,7 +29,7 @@ def crear_mapa_departamentos(geojson_path, departamento_seleccionado=None):
     # 1. MAPA GENERAL - Perú en Sudamérica (MÁS ZOOM OUT)
     fig_general = px.choropleth_mapbox(
         gdf,
-        geojson=gdf.geometry.__geo_interface__,
+        geojson=geo['geo_interface'],
         locations=gdf.index,
         color='color_value',
         color_continuous_scale=escala_colores,
@@ -60,7 +61,7 @@ def crear_mapa_departamentos(geojson_path, departamento_seleccionado=None):
     # 2. MAPA CON ZOOM - Departamento seleccionado en NEGRO
     fig_zoom = px.choropleth_mapbox(
         gdf,
-        geojson=gdf.geometry.__geo_interface__,
+        geojson=geo['geo_interface'],
         locations=gdf.index,
         color='color_value',
         color_continuous_scale=escala_colores,